@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# nlhtree_py/bench/bench_binary.py
+
+"""
+Compare loading and saving NLHTrees in the text and binary listing
+formats.
+
+Run from the project directory:
+
+    PYTHONPATH=src python3 bench/bench_binary.py [-n LINES] [-w N]
+
+A synthetic listing of about LINES lines is built: a root holding
+directories which each hold N files.  Text listings are loaded with
+NLHTree.parse and saved with __str__; binary listings with from_binary
+and to_binary.
+"""
+
+import hashlib
+import time
+from argparse import ArgumentParser
+
+from xlattice import HashTypes
+from nlhtree import NLHTree
+
+
+def make_listing(count, width):
+    """ Return a serialized NLHTree with about count lines. """
+    lines = ['dataDir']
+    ndx = 0
+    dir_nbr = 0
+    while len(lines) < count:
+        lines.append(' dir%08d' % dir_nbr)
+        for file_nbr in range(width):
+            hex_hash = hashlib.sha256(b'%d' % ndx).hexdigest()
+            lines.append('  file%08d %s' % (file_nbr, hex_hash))
+            ndx += 1
+        dir_nbr += 1
+    return '\n'.join(lines) + '\n', len(lines)
+
+
+def timed(func, *args):
+    """ Return the result of calling func and the seconds it took. """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    """ Time loading and saving in both listing formats. """
+
+    parser = ArgumentParser(description='time text and binary listings')
+    parser.add_argument('-n', '--lines', type=int, default=1000000,
+                        help='lines in the listing (default 1000000)')
+    parser.add_argument('-w', '--width', type=int, default=100,
+                        help='files per directory (default 100)')
+    args = parser.parse_args()
+
+    string, nbr_lines = make_listing(args.lines, args.width)
+    tree, parse_secs = timed(NLHTree.parse, string, HashTypes.SHA2)
+    _, str_secs = timed(tree.__str__)
+    data, to_bin_secs = timed(tree.to_binary)
+    copy, from_bin_secs = timed(NLHTree.from_binary, data)
+    assert copy == tree
+
+    print("%d lines; text %d bytes, binary %d bytes" % (
+        nbr_lines, len(string), len(data)))
+    print("%-8s %10s %10s" % ('format', 'load', 'save'))
+    print("%-8s %10.3f %10.3f" % ('text', parse_secs, str_secs))
+    print("%-8s %10.3f %10.3f" % ('binary', from_bin_secs, to_bin_secs))
+
+
+if __name__ == '__main__':
+    main()
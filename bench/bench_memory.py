@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# nlhtree_py/bench/bench_memory.py
+
+"""
+Measure the memory an NLHTree needs per leaf, using tracemalloc.
+
+Run from the project directory:
+
+    PYTHONPATH=src python3 bench/bench_memory.py [-c] [-n LEAVES] [-w N]
+
+A tree of LEAVES leaves is built, a root holding directories which
+each hold N leaves.  The names and binary hashes are made before
+tracing starts and shared with the tree, so what is reported is the
+cost of the nodes themselves; the bytes per leaf including the names
+and hashes are reported as well.
+
+With -c, an NLHColumnarTree is built instead, from the lines of the
+listing.  It copies the names and hashes into its own buffers, so only
+the second figure applies.
+"""
+
+import hashlib
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+
+from xlattice import HashTypes
+from nlhtree import NLHTree, NLHLeaf
+from nlhtree.columnar import NLHColumnarTree
+
+
+def listing_lines(names, hashes, width):
+    """ Yield the lines of the listing for the tree built by main(). """
+    yield 'dataDir'
+    for ndx, hash_ in enumerate(hashes):
+        if ndx % width == 0:
+            yield ' dir%08d' % (ndx // width)
+        yield '  %s %s' % (names[ndx % width], hash_.hex())
+
+
+def main():
+    """ Report the memory used by an NLHTree per leaf. """
+
+    parser = ArgumentParser(description='measure NLHTree memory use')
+    parser.add_argument('-c', '--columnar', action='store_true',
+                        help='measure an NLHColumnarTree instead')
+    parser.add_argument('-n', '--leaves', type=int, default=1000000,
+                        help='number of leaves (default 1000000)')
+    parser.add_argument('-w', '--width', type=int, default=100,
+                        help='leaves per directory (default 100)')
+    args = parser.parse_args()
+
+    hashtype = HashTypes.SHA2
+    names = ['file%08d' % ndx for ndx in range(args.width)]
+    hashes = [hashlib.sha256(b'%d' % ndx).digest()
+              for ndx in range(args.leaves)]
+    extra = sum(sys.getsizeof(hash_) for hash_ in hashes) + \
+        sum(sys.getsizeof(name) for name in names) * \
+        (args.leaves // args.width)
+
+    if args.columnar:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tree = NLHColumnarTree.create_from_string_array(
+            listing_lines(names, hashes, args.width), hashtype)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        print("%d leaves, columnar" % args.leaves)
+        print("with names, hashes:   %8.1f bytes per leaf" % (
+            used / args.leaves))
+        return
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = NLHTree('dataDir', hashtype)
+    ndx = 0
+    dir_nbr = 0
+    while ndx < args.leaves:
+        sub_tree = NLHTree('dir%08d' % dir_nbr, hashtype)
+        for name in names:
+            if ndx >= args.leaves:
+                break
+            sub_tree.insert(NLHLeaf(name, hashes[ndx], hashtype))
+            ndx += 1
+        tree.insert(sub_tree)
+        dir_nbr += 1
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    print("%d leaves in %d directories" % (args.leaves, dir_nbr))
+    print("nodes only:           %8.1f bytes per leaf" % (
+        used / args.leaves))
+    print("with names, hashes:   %8.1f bytes per leaf" % (
+        (used + extra) / args.leaves))
+    assert tree is not None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# nlhtree_py/bench/bench_parse.py
+
+"""
+Time NLHTree.parse on synthetic listings of increasing size.
+
+Run from the project directory:
+
+    PYTHONPATH=src python3 bench/bench_parse.py [-n LINES] [-s STEPS] [-w N]
+
+Each step doubles the number of lines in the listing.  If parsing is
+linear, the time per line stays (roughly) constant from step to step.
+Use a large width (-w) to see the effect of very wide directories.
+"""
+
+import hashlib
+import sys
+import time
+from argparse import ArgumentParser
+
+from xlattice import HashTypes
+from nlhtree import NLHTree
+
+
+def make_listing(count, width):
+    """
+    Return a serialized NLHTree with about count lines: a root holding
+    directories which each hold width files.
+    """
+    lines = ['dataDir']
+    ndx = 0
+    dir_nbr = 0
+    while len(lines) < count:
+        lines.append(' dir%08d' % dir_nbr)
+        for file_nbr in range(width):
+            hex_hash = hashlib.sha256(b'%d' % ndx).hexdigest()
+            lines.append('  file%08d %s' % (file_nbr, hex_hash))
+            ndx += 1
+        dir_nbr += 1
+    return '\n'.join(lines) + '\n', len(lines)
+
+
+def main():
+    """ Time NLHTree.parse on synthetic listings of increasing size. """
+
+    parser = ArgumentParser(description='time NLHTree.parse')
+    parser.add_argument('-n', '--lines', type=int, default=100000,
+                        help='lines in the smallest listing (default 100000)')
+    parser.add_argument('-s', '--steps', type=int, default=4,
+                        help='number of doublings (default 4)')
+    parser.add_argument('-w', '--width', type=int, default=100,
+                        help='files per directory (default 100)')
+    args = parser.parse_args()
+
+    print("%12s %10s %12s" % ('lines', 'seconds', 'ns/line'))
+    count = args.lines
+    for _ in range(args.steps):
+        string, nbr_lines = make_listing(count, args.width)
+        start = time.perf_counter()
+        tree = NLHTree.parse(string, HashTypes.SHA2)
+        elapsed = time.perf_counter() - start
+        assert tree is not None
+        print("%12d %10.3f %12.1f" % (
+            nbr_lines, elapsed, elapsed * 1e9 / nbr_lines))
+        sys.stdout.flush()
+        count *= 2
+
+
+if __name__ == '__main__':
+    main()
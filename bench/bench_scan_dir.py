@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# nlhtree_py/bench/bench_scan_dir.py
+
+"""
+Compare the os.scandir-based directory walk used by
+NLHTree.create_from_file_system with the os.listdir/os.lstat/isfile
+walk it replaced.  No files are hashed: this measures the walk alone.
+
+Run from the project directory:
+
+    PYTHONPATH=src python3 bench/bench_scan_dir.py [-n FILES] [-w WIDTH]
+
+A directory tree of about FILES empty files is created under tmp/
+unless it is already present.  Besides elapsed time, the number of
+stat-family calls made through the os module is reported; calls made
+inside os.scandir() itself are not visible to Python, but they are
+limited to symbolic links.
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+from stat import S_ISDIR
+
+from nlhtree import NLHTree
+
+
+def make_tree(path_to_dir, count, width):
+    """ Create about count empty files in directories of width files. """
+
+    if os.path.exists(path_to_dir):
+        return
+    made = 0
+    dir_nbr = 0
+    while made < count:
+        sub_dir = os.path.join(path_to_dir, 'dir%06d' % dir_nbr)
+        os.makedirs(sub_dir)
+        for file_nbr in range(width):
+            with open(os.path.join(sub_dir, 'file%06d' % file_nbr), 'w'):
+                pass
+        made += width
+        dir_nbr += 1
+
+
+def old_scan_dir(path_to_dir):
+    """ The walk as it was: listdir, then lstat and isfile per entry. """
+
+    entries = []
+    for file in sorted(os.listdir(path_to_dir)):
+        path_to_file = os.path.join(path_to_dir, file)
+        mode = os.lstat(path_to_file).st_mode
+        if S_ISDIR(mode):
+            entries.append((file, old_scan_dir(path_to_file)))
+        elif os.path.isfile(path_to_file):
+            entries.append((file, path_to_file))
+    return entries
+
+
+class StatCounter(object):
+    """ Count calls to os.stat and os.lstat while active. """
+
+    def __init__(self):
+        self.count = 0
+        self._stat = os.stat
+        self._lstat = os.lstat
+
+    def __enter__(self):
+        def stat(*args, **kwargs):
+            self.count += 1
+            return self._stat(*args, **kwargs)
+
+        def lstat(*args, **kwargs):
+            self.count += 1
+            return self._lstat(*args, **kwargs)
+        os.stat = stat
+        os.lstat = lstat
+        return self
+
+    def __exit__(self, *exc):
+        os.stat = self._stat
+        os.lstat = self._lstat
+
+
+def main():
+    """ Time both directory walks. """
+
+    parser = ArgumentParser(description='time directory walks')
+    parser.add_argument('-n', '--files', type=int, default=100000,
+                        help='number of files (default 100000)')
+    parser.add_argument('-w', '--width', type=int, default=1000,
+                        help='files per directory (default 1000)')
+    args = parser.parse_args()
+
+    path_to_dir = os.path.join(
+        'tmp', 'bench_scan_dir_%d_%d' % (args.files, args.width))
+    make_tree(path_to_dir, args.files, args.width)
+
+    print("%-10s %10s %12s" % ('walk', 'seconds', 'stat calls'))
+    for label, scan in [('listdir', old_scan_dir),
+                        ('scandir', NLHTree._scan_dir)]:
+        with StatCounter() as counter:
+            start = time.perf_counter()
+            scan(path_to_dir)
+            elapsed = time.perf_counter() - start
+        print("%-10s %10.3f %12d" % (label, elapsed, counter.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# nlhtree_py/bench/bench_walk.py
+
+"""
+Time NLHTree.walk_file over a synthetic listing, against the walk it
+replaced, which read a line at a time and tried a directory pattern and
+then a file pattern on each line.
+
+Run from the project directory:
+
+    PYTHONPATH=src python3 bench/bench_walk.py [-n LINES] [-w N]
+
+The listing is written to a temporary file first.  -n 10000000 gives
+a listing of about 800 MB.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from xlattice import HashTypes
+from nlhtree import NLHTree
+
+
+def write_listing(path_to_file, count, width):
+    """
+    Write a serialized NLHTree with about count lines: a root holding
+    directories which each hold width files.  Return the number of
+    lines written.
+    """
+    nbr_lines = 1
+    dir_nbr = 0
+    ndx = 0
+    with open(path_to_file, 'w') as file:
+        file.write('dataDir\n')
+        while nbr_lines < count:
+            lines = [' dir%08d' % dir_nbr]
+            for file_nbr in range(width):
+                hex_hash = hashlib.sha256(b'%d' % ndx).hexdigest()
+                lines.append('  file%08d %s' % (file_nbr, hex_hash))
+                ndx += 1
+            file.write('\n'.join(lines) + '\n')
+            nbr_lines += len(lines)
+            dir_nbr += 1
+    return nbr_lines
+
+
+def old_walk_file(path_to_file, hashtype):
+    """ The walk as it was: a line at a time, two patterns per line. """
+
+    if hashtype == HashTypes.SHA1:
+        file_line_re = NLHTree.FILE_LINE_RE_1
+    else:
+        file_line_re = NLHTree.FILE_LINE_RE_2
+    parts = []
+    with open(path_to_file, 'r') as file:
+        while True:
+            line = file.readline()
+            if not line:
+                break
+            line = line.rstrip('\r\n')
+            match = NLHTree.DIR_LINE_RE.match(line)
+            if match:
+                depth = len(match.group(1))
+                del parts[depth:]
+                parts.append(match.group(2))
+                yield ('/'.join(parts), )
+                continue
+            match = file_line_re.match(line)
+            if match:
+                depth = len(match.group(1))
+                del parts[depth:]
+                yield ('/'.join(parts + [match.group(2)]), match.group(3))
+                continue
+            raise RuntimeError("can't parse line: '%s'" % line)
+
+
+def time_walk(walk, path_to_file, nbr_lines):
+    """ Walk the listing, returning the number of lines per second. """
+
+    start = time.perf_counter()
+    count = 0
+    for _ in walk(path_to_file, HashTypes.SHA2):
+        count += 1
+    elapsed = time.perf_counter() - start
+    assert count == nbr_lines
+    return nbr_lines / elapsed
+
+
+def main():
+    """ Time walking a synthetic listing, old and new. """
+
+    parser = ArgumentParser(description='time NLHTree.walk_file')
+    parser.add_argument('-n', '--lines', type=int, default=1000000,
+                        help='lines in the listing (default 1000000)')
+    parser.add_argument('-w', '--width', type=int, default=100,
+                        help='files per directory (default 100)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_to_file = os.path.join(tmp_dir, 'bench.nlh')
+        nbr_lines = write_listing(path_to_file, args.lines, args.width)
+        print("%d lines, %d bytes" % (
+            nbr_lines, os.path.getsize(path_to_file)))
+        sys.stdout.flush()
+
+        old_rate = time_walk(old_walk_file, path_to_file, nbr_lines)
+        print("old walk:  %12.0f lines/s" % old_rate)
+        sys.stdout.flush()
+        new_rate = time_walk(NLHTree.walk_file, path_to_file, nbr_lines)
+        print("walk_file: %12.0f lines/s" % new_rate)
+        print("speedup:   %12.2fx" % (new_rate / old_rate))
+
+
+if __name__ == '__main__':
+    main()
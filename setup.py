@@ -22,7 +22,9 @@ setup(name='nlhtree_py',
       include_package_data=False,
       zip_safe=False,
       scripts=['src/nlh_check_in_data_dir', 'src/nlh_check_in_u_dir',
-               'src/nlh_populate_data_dir', 'src/nlh_save_to_u_dir'],
+               'src/nlh_convert', 'src/nlh_diff',
+               'src/nlh_populate_data_dir',
+               'src/nlh_save_to_u_dir'],
       description='data structure for representing directory and contents',
       url='https://jddixon.github.io/nlhtree_py',
       classifiers=[
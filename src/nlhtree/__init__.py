@@ -3,10 +3,29 @@
 """ NLHNode, NLHTree, NLHLeaf and supporting elements. """
 
 import binascii
+import bisect
+import codecs
+import errno
 import fnmatch
+import gc
+import hashlib
+import io
 import os
 import re
-from stat import S_ISDIR
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice, repeat
+from stat import S_ISDIR, S_ISREG
+
+try:
+    import fcntl
+except ImportError:         # not a Unix
+    fcntl = None
 
 from xlattice import HashTypes, check_hashtype
 from xlcrypto import SP   # for get_spaces()
@@ -22,11 +41,289 @@ from xlattice import (
     BLAKE2B_BIN_LEN, BLAKE2B_HEX_NONE)
 
 __all__ = ['__version__', '__version_date__',
-           'NLHNode', 'NLHLeaf', 'NLHTree', ]
+           'NLHNode', 'NLHLeaf', 'NLHTree', 'NLHHashCache',
+           'hash_file', 'new_hash', 'ADDED', 'REMOVED', 'MODIFIED',
+           'COPY', 'HARDLINK', 'REFLINK', 'LINK_MODES',
+           'NLHB_MAGIC', 'NLHB_VERSION', ]
 
 __version__ = '0.8.3'
 __version_date__ = '2018-02-27'
 
+if sys.version_info < (3, 6):
+    # pylint: disable=unused-import
+    import sha3     # monkey-patches hashlib
+    assert sha3     # suppresses warning
+
+
+# kinds of change reported by NLHTree.diff()
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+# how populate_data_dir() makes files from the content in U: COPY copies
+# it, HARDLINK links to it and REFLINK clones it where the filesystem
+# allows, each falling back to COPY where it cannot be done
+COPY = 'copy'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+LINK_MODES = (COPY, HARDLINK, REFLINK)
+
+# Linux's ioctl for cloning one file's extents into another
+_FICLONE = 0x40049409
+# errors from link(), FICLONE, copy_file_range() or sendfile() meaning
+# only that the operation is not possible here, so another may be tried
+_CANNOT = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL,
+           errno.ENOSYS, errno.ENOTTY, errno.ENOTSOCK, errno.EOPNOTSUPP,
+           getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+# how much to copy with one system call
+_COPY_CHUNK = 1024 * 1024
+# how many files each worker is given at a time in a parallel restore
+_RESTORE_BATCH = 64
+# how many files each worker is given at a time when hashing in parallel
+_HASH_BATCH = 64
+
+# characters which make a pattern a glob rather than a literal name
+MAGIC_RE = re.compile(r'[*?[]')
+
+# the name of a node.  Only a file's name may contain a colon.  Spelling
+# out both cases rather than using re.IGNORECASE makes matching several
+# times faster.
+_NAME_PAT = r'[a-zA-Z0-9_\$\+\-\.:~]+/?'
+_NAME_RE = re.compile(_NAME_PAT)
+# names which match the pattern but would lead out of a directory
+_DOT_NAMES = frozenset(['.', '..', './', '../'])
+# any line of a listing after the first: the indent, the name, and for a
+# file the hex hash
+_LINE_PAT = r'^( *)(' + _NAME_PAT + r')(?: (%s))?$'
+_LINE_RES = {
+    HashTypes.SHA1: re.compile(_LINE_PAT % '[0-9a-fA-F]{40}'),
+    HashTypes.SHA2: re.compile(_LINE_PAT % '[0-9a-fA-F]{64}'),
+    HashTypes.SHA3: re.compile(_LINE_PAT % '[0-9a-fA-F]{64}'),
+    HashTypes.BLAKE2B: re.compile(_LINE_PAT % '[0-9a-fA-F]{64}'),
+}
+# the same, when the hash type is not known
+_LINE_RE_ANY = re.compile(
+    _LINE_PAT % '[0-9a-fA-F]{40}(?:[0-9a-fA-F]{24})?')
+
+# how much of a listing to read at a time
+_READ_BLOCK = 1024 * 1024
+# how many lines of a listing to write at a time
+_WRITE_BATCH = 4096
+
+# binary listings (.nlhb): a header, the magic number followed by the
+# version and hash type as bytes, then one record per node in the order
+# in which they appear in a text listing.  Each record is a kind byte
+# and a length-prefixed UTF-8 name, followed by a child count for a
+# directory or the raw hash for a file.  Integers are little-endian.
+NLHB_MAGIC = b'NLHB'
+NLHB_VERSION = 1
+NLHB_DIR = 0
+NLHB_FILE = 1
+_NLHB_HEADER = struct.Struct('<4sBB')
+_NLHB_NODE = struct.Struct('<BH')
+_NLHB_COUNT = struct.Struct('<I')
+# record headers for files with the commoner name lengths
+_NLHB_FILE_HEADS = [_NLHB_NODE.pack(NLHB_FILE, n) for n in range(256)]
+
+
+def hash_file(path, hashtype=HashTypes.SHA2):
+    """
+    Return the binary hash of the contents of the file at **path**,
+    or None if the file cannot be found.
+    """
+    try:
+        if hashtype == HashTypes.SHA1:
+            hash_ = file_sha1hex(path)
+        elif hashtype == HashTypes.SHA2:
+            hash_ = file_sha2hex(path)
+        elif hashtype == HashTypes.SHA3:
+            hash_ = file_sha3hex(path)
+        elif hashtype == HashTypes.BLAKE2B:
+            hash_ = file_blake2b_hex(path)
+        else:
+            raise NotImplementedError
+    except FileNotFoundError:
+        return None
+    return binascii.a2b_hex(hash_)
+
+
+def _copy_range(in_fd, out_fd):
+    """ Copy up to a chunk within the kernel using copy_file_range. """
+    return os.copy_file_range(in_fd, out_fd, _COPY_CHUNK)
+
+
+def _send_file(in_fd, out_fd):
+    """ Copy up to a chunk within the kernel using sendfile. """
+    return os.sendfile(out_fd, in_fd, None, _COPY_CHUNK)
+
+
+# ways of copying without passing the data through user space, best first
+_ZERO_COPIES = [copy for name, copy in [('copy_file_range', _copy_range),
+                                        ('sendfile', _send_file)]
+                if hasattr(os, name)]
+
+
+def _copy_data(in_fd, out_fd):
+    """
+    Copy everything from the current position in file in_fd to file
+    out_fd.  Each way of copying in _ZERO_COPIES is tried in turn, from
+    wherever the last stopped; if none can be used the data is copied
+    a chunk at a time, so a large file is never held in memory.
+    """
+    for copy in _ZERO_COPIES:
+        try:
+            while copy(in_fd, out_fd):
+                pass
+            return
+        except OSError as exc:
+            if exc.errno not in _CANNOT:
+                raise
+    while True:
+        chunk = os.read(in_fd, _COPY_CHUNK)
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(out_fd, view):]
+
+
+def _copy_file(src, dest, link_mode=COPY):
+    """
+    Make dest a copy of the file src, replacing whatever is there.  If
+    link_mode is HARDLINK, dest is made a hard link to src; if REFLINK,
+    a clone sharing src's blocks; in either case falling back to a copy
+    if the filesystem does not allow it.
+    """
+    if link_mode == HARDLINK:
+        try:
+            os.link(src, dest)
+            return
+        except FileExistsError:
+            os.unlink(dest)
+            try:
+                os.link(src, dest)
+                return
+            except OSError as exc:
+                if exc.errno not in _CANNOT:
+                    raise
+        except OSError as exc:
+            if exc.errno not in _CANNOT:
+                raise
+    in_fd = os.open(src, os.O_RDONLY)
+    try:
+        out_fd = os.open(dest, os.O_WRONLY | os.O_CREAT, 0o666)
+        if os.fstat(out_fd).st_nlink > 1:
+            # dest may be a hard link into U, as left by HARDLINK:
+            # writing through it would change the content there
+            os.close(out_fd)
+            os.unlink(dest)
+            out_fd = os.open(dest, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            os.ftruncate(out_fd, 0)
+            if link_mode == REFLINK and fcntl is not None:
+                try:
+                    fcntl.ioctl(out_fd, _FICLONE, in_fd)
+                    return
+                except OSError as exc:
+                    if exc.errno not in _CANNOT:
+                        raise
+            _copy_data(in_fd, out_fd)
+        finally:
+            os.close(out_fd)
+    finally:
+        os.close(in_fd)
+
+
+def _remove(path):
+    """
+    Remove whatever is at path: a directory with everything below it,
+    anything else by unlinking it.  Symbolic links are never followed.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if S_ISDIR(mode):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def new_hash(hashtype=HashTypes.SHA2):
+    """ Return a new hashlib hash object for the hash type. """
+    if hashtype == HashTypes.SHA1:
+        return hashlib.sha1()
+    elif hashtype == HashTypes.SHA2:
+        return hashlib.sha256()
+    elif hashtype == HashTypes.SHA3:
+        return hashlib.sha3_256()
+    elif hashtype == HashTypes.BLAKE2B:
+        return hashlib.blake2b(digest_size=BLAKE2B_BIN_LEN)
+    raise NotImplementedError
+
+
+def _pack_dir(path_to_dir, hashtype, ex_re=None, match_re=None):
+    """
+    Scan and hash the directory at path_to_dir, returning the result
+    in a compact form which is cheap to pickle.  This is run in worker
+    processes by NLHTree.create_from_file_system; _unpack_dir() turns
+    the result back into an NLHTree.
+
+    The result is a 4-tuple: the names of the nodes below the directory
+    in depth-first order, separated by NUL characters; an array of
+    their depths; a bytes value which is 1 for each directory and 0
+    for each file; and the binary hashes of the files, concatenated.
+    """
+    names = []
+    depths = array('H')
+    kinds = bytearray()
+    hashes = bytearray()
+
+    def pack(entries, depth):
+        for file, sub in entries:
+            if isinstance(sub, list):
+                names.append(file)
+                depths.append(depth)
+                kinds.append(1)
+                pack(sub, depth + 1)
+            else:
+                b_hash = hash_file(sub, hashtype)
+                if b_hash is not None:
+                    names.append(file)
+                    depths.append(depth)
+                    kinds.append(0)
+                    hashes.extend(b_hash)
+
+    pack(NLHTree._scan_dir(path_to_dir, ex_re, match_re), 0)
+    return '\0'.join(names), depths, bytes(kinds), bytes(hashes)
+
+
+def _unpack_dir(name, packed, hashtype):
+    """
+    Given the name of a directory and the result of _pack_dir() on it,
+    return the corresponding NLHTree.  The nodes are already sorted, so
+    they are appended without further sorting.
+    """
+    names, depths, kinds, hashes = packed
+    names = names.split('\0') if names else []
+    nbr_files = len(kinds) - sum(kinds)
+    width = len(hashes) // nbr_files if nbr_files else 0
+
+    root = NLHTree(name, hashtype)
+    stack = [root]
+    offset = 0
+    for ndx, file in enumerate(names):
+        del stack[depths[ndx] + 1:]
+        if kinds[ndx]:
+            sub_tree = NLHTree(file, hashtype)
+            stack[-1]._append(sub_tree)
+            stack.append(sub_tree)
+        else:
+            stack[-1]._append(
+                NLHLeaf(file, hashes[offset:offset + width], hashtype))
+            offset += width
+    return root
+
 
 class NLHError(RuntimeError):
     """ Errors relating to NLHNode and child classe. """
@@ -38,9 +335,147 @@ class NLHParseError(NLHError):
     pass
 
 
+class NLHHashCache(object):
+    """
+    A persistent cache of file hashes, used to avoid rehashing files
+    which have not changed since they were last hashed.
+
+    Entries are keyed by a path and the hash type.  An entry is only
+    used if the file's size, modification and change times (in
+    nanoseconds) and inode number are the same as when it was hashed.
+    Files modified within RACY_NS of being hashed are not cached, as a
+    later change might leave the times unchanged.
+
+    If rehash is True, the cache is not consulted, so every file is
+    hashed again, but the results are still recorded.  save() writes
+    the entries used or stored since the cache was opened, dropping
+    those for files which were not seen.  The cache is not thread-safe.
+    """
+
+    HEADER = '# nlhtree hash cache v1'
+    RACY_NS = 2 * 1000 * 1000 * 1000
+
+    def __init__(self, path_to_cache=None, rehash=False):
+        self._path_to_cache = path_to_cache
+        self._rehash = rehash
+        self._entries = {}      # as loaded
+        self._fresh = {}        # used or stored in this session
+        if path_to_cache and not rehash and os.path.exists(path_to_cache):
+            self._load()
+
+    @property
+    def path_to_cache(self):
+        """ Return the path to the file the cache is saved in. """
+        return self._path_to_cache
+
+    def __len__(self):
+        """ Return the number of entries used or stored so far. """
+        return len(self._fresh)
+
+    def _load(self):
+        """
+        Read the cache file.  Lines which cannot be parsed are ignored,
+        as is the entire file if the header is wrong.
+        """
+        with open(self._path_to_cache, 'r') as file:
+            if file.readline().rstrip('\n') != self.HEADER:
+                return
+            for line in file:
+                parts = line.rstrip('\n').split(' ', 6)
+                if len(parts) != 7:
+                    continue
+                try:
+                    value, size, mtime, ctime, ino = [
+                        int(x) for x in parts[:5]]
+                    b_hash = binascii.a2b_hex(parts[5])
+                except ValueError:
+                    continue
+                self._entries[(parts[6], value)] = (
+                    size, mtime, ctime, ino, b_hash)
+
+    @staticmethod
+    def _stamp(stat):
+        """ Return the parts of a stat result which an entry records. """
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns,
+                stat.st_ino)
+
+    def lookup(self, key, stat, hashtype):
+        """
+        Return the cached binary hash for key if the file's stat result
+        matches that recorded with it, or None otherwise.
+        """
+        if self._rehash:
+            return None
+        ckey = (key, hashtype.value)
+        entry = self._fresh.get(ckey)
+        if entry is None:
+            entry = self._entries.pop(ckey, None)
+            if entry is None:
+                return None
+            self._fresh[ckey] = entry
+        if entry[:4] != self._stamp(stat):
+            return None
+        return entry[4]
+
+    def store(self, key, stat, hashtype, bin_hash):
+        """
+        Record the binary hash of the file whose stat result, taken
+        before it was hashed, is stat.
+        """
+        ckey = (key, hashtype.value)
+        now_ns = int(time.time() * 1000000000)
+        if '\n' in key or now_ns - stat.st_mtime_ns < self.RACY_NS:
+            self._fresh.pop(ckey, None)
+            return
+        self._fresh[ckey] = self._stamp(stat) + (bin_hash,)
+
+    def get_hash(self, path, hashtype, key=None):
+        """
+        Return the binary hash of the file at path, from the cache if
+        possible and otherwise by hashing it, or None if there is no
+        such file.  key defaults to path.
+        """
+        if key is None:
+            key = path
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        b_hash = self.lookup(key, stat, hashtype)
+        if b_hash is None:
+            b_hash = hash_file(path, hashtype)
+            if b_hash is not None:
+                self.store(key, stat, hashtype, b_hash)
+        return b_hash
+
+    def save(self, prune=True):
+        """
+        Write the cache to its file, replacing the file atomically.  If
+        prune is False, entries not used in this session are kept too.
+        """
+        if not self._path_to_cache:
+            raise NLHError('hash cache has no file')
+        entries = dict(self._fresh)
+        if not prune:
+            for ckey, entry in self._entries.items():
+                entries.setdefault(ckey, entry)
+        tmp_path = self._path_to_cache + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(self.HEADER + '\n')
+            for (key, value), (size, mtime, ctime, ino, b_hash) in \
+                    entries.items():
+                file.write('%d %d %d %d %d %s %s\n' % (
+                    value, size, mtime, ctime, ino,
+                    str(binascii.b2a_hex(b_hash), 'ascii'), key))
+        os.replace(tmp_path, self._path_to_cache)
+
+
 class NLHNode(object):
     """ Parent class for nodes in an NLH tree. """
 
+    # There may be millions of nodes, so none has an instance dict.
+    __slots__ = ('_name', '_hashtype', '_bin_hash')
+
     def __init__(self, name, hashtype=HashTypes.SHA2):
         check_hashtype(hashtype)
         self._name = name.strip()
@@ -72,7 +507,7 @@ class NLHNode(object):
             else:
                 raise NotImplementedError
         else:
-            return str(binascii.b2a_hex(self._bin_hash), 'ascii')
+            return self._bin_hash.hex()
 
     @hex_hash.setter
     def hex_hash(self, value):
@@ -93,6 +528,19 @@ class NLHNode(object):
             raise NLHError('attempt to set non-null hash')
         self._bin_hash = value
 
+    @property
+    def bin_digest(self):
+        """
+        Return the binary digest of the node: for a leaf this is its
+        hash, for a tree a digest over its children.
+        """
+        raise NotImplementedError
+
+    @property
+    def hex_digest(self):
+        """ Return the digest of the node in hexadecimal. """
+        return str(binascii.b2a_hex(self.bin_digest), 'ascii')
+
     @staticmethod
     def check_hash(bin_hash, hashtype):
         """ raise if inappropriate bin_hash length"""
@@ -132,14 +580,12 @@ class NLHNode(object):
         """ Return an iterator over this node. """
         raise NotImplementedError
 
-    def __next__(self):
-        """ Return the node 'next' to this one. """
-        raise NotImplementedError
-
 
 class NLHLeaf(NLHNode):
     """ Leaf node in an NLH tree. """
 
+    __slots__ = ()
+
     def __init__(self, name, bin_hash, hashtype):
         # exception if check fails
         NLHNode.check_hash(bin_hash, hashtype)
@@ -150,7 +596,17 @@ class NLHLeaf(NLHNode):
         else:
             self._bin_hash = None
 
-        self.iter_used = False
+    @staticmethod
+    def _from_parts(name, bin_hash, hashtype):
+        """
+        Make a leaf from parts already known to be valid, skipping the
+        checks made by __init__().  This must set the same attributes.
+        """
+        leaf = NLHLeaf.__new__(NLHLeaf)
+        leaf._name = name
+        leaf._hashtype = hashtype
+        leaf._bin_hash = bin_hash
+        return leaf
 
     def __eq__(self, other):
         """ Whether this leaf node equals another. """
@@ -161,6 +617,11 @@ class NLHLeaf(NLHNode):
         return (self.name == other.name) and (
             self.bin_hash == other.bin_hash)
 
+    @property
+    def bin_digest(self):
+        """ Return the binary digest of the leaf, which is its hash. """
+        return self._bin_hash
+
     def to_string(self, indent):
         """ Serialize this node as a string. """
         return "%s%s %s" % (
@@ -188,41 +649,32 @@ class NLHLeaf(NLHNode):
     # ITERABLE ############################################
 
     def __iter__(self):
-        """ Return an iterator over the leaf node. """
-        return self
-
-    def __next__(self):
-        """ Return the next leaf. """
-        if self.iter_used:
-            raise StopIteration
-        else:
-            self.iter_used = True
-            return (self._name, self.hex_hash)
+        """
+        Return an iterator over the leaf node, which yields its name
+        and hex hash.
+        """
+        yield (self._name, self.hex_hash)
 
     # END ITERABLE ########################################
 
     @staticmethod
-    def create_from_file_system(path, name, hashtype=HashTypes.SHA2):
+    def create_from_file_system(path, name, hashtype=HashTypes.SHA2,
+                                hash_cache=None):
         """
         Create an NLHLeaf from the contents of the file at **path**.
         The name is part of the path but is passed to simplify the code.
         Returns None if the file cannot be found.
+
+        If hash_cache, an NLHHashCache, is supplied, the hash is taken
+        from the cache, keyed by path, if the file is unchanged.
         """
-        if os.path.exists(path):
-            if hashtype == HashTypes.SHA1:
-                hash_ = file_sha1hex(path)
-            elif hashtype == HashTypes.SHA2:
-                hash_ = file_sha2hex(path)
-            elif hashtype == HashTypes.SHA3:
-                hash_ = file_sha3hex(path)
-            elif hashtype == HashTypes.BLAKE2B:
-                hash_ = file_blake2b_hex(path)
-            else:
-                raise NotImplementedError
-            b_hash = binascii.a2b_hex(hash_)
-            return NLHLeaf(name, b_hash, hashtype)
+        if hash_cache is None:
+            b_hash = hash_file(path, hashtype)
         else:
+            b_hash = hash_cache.get_hash(path, hashtype)
+        if b_hash is None:
             return None
+        return NLHLeaf(name, b_hash, hashtype)
 
 
 class NLHTree(NLHNode):
@@ -251,12 +703,18 @@ class NLHTree(NLHNode):
     FILE_LINE_RE_4 = re.compile(
         r'^( *)([a-z0-9_\$\+\-\.:~]+/?) ([0-9a-f]{64})$', re.IGNORECASE)
 
+    __slots__ = ('_nodes', '_names', '_digest', '_parent', '_index',
+                 '_hashes', '_dup_hashes')
+
     def __init__(self, name, hashtype=HashTypes.SHA2):
         super().__init__(name, hashtype)
         self._nodes = []
-        self._nn = -1           # duplication seems necessary
-        self._prefix = ''       # ditto
-        self._sub_tree = None   # for iterators
+        self._names = []        # parallel to _nodes, searched by bisect
+        self._digest = None     # cached; None if not yet calculated
+        self._parent = None     # the tree this is a subtree of, if any
+        self._index = None      # relative path -> node; built by get()
+        self._hashes = None     # bin_hash -> set of relative paths
+        self._dup_hashes = None  # the keys of _hashes with several paths
 
     @property
     def nodes(self):
@@ -264,50 +722,298 @@ class NLHTree(NLHNode):
         return self._nodes
 
     @property
-    def prefix(self):
-        """ Return the 'prefix' used in iteration. """
-        return self._prefix
+    def bin_digest(self):
+        """
+        Return the binary Merkle digest of the tree.  This is the hash,
+        using the tree's hash type, of the names of the nodes below it,
+        in order, each followed by a NUL, a type byte ('F' for a leaf or
+        'D' for a tree), and the node's binary digest.  The tree's own
+        name is not included.  The digest is cached, and the cache is
+        cleared when the tree or any tree below it changes.
+        """
+        if self._digest is None:
+            sha = new_hash(self._hashtype)
+            for node in self._nodes:
+                sha.update(node.name.encode('utf-8'))
+                if isinstance(node, NLHLeaf):
+                    sha.update(b'\0F')
+                else:
+                    sha.update(b'\0D')
+                sha.update(node.bin_digest)
+            self._digest = sha.digest()
+        return self._digest
 
-    @prefix.setter
-    def prefix(self, value):
-        """ Set the 'prefix' used in iteration. """
-        self._prefix = value
+    def _changed(self):
+        """
+        Clear the cached digest of this tree and of the trees above it.
+        If a tree has a digest, so do all trees below it; so we can stop
+        at the first tree without one.
+        """
+        tree = self
+        while tree is not None and tree._digest is not None:
+            tree._digest = None
+            tree = tree._parent
 
-    @property
-    def sub_tree(self):
-        """ Return the 'sub_tree' used in iteration. """
-        return self._sub_tree
+    def _adopt(self, node):
+        """
+        Make this tree the parent of node if it is a tree, and add
+        node to any indexes kept by the root.
+        """
+        self._claim(node)
+        root, prefix = self._indexed_root()
+        if root is not None:
+            root._index_node(prefix, node)
+
+    def _claim(self, node):
+        """ Make this tree the parent of node if it is a tree. """
+        if isinstance(node, NLHTree):
+            node._parent = self
+            # only the root keeps indexes
+            node._index = None
+            node._hashes = None
+            node._dup_hashes = None
+
+    def _orphan(self, node):
+        """
+        Detach node, which is being removed, from this tree, and drop
+        it from any indexes kept by the root.
+        """
+        if isinstance(node, NLHTree) and node._parent is self:
+            node._parent = None
+        root, prefix = self._indexed_root()
+        if root is not None:
+            root._unindex_node(prefix, node)
+
+    def _root(self):
+        """ Return the root of the tree this one belongs to. """
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        return root
+
+    def _prefix_below(self, root):
+        """
+        Return the path from root down to this tree, ending with a
+        slash unless empty.
+        """
+        parts = []
+        tree = self
+        while tree is not root:
+            parts.append(tree._name)
+            tree = tree._parent
+        if not parts:
+            return ''
+        return '/'.join(reversed(parts)) + '/'
+
+    def _indexed_root(self):
+        """
+        If the root of the tree this one belongs to keeps any index,
+        return the root and the path from it to this tree; otherwise
+        return None and None.
+        """
+        root = self._root()
+        if root._index is None and root._hashes is None:
+            return None, None
+        return root, self._prefix_below(root)
+
+    def _index_node(self, prefix, node):
+        """
+        Add node and any nodes below it, prefix preceding the name, to
+        the indexes this tree, the root, keeps.
+        """
+        path = prefix + node.name
+        if self._index is not None:
+            self._index[path] = node
+        if isinstance(node, NLHTree):
+            path += '/'
+            for sub_node in node._nodes:
+                self._index_node(path, sub_node)
+        elif self._hashes is not None:
+            paths = self._hashes.setdefault(node.bin_hash, set())
+            paths.add(path)
+            if len(paths) == 2:
+                self._dup_hashes.add(node.bin_hash)
+
+    def _unindex_node(self, prefix, node):
+        """
+        Remove node and any nodes below it from the indexes this tree,
+        the root, keeps.
+        """
+        path = prefix + node.name
+        if self._index is not None:
+            self._index.pop(path, None)
+        if isinstance(node, NLHTree):
+            path += '/'
+            for sub_node in node._nodes:
+                self._unindex_node(path, sub_node)
+        elif self._hashes is not None:
+            paths = self._hashes.get(node.bin_hash)
+            if paths is not None:
+                paths.discard(path)
+                if len(paths) == 1:
+                    self._dup_hashes.discard(node.bin_hash)
+                elif not paths:
+                    del self._hashes[node.bin_hash]
+
+    def get(self, rel_path):
+        """
+        Return the node at rel_path, a path below this tree such as
+        'subDir1/data11', or None if there is no such node.  An empty
+        path is this tree itself.
+
+        Lookups go through an index of every path in the whole tree,
+        kept by its root.  The index is built by the first lookup and
+        then kept up to date as nodes are inserted and deleted, so each
+        later lookup takes constant time, plus time proportional to the
+        depth of this tree below the root.
+        """
+        rel_path = rel_path.strip('/')
+        if not rel_path:
+            return self
+        root = self._root()
+        if root._index is None:
+            hashes = root._hashes
+            root._hashes = None         # index the paths alone
+            root._index = {}
+            for node in root._nodes:
+                root._index_node('', node)
+            root._hashes = hashes
+        return root._index.get(self._prefix_below(root) + rel_path)
+
+    def __contains__(self, rel_path):
+        """ Whether there is a node at rel_path below this tree. """
+        return self.get(rel_path) is not None
+
+    # REVERSE HASH INDEX --------------------------------------------
+
+    def _hash_index(self):
+        """
+        Return the root, which keeps the index from binary hash to the
+        paths of the leaves with that hash, and the path from the root
+        to this tree.  The index is built by the first query and then
+        kept up to date as nodes are inserted and deleted.
+        """
+        root = self._root()
+        if root._hashes is None:
+            index = root._index
+            root._index = None          # index the hashes alone
+            root._hashes = {}
+            root._dup_hashes = set()
+            for node in root._nodes:
+                root._index_node('', node)
+            root._index = index
+        return root, self._prefix_below(root)
+
+    @staticmethod
+    def _paths_below(paths, prefix):
+        """
+        Return a sorted list of those paths which begin with prefix,
+        with prefix removed.
+        """
+        if not prefix:
+            return sorted(paths)
+        size = len(prefix)
+        return sorted(path[size:] for path in paths
+                      if path.startswith(prefix))
+
+    def paths_for_hash(self, hash_):
+        """
+        Return a sorted list of the paths below this tree to leaves
+        with the hash given, in hex or binary.  The paths do not include
+        the name of the tree, as with get().
+        """
+        if isinstance(hash_, str):
+            hash_ = binascii.a2b_hex(hash_)
+        root, prefix = self._hash_index()
+        return self._paths_below(root._hashes.get(hash_, ()), prefix)
+
+    def hash_refcount(self, hash_):
+        """
+        Return the number of leaves below this tree with the hash
+        given, in hex or binary.
+        """
+        if isinstance(hash_, str):
+            hash_ = binascii.a2b_hex(hash_)
+        root, prefix = self._hash_index()
+        paths = root._hashes.get(hash_, ())
+        if not prefix:
+            return len(paths)
+        return len(self._paths_below(paths, prefix))
+
+    def duplicates(self):
+        """
+        Return the groups of leaves below this tree with the same
+        hash, each a sorted list of two or more paths.  The groups are
+        in order by their first paths.
+        """
+        root, prefix = self._hash_index()
+        groups = []
+        for bin_hash in root._dup_hashes:
+            paths = self._paths_below(root._hashes[bin_hash], prefix)
+            if len(paths) > 1:
+                groups.append(paths)
+        return sorted(groups)
 
     def __eq__(self, other):
-        """ Whether this tree equals another. """
-        if other is None or not isinstance(other, NLHTree) or \
-                self.name != other.name or self.hashtype != other.hashtype or \
-                len(self.nodes) != len(other.nodes):
+        """
+        Whether this tree equals another.  Trees are compared by name,
+        hash type, and digest, so once the digests have been calculated
+        the comparison does not descend into the trees.  Other kinds of
+        object are left to compare themselves, so that columnar and
+        mapped trees compare equal to an NLHTree either way round.
+        """
+        if not isinstance(other, NLHTree):
+            return NotImplemented
+        if self.name != other.name or self.hashtype != other.hashtype:
             return False
-        for i in range(len(self.nodes)):
-            if not self.nodes[i] == other.nodes[i]:
-                return False
-        return True
+        if self is other:
+            return True
+        return self.bin_digest == other.bin_digest
 
     def clone(self):
         """ Return a deep copy of the tree """
         tree = NLHTree(self._name, self.hashtype)
         for node in self._nodes:
-            tree.insert(node)
+            tree._append(node.clone())
+        tree._digest = self._digest
         return tree
 
+    def _ndx(self, name):
+        """
+        Return the index of the node with this name, or -1 if there
+        is no such node.
+        """
+        ndx = bisect.bisect_left(self._names, name)
+        if ndx < len(self._names) and self._names[ndx] == name:
+            return ndx
+        return -1
+
     def delete(self, pat):
         """
         Delete nodes whose names match the pattern.  This is
         a glob, as in UNIX-style file name pattern matching.
         """
 
+        if not MAGIC_RE.search(pat):
+            # a literal name: at most one node can match
+            ndx = self._ndx(pat)
+            if ndx >= 0:
+                self._orphan(self._nodes[ndx])
+                del self._nodes[ndx]
+                del self._names[ndx]
+                self._changed()
+            return
+
         remainder = []
         for node in self._nodes:
             if not fnmatch.fnmatch(node.name, pat):
                 remainder.append(node)
+            else:
+                self._orphan(node)
         if len(remainder) != len(self._nodes):
             self._nodes = remainder
+            self._names = [node.name for node in remainder]
+            self._changed()
 
     def find(self, pat):
         """
@@ -315,6 +1021,12 @@ class NLHTree(NLHNode):
         a glob, as in UNIX-style file name pattern matching.  The list
         is guaranteed to be sorted by node name.
         """
+        if not MAGIC_RE.search(pat):
+            ndx = self._ndx(pat)
+            if ndx >= 0:
+                return [self._nodes[ndx]]
+            return []
+
         matches = []
         for node in self._nodes:
             if fnmatch.fnmatch(node.name, pat):
@@ -329,29 +1041,124 @@ class NLHTree(NLHNode):
         """
         if node.hashtype != self.hashtype:
             raise NLHError("incompatible SHA types")
-        # XXX need checks
-        len_nodes = len(self._nodes)
         name = node.name
-        done = False
-        for ndx in range(len_nodes):
-            i_name = self._nodes[ndx].name
-            if name < i_name:
-                # insert before
-                if ndx == 0:
-                    self._nodes = [node] + self._nodes
-                    done = True
-                    break
+        ndx = bisect.bisect_left(self._names, name)
+        if ndx < len(self._names) and self._names[ndx] == name:
+            raise NLHError(
+                "attempt to add two nodes with the same name: '%s'" % name)
+        self._nodes.insert(ndx, node)
+        self._names.insert(ndx, name)
+        self._adopt(node)
+        self._changed()
+
+    def _append(self, node):
+        """
+        Append an NLHNode to the tree's list of nodes.  This is the bulk
+        loading path: the caller supplies nodes in sorted order, so all
+        we need to check is that the name sorts after that of the last
+        node.  Raise NLHParseError otherwise.
+
+        The tree must still be being built: the node is not added to
+        any index, as no index can yet exist, so that appending costs
+        the same however deep the tree.  get() builds indexes when
+        first asked.
+        """
+        name = node.name
+        if self._names and name <= self._names[-1]:
+            if name == self._names[-1]:
+                raise NLHParseError("duplicate name: '%s'" % name)
+            raise NLHParseError("name out of order: '%s' after '%s'" % (
+                name, self._names[-1]))
+        self._nodes.append(node)
+        self._names.append(name)
+        self._claim(node)
+        self._changed()
+
+    def diff(self, other):
+        """
+        Compare this tree, the old one, with another, the new one, and
+        return a generator over the differences.  Each is a 4-tuple:
+        the relative path, beginning with the name of this tree; the
+        kind of change, one of ADDED, REMOVED, or MODIFIED; and the old
+        and new hex hashes.  The hashes of directories are None, as is
+        the old hash of anything added and the new hash of anything
+        removed.  If a directory is added or removed, so is everything
+        below it.  If a file becomes a directory or vice versa, the old
+        node is reported as removed and the new one as added.
+
+        Changes are reported in the order in which the paths appear in
+        a listing.  Subtrees with the same digest are skipped, so the
+        cost depends on the size of the change rather than of the trees.
+        """
+        if other.hashtype != self.hashtype:
+            raise NLHError("incompatible SHA types")
+        if self.bin_digest == other.bin_digest:
+            return iter(())
+        return self._diff(other, self._name)
+
+    def _diff(self, other, prefix):
+        """
+        Yield the differences between two trees below prefix.  The
+        caller has established that their digests differ.
+        """
+        old_nodes = self._nodes
+        new_nodes = other.nodes
+        old_ndx = 0
+        new_ndx = 0
+        while old_ndx < len(old_nodes) or new_ndx < len(new_nodes):
+            if new_ndx >= len(new_nodes) or (
+                    old_ndx < len(old_nodes) and
+                    old_nodes[old_ndx].name < new_nodes[new_ndx].name):
+                yield from NLHTree._diff_node(
+                    old_nodes[old_ndx], prefix, REMOVED)
+                old_ndx += 1
+                continue
+            if old_ndx >= len(old_nodes) or \
+                    new_nodes[new_ndx].name < old_nodes[old_ndx].name:
+                yield from NLHTree._diff_node(
+                    new_nodes[new_ndx], prefix, ADDED)
+                new_ndx += 1
+                continue
+
+            # the same name in both trees
+            old = old_nodes[old_ndx]
+            new = new_nodes[new_ndx]
+            old_ndx += 1
+            new_ndx += 1
+            path = prefix + '/' + old.name
+            if isinstance(old, NLHLeaf):
+                if isinstance(new, NLHLeaf):
+                    if old.bin_hash != new.bin_hash:
+                        yield (path, MODIFIED, old.hex_hash, new.hex_hash)
                 else:
-                    before = self._nodes[0:ndx]
-                    after = self._nodes[ndx:]
-                    self._nodes = before + [node] + after
-                    done = True
-                    break
-            elif name == i_name:
-                raise NLHError(
-                    "attempt to add two nodes with the same name: '%s'" % name)
-        if not done:
-            self._nodes.append(node)
+                    yield (path, REMOVED, old.hex_hash, None)
+                    yield (path, ADDED, None, None)
+                    for node in new.nodes:
+                        yield from NLHTree._diff_node(node, path, ADDED)
+            elif isinstance(new, NLHLeaf):
+                yield (path, REMOVED, None, None)
+                yield (path, ADDED, None, new.hex_hash)
+                for node in old.nodes:
+                    yield from NLHTree._diff_node(node, path, REMOVED)
+            elif old.bin_digest != new.bin_digest:
+                yield from old._diff(new, path)
+
+    @staticmethod
+    def _diff_node(node, prefix, kind):
+        """
+        Yield the differences for a node below prefix which is present
+        in only one tree, and so is either ADDED or REMOVED.
+        """
+        path = prefix + '/' + node.name
+        if isinstance(node, NLHLeaf):
+            if kind == ADDED:
+                yield (path, kind, None, node.hex_hash)
+            else:
+                yield (path, kind, node.hex_hash, None)
+        else:
+            yield (path, kind, None, None)
+            for sub_node in node.nodes:
+                yield from NLHTree._diff_node(sub_node, path, kind)
 
     def list(self, pat):
         """
@@ -369,10 +1176,48 @@ class NLHTree(NLHNode):
         return elm
 
     def __str__(self):
-        strings = []
-        self.to_strings(strings, 0)
-        string = '\n'.join(strings) + '\n'
-        return string
+        return '\n'.join(self.iter_lines()) + '\n'
+
+    def iter_lines(self):
+        """
+        Yield the lines of the tree's listing, without line terminators,
+        one at a time.  Nothing is held but the stack of directories
+        being listed and one indent string for each depth.
+        """
+        indents = ['']
+        yield self._name
+        stack = [iter(self._nodes)]
+        while stack:
+            depth = len(stack)
+            if depth == len(indents):
+                indents.append(' ' * depth)
+            indent = indents[depth]
+            for node in stack[-1]:
+                if isinstance(node, NLHLeaf):
+                    yield indent + node._name + ' ' + node.hex_hash
+                else:
+                    yield indent + node._name
+                    stack.append(iter(node._nodes))
+                    break
+            else:
+                stack.pop()
+
+    def write_to(self, fileobj):
+        """
+        Write the tree's listing to fileobj, an open file, a batch of
+        lines at a time, so that the whole listing is never held in
+        memory.  A binary file is written UTF-8.
+        """
+        binary = isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase))
+        lines = self.iter_lines()
+        while True:
+            batch = list(islice(lines, _WRITE_BATCH))
+            if not batch:
+                break
+            chunk = '\n'.join(batch) + '\n'
+            if binary:
+                chunk = chunk.encode('utf-8')
+            fileobj.write(chunk)
 
     def to_strings(self, strings, indent=0):
         """ Serialize an NLHTree as a single string. """
@@ -386,11 +1231,23 @@ class NLHTree(NLHNode):
 
     @staticmethod
     def create_from_file_system(path_to_dir, hashtype=HashTypes.SHA2,
-                                ex_re=None, match_re=None):
+                                ex_re=None, match_re=None, jobs=1,
+                                use_processes=False, hash_cache=None):
         """
         Create an NLHTree based on the information in the directory
         at path_to_dir.  The name of the directory will be the last component
         of path_to_dir.  Return the NLHTree.
+
+        If jobs is greater than one, files are hashed concurrently by a
+        pool of that many threads.  If use_processes is also set, a pool
+        of processes is used instead: each subdirectory of path_to_dir is
+        scanned and hashed by a worker, which suits directories holding
+        very many small files.  The tree is the same either way.
+
+        If hash_cache, an NLHHashCache, is supplied, files which have not
+        changed since they were last hashed are not hashed again.  The
+        cache is keyed by the path relative to the directory containing
+        path_to_dir, so it begins with the name of the tree.
         """
         if not path_to_dir:
             raise NLHError("cannot create a NLHTree, no path set")
@@ -402,37 +1259,201 @@ class NLHTree(NLHNode):
         if path == '':
             raise NLHError("cannot parse path " + path_to_dir)
 
-        tree = NLHTree(name, hashtype)
+        if use_processes and jobs > 1 and hash_cache is None:
+            return NLHTree._create_with_processes(
+                path_to_dir, name, hashtype, ex_re, match_re, jobs)
 
-        # Create data structures for constituent files and subdirectories
-        # These are sorted by the bare name
-        # empty if you just append .sort()
-        files = sorted(os.listdir(path_to_dir))
-        if files:
-            for file in files:
-                # exclusions take priority over matches
-                if ex_re and ex_re.match(file):
-                    continue
-                if match_re and not match_re.search(file):
+        # First collect the names of the files and subdirectories, then
+        # hash the files, then build the tree from the hashes.
+        entries = NLHTree._scan_dir(path_to_dir, ex_re, match_re)
+        paths = []
+        NLHTree._collect_paths(entries, paths)
+
+        if hash_cache is None:
+            hashes = NLHTree._hash_paths(paths, hashtype, jobs, use_processes)
+        else:
+            # stat each file before hashing it, so that a change made
+            # while it is being hashed invalidates the entry
+            hashes = [None] * len(paths)
+            stats = {}
+            for ndx, path_to_file in enumerate(paths):
+                try:
+                    stat = os.stat(path_to_file)
+                except FileNotFoundError:
                     continue
-                node = None
-                path_to_file = os.path.join(path_to_dir, file)
-                string = os.lstat(path_to_file)        # ignores symlinks
-                mode = string.st_mode
-                # os.path.isdir(path) follows symbolic links
-                if S_ISDIR(mode):
-                    node = NLHTree.create_from_file_system(
-                        path_to_file, hashtype, ex_re, match_re)
-                # S_ISLNK(mode) is true if symbolic link
-                # isfile(path) follows symbolic links
-                elif os.path.isfile(path_to_file):        # S_ISREG(mode):
-                    node = NLHLeaf.create_from_file_system(
-                        path_to_file, file, hashtype)
-                # otherwise, just ignore it ;-)
-
-                if node:
-                    tree.nodes.append(node)
+                key = path_to_file[len(path) + 1:]
+                hashes[ndx] = hash_cache.lookup(key, stat, hashtype)
+                if hashes[ndx] is None:
+                    stats[ndx] = (key, stat)
+            todo = sorted(stats)
+            fresh = NLHTree._hash_paths(
+                [paths[ndx] for ndx in todo], hashtype, jobs, use_processes)
+            for ndx, b_hash in zip(todo, fresh):
+                if b_hash is not None:
+                    key, stat = stats[ndx]
+                    hash_cache.store(key, stat, hashtype, b_hash)
+                hashes[ndx] = b_hash
+
+        return NLHTree._build_from_scan(name, entries, iter(hashes), hashtype)
+
+    @staticmethod
+    def _hash_paths(paths, hashtype, jobs=1, use_processes=False):
+        """
+        Return a list of the binary hashes of the files at paths, in
+        the same order, using a pool of jobs threads or processes if
+        jobs is greater than one.  Missing files have None as hash.
+        """
+        if jobs < 2 or len(paths) < 2:
+            return [hash_file(path_to_file, hashtype)
+                    for path_to_file in paths]
+        if use_processes:
+            chunk = max(1, len(paths) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                return list(executor.map(hash_file, paths,
+                                         [hashtype] * len(paths),
+                                         chunksize=chunk))
+        # files are submitted a batch at a time to bound the futures
+        # pending; map() returns results in the order submitted
+        hashes = []
+        step = jobs * _HASH_BATCH
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for start in range(0, len(paths), step):
+                hashes.extend(executor.map(
+                    hash_file, paths[start:start + step], repeat(hashtype)))
+        return hashes
+
+    @staticmethod
+    def _create_with_processes(path_to_dir, name, hashtype,
+                               ex_re, match_re, jobs):
+        """
+        Build the NLHTree for path_to_dir using a pool of jobs processes.
+        Each subdirectory is handed to a worker as a unit.  While there
+        are fewer such units than jobs, the directories are listed a
+        level further down and their subdirectories become the units
+        instead, so that a tree with one large top-level directory still
+        keeps every worker busy.  Files in the directories so listed are
+        hashed by the workers in batches.
+        """
+        # directories listed here -> their (name, path, is_dir) entries
+        listed = {path_to_dir: NLHTree._list_dir(path_to_dir, ex_re, match_re)}
+        units = [path for _, path, is_dir in listed[path_to_dir] if is_dir]
+        while 0 < len(units) < jobs:
+            below = []
+            for path in units:
+                listed[path] = NLHTree._list_dir(path, ex_re, match_re)
+                below.extend(sub_path for _, sub_path, is_dir in listed[path]
+                             if is_dir)
+            units = below
+
+        def files_below(path):
+            """ Yield the paths of the files in the listed directories. """
+            for _, sub_path, is_dir in listed[path]:
+                if not is_dir:
+                    yield sub_path
+                elif sub_path in listed:
+                    yield from files_below(sub_path)
+
+        def build(tree, path, packed, hashes):
+            """ Add the nodes below the listed directory at path to tree. """
+            for file, sub_path, is_dir in listed[path]:
+                if not is_dir:
+                    b_hash = next(hashes)
+                    if b_hash is not None:
+                        tree._append(NLHLeaf(file, b_hash, hashtype))
+                elif sub_path in listed:
+                    sub_tree = NLHTree(file, hashtype)
+                    tree._append(sub_tree)
+                    build(sub_tree, sub_path, packed, hashes)
+                else:
+                    tree._append(_unpack_dir(
+                        file, packed[sub_path].result(), hashtype))
+
+        tree = NLHTree(name, hashtype)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            packed = {}
+            for path in units:
+                packed[path] = executor.submit(
+                    _pack_dir, path, hashtype, ex_re, match_re)
+            paths = list(files_below(path_to_dir))
+            chunk = max(1, len(paths) // (jobs * 4))
+            hashes = executor.map(hash_file, paths,
+                                  [hashtype] * len(paths), chunksize=chunk)
+            build(tree, path_to_dir, packed, hashes)
+        return tree
+
+    @staticmethod
+    def _list_dir(path_to_dir, ex_re=None, match_re=None):
+        """
+        Return a sorted list of (name, path, is_dir) triples for the
+        files and subdirectories in the directory at path_to_dir which
+        pass the ex_re and match_re filters.  Anything else, including
+        symbolic links to directories, is ignored.
+        """
+        # os.scandir() gets the type of most entries from the directory
+        # itself, so the only syscalls are for reading the directory and
+        # for following symbolic links
+        entries = []
+        for entry in sorted(os.scandir(path_to_dir), key=lambda e: e.name):
+            file = entry.name
+            # exclusions take priority over matches
+            if ex_re and ex_re.match(file):
+                continue
+            if match_re and not match_re.search(file):
+                continue
+            # symbolic links to directories are ignored
+            if entry.is_dir(follow_symlinks=False):
+                entries.append((file, entry.path, True))
+            # but is_file() follows symbolic links to files
+            elif entry.is_file():
+                entries.append((file, entry.path, False))
+            # otherwise, just ignore it ;-)
+        return entries
+
+    @staticmethod
+    def _scan_dir(path_to_dir, ex_re=None, match_re=None):
+        """
+        Return a sorted list of (name, sub) pairs describing the directory
+        at path_to_dir.  If the entry is a subdirectory, sub is in turn
+        a list describing it.  If it is a file, sub is the path to it.
+        """
+        entries = []
+        for file, path_to_file, is_dir in NLHTree._list_dir(
+                path_to_dir, ex_re, match_re):
+            if is_dir:
+                entries.append((file, NLHTree._scan_dir(
+                    path_to_file, ex_re, match_re)))
+            else:
+                entries.append((file, path_to_file))
+        return entries
 
+    @staticmethod
+    def _collect_paths(entries, paths):
+        """
+        Append the paths to the files in a _scan_dir() list to paths,
+        in depth-first order.
+        """
+        for _, sub in entries:
+            if isinstance(sub, list):
+                NLHTree._collect_paths(sub, paths)
+            else:
+                paths.append(sub)
+
+    @staticmethod
+    def _build_from_scan(name, entries, hashes, hashtype):
+        """
+        Build an NLHTree from a _scan_dir() list, taking the hashes of
+        the files in depth-first order from the iterator hashes.  Files
+        whose hash is None have disappeared and are skipped.
+        """
+        tree = NLHTree(name, hashtype)
+        for file, sub in entries:
+            if isinstance(sub, list):
+                tree._append(
+                    NLHTree._build_from_scan(file, sub, hashes, hashtype))
+            else:
+                b_hash = next(hashes)
+                if b_hash is not None:
+                    tree._append(NLHLeaf(file, b_hash, hashtype))
         return tree
 
     @staticmethod
@@ -448,94 +1469,137 @@ class NLHTree(NLHNode):
         return match.group(2)   # the name
 
     @staticmethod
-    def parse_other_line(string):
+    def parse_other_line(string, hashtype=None):
         """
         Return the indent (the number of spaces), the name on the line,
-        and other None or the hash found.
+        and other None or the hash found.  If hashtype is given, the
+        hash must be of the length that type requires.
         """
-
-        match = NLHTree.DIR_LINE_RE.match(string)
-        if match:
-            return len(match.group(1)), match.group(2), None
-
-        match = NLHTree.FILE_LINE_RE_1.match(string)
+        line_re = _LINE_RES[hashtype] if hashtype else _LINE_RE_ANY
+        match = line_re.match(string)
         if match:
-            return len(match.group(1)), match.group(2), match.group(3)
-
-        # KLUDGE: SHA2, SHA3, BLAKE2B all use the same pattern
-        match = NLHTree.FILE_LINE_RE_2.match(string)
-        if match:
-            return len(match.group(1)), match.group(2), match.group(3)
-
+            indent, name, hash_ = match.groups()
+            if hash_ is not None or ':' not in name:
+                return len(indent), name, hash_
         raise NLHParseError("can't parse line: '%s'" % string)
 
+    @staticmethod
+    def _tokenize(strings, hashtype):
+        """
+        Yield what parse_other_line() returns for each of strings, the
+        lines of a listing after the first, using a single pattern
+        chosen by hashtype.
+        """
+        match_line = _LINE_RES[hashtype].match
+        for line in strings:
+            match = match_line(line)
+            if match:
+                indent, name, hash_ = match.groups()
+                if hash_ is not None or ':' not in name:
+                    yield len(indent), name, hash_
+                    continue
+            raise NLHParseError("can't parse line: '%s'" % line)
+
     @staticmethod
     def create_from_string_array(lines, hashtype=HashTypes.SHA2):
         """
         Given an arrays of strings representing a serialized NLHTree,
-        return the NLHTRee.
+        return the NLHTRee.  lines may be any iterable over the strings,
+        which are consumed one at a time.
         """
         # at entry, we don't know whether the string array uses
         # SHA1 or SHA256
 
-        if not lines:
+        lines = iter(lines)
+        first = next(lines, None)
+        if first is None:
             return None
 
-        name = NLHTree.parse_first_line(lines[0])
+        name = NLHTree.parse_first_line(first)
         cur_level = NLHTree(name, hashtype)     # our first push
         root = cur_level
         stack = [root]
         depth = 0
 
-        for line in lines[1:]:
-            indent, name, hash_ = NLHTree.parse_other_line(line)
-            if hash_ is not None:
-                b_hash = binascii.a2b_hex(hash_)
+        for indent, name, hash_ in NLHTree._tokenize(lines, hashtype):
 
             if indent > depth + 1:
                 raise NLHError("IMPOSSIBLE: indent %d, depth %d" %
                                (indent, depth))
-#               if hash_:
-#                   leaf = NLHLeaf(name, b_hash, hashtype)
-#                   stack[depth].insert(leaf)
-#               else:
-#                   sub_tree = NLHTree(name, hashtype)
-#                   stack.append(sub_tree)
-#                   depth += 1
-
-            if indent == depth + 1:
-                if hash_ is None:
-                    sub_tree = NLHTree(name, hashtype)
-                    stack[depth].insert(sub_tree)
-                    stack.append(sub_tree)
-                    depth += 1
-                else:
-                    leaf = NLHLeaf(name, b_hash, hashtype)
-                    stack[depth].insert(leaf)
-
+            while indent < depth + 1:
+                stack.pop()
+                depth -= 1
+
+            # a serialized tree is already sorted, so we just append
+            if hash_ is None:
+                sub_tree = NLHTree(name, hashtype)
+                stack[depth]._append(sub_tree)
+                stack.append(sub_tree)
+                depth += 1
             else:
-                while indent < depth + 1:
-                    stack.pop()
-                    depth -= 1
-                if hash_ is None:
-                    sub_tree = NLHTree(name, hashtype)
-                    stack[depth].insert(sub_tree)
-                    stack.append(sub_tree)
-                    depth += 1
-                else:
-                    leaf = NLHLeaf(name, b_hash, hashtype)
-                    stack[depth].insert(leaf)
+                # the tokenizer has checked the length of the hash
+                leaf = NLHLeaf._from_parts(
+                    name, binascii.a2b_hex(hash_), hashtype)
+                stack[depth]._append(leaf)
 
         return root
 
+    @staticmethod
+    def _read_lines(source):
+        """
+        Yield the lines in source without their line terminators.
+        source may be a path, '-' for stdin, an open text or binary
+        file, or any other iterable over lines.  Files are read in
+        large blocks, each split into lines at once, so only a block
+        of the file is held in memory at a time.
+        """
+        if isinstance(source, str):
+            if source == '-':
+                yield from NLHTree._read_lines(sys.stdin)
+            else:
+                with open(source, 'r') as file:
+                    yield from NLHTree._read_lines(file)
+            return
+        if not hasattr(source, 'read'):
+            for line in source:
+                if isinstance(line, bytes):
+                    line = str(line, 'utf-8')
+                yield line.rstrip('\r\n')
+            return
+
+        decode = None           # for binary files
+        rest = ''               # a partial line left over from a block
+        while True:
+            block = source.read(_READ_BLOCK)
+            if isinstance(block, bytes):
+                if decode is None:
+                    decode = codecs.getincrementaldecoder('utf-8')().decode
+                block = decode(block, not block)
+            if not block:
+                break
+            block = rest + block
+            lines = block.split('\n')
+            rest = lines.pop()
+            if '\r' in block:
+                lines = [line.rstrip('\r') for line in lines]
+            yield from lines
+        rest = rest.rstrip('\r')
+        if rest:
+            yield rest
+
     @staticmethod
     def parse_file(path_to_file, hashtype):
         """
-        Read a serialized NLHTree, parse the resulting string, return NLHTree.
+        Read a serialized NLHTree line by line, returning the NLHTree.
+
+        path_to_file is a path, '-' for stdin, an open text or binary
+        file, or any other iterable over the lines of the listing.
         """
-        with open(path_to_file, 'r') as file:
-            string = file.read()
-        return NLHTree.parse(string, hashtype)
+        tree = NLHTree.create_from_string_array(
+            NLHTree._read_lines(path_to_file), hashtype)
+        if tree is None:
+            raise NLHParseError('cannot parse an empty listing')
+        return tree
 
     @staticmethod
     def parse(string, hashtype):
@@ -547,38 +1611,280 @@ class NLHTree(NLHNode):
             strings = strings[:-1]
         return NLHTree.create_from_string_array(strings, hashtype)
 
+    # BINARY SERIALIZATION ------------------------------------------
+
+    @staticmethod
+    def _bin_hash_len(hashtype):
+        """ Return the length in bytes of a binary hash of this type. """
+        if hashtype == HashTypes.SHA1:
+            return SHA1_BIN_LEN
+        elif hashtype == HashTypes.SHA2:
+            return SHA2_BIN_LEN
+        elif hashtype == HashTypes.SHA3:
+            return SHA3_BIN_LEN
+        elif hashtype == HashTypes.BLAKE2B:
+            return BLAKE2B_BIN_LEN
+        raise NotImplementedError
+
+    def to_binary(self):
+        """
+        Serialize the NLHTree in the binary listing format, returning
+        bytes.  Hashes are written as they are held, without hex
+        encoding, and nothing needs to be indented.
+        """
+        chunks = [_NLHB_HEADER.pack(
+            NLHB_MAGIC, NLHB_VERSION, self._hashtype.value)]
+        self._to_binary(chunks)
+        return b''.join(chunks)
+
+    def _to_binary(self, chunks):
+        """ Append the records for this tree and its nodes to chunks. """
+
+        name = self._name.encode('utf-8')
+        chunks.append(_NLHB_NODE.pack(NLHB_DIR, len(name)) + name +
+                      _NLHB_COUNT.pack(len(self._nodes)))
+        for node in self._nodes:
+            if isinstance(node, NLHLeaf):
+                name = node._name.encode('utf-8')
+                if len(name) < 256:
+                    head = _NLHB_FILE_HEADS[len(name)]
+                else:
+                    head = _NLHB_NODE.pack(NLHB_FILE, len(name))
+                chunks.append(head + name + node._bin_hash)
+            else:
+                node._to_binary(chunks)
+
+    @staticmethod
+    def is_binary_listing(data):
+        """
+        Whether data, bytes, begins like a binary listing of the current
+        version.  The version byte is a control character, which a text
+        listing never contains, so a text listing whose root directory
+        name begins with NLHB_MAGIC is not mistaken for a binary one.
+        """
+        return data[:5] == NLHB_MAGIC + bytes([NLHB_VERSION])
+
+    @staticmethod
+    def from_binary(data):
+        """
+        Deserialize an NLHTree in the binary listing format.  The hash
+        type is taken from the header.  Raise NLHParseError if the data
+        is not a well-formed binary listing.
+        """
+        data = bytes(data)
+        if len(data) < _NLHB_HEADER.size:
+            raise NLHParseError('binary listing too short')
+        magic, version, hashtype = _NLHB_HEADER.unpack_from(data)
+        if magic != NLHB_MAGIC:
+            raise NLHParseError('not a binary listing')
+        if version != NLHB_VERSION:
+            raise NLHParseError(
+                'unsupported binary listing version %d' % version)
+        try:
+            hashtype = HashTypes(hashtype)
+        except ValueError:
+            raise NLHParseError('unknown hash type %d' % hashtype)
+        hash_len = NLHTree._bin_hash_len(hashtype)
+
+        # Every node made survives, so collections triggered by the
+        # allocations would only walk a growing heap to no purpose.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            kind, _ = _NLHB_NODE.unpack_from(data, _NLHB_HEADER.size)
+            if kind != NLHB_DIR:
+                raise NLHParseError('binary listing must begin with a tree')
+            root, offset = NLHTree._from_binary(
+                data, _NLHB_HEADER.size, hashtype, hash_len)
+        except struct.error:
+            raise NLHParseError('binary listing truncated')
+        except UnicodeDecodeError:
+            raise NLHParseError('name in binary listing is not UTF-8')
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if offset != len(data):
+            raise NLHParseError('trailing data after binary listing')
+        return root
+
+    @staticmethod
+    def _from_binary(data, offset, hashtype, hash_len):
+        """
+        Read the tree whose record begins at offset, returning the tree
+        and the offset just past it.  The children of each tree are
+        collected and checked for sort order in bulk, and leaves are
+        made without rechecking their hash lengths, which the format
+        fixes.  Names must be those a text listing could hold, other
+        than . and .., so that none can lead outside the tree.
+        """
+        unpack_node = _NLHB_NODE.unpack_from
+        node_size = _NLHB_NODE.size
+        match_name = _NAME_RE.fullmatch
+        _, name_len = unpack_node(data, offset)
+        offset += node_size
+        name = data[offset:offset + name_len].decode('utf-8')
+        if not match_name(name) or ':' in name or name in _DOT_NAMES:
+            raise NLHParseError("bad directory name: '%s'" % name)
+        tree = NLHTree(name, hashtype)
+        offset += name_len
+        count = _NLHB_COUNT.unpack_from(data, offset)[0]
+        offset += _NLHB_COUNT.size
+
+        nodes = []
+        names = []
+        prev = ''
+        for _ in range(count):
+            kind, name_len = unpack_node(data, offset)
+            if kind == NLHB_FILE:
+                offset += node_size
+                name = data[offset:offset + name_len].decode('utf-8')
+                if not match_name(name) or name in _DOT_NAMES:
+                    raise NLHParseError("bad file name: '%s'" % name)
+                offset += name_len
+                bin_hash = data[offset:offset + hash_len]
+                offset += hash_len
+                if len(bin_hash) != hash_len:
+                    raise NLHParseError('binary listing truncated')
+                node = NLHLeaf._from_parts(name, bin_hash, hashtype)
+            elif kind == NLHB_DIR:
+                node, offset = NLHTree._from_binary(
+                    data, offset, hashtype, hash_len)
+                node._parent = tree
+                name = node._name
+            else:
+                raise NLHParseError(
+                    'bad record kind %d at offset %d' % (kind, offset))
+            if name <= prev:
+                if name == prev:
+                    raise NLHParseError("duplicate name: '%s'" % name)
+                raise NLHParseError("name out of order: '%s' after '%s'" % (
+                    name, prev))
+            prev = name
+            nodes.append(node)
+            names.append(name)
+        tree._nodes = nodes
+        tree._names = names
+        return tree, offset
+
+    def to_binary_file(self, path_to_file):
+        """ Write the NLHTree to a file in the binary listing format. """
+        with open(path_to_file, 'wb') as file:
+            file.write(self.to_binary())
+
+    @staticmethod
+    def from_binary_file(path_to_file):
+        """ Read an NLHTree from a file in the binary listing format. """
+        with open(path_to_file, 'rb') as file:
+            return NLHTree.from_binary(file.read())
+
     # DATA_DIR/U_DIR INTERACTION ------------------------------------
 
-    def check_in_data_dir(self, data_dir):
+    def check_in_data_dir(self, data_dir, verify=False, jobs=1,
+                          hash_cache=None):
         """
         Walk the tree, verifying that all leafs (files) can be found in
-        data_dir by relative path and that the content key is correct.  This
-        does NOT verify that all files have corresponding leaf nodes.
+        data_dir by relative path.  This does NOT verify that all files
+        have corresponding leaf nodes.
 
         data_dir is a path, the last component of which is the name of
         the data directory and so also the name of the NLHTree.
+
+        If verify is True, the content key of each file is checked too,
+        as verify_data_dir() checks it, and files whose content does
+        not match are listed with those missing, in the order in which
+        they appear in the tree.
         """
 
         # if / not found, holder, the holding directory, is an empty string.
         # Return a list of leaf nodes which are not matched.  If everything
         # is OK this will be empty.
 
+        if verify:
+            return [path for path, _ in
+                    self._verify_data_dir(data_dir, jobs, hash_cache)]
         holder, delim, _ = data_dir.rpartition('/')
         if delim == '':
             holder = ''
         unmatched = []
-        for couple in self:
+        for couple in self.walk_bin():
             if len(couple) == 1:
                 # it's a directory
                 pass
             else:
                 rel_path = couple[0]
-                # hash_ = couple[1]     # UNUSED
                 path = os.path.join(holder, rel_path)
                 if not os.path.exists(path):
                     unmatched.append(path)
         return unmatched
 
+    def verify_data_dir(self, data_dir, jobs=1, hash_cache=None):
+        """
+        Verify that each leaf (file) of the tree is in data_dir, as for
+        check_in_data_dir(), and that its content has the leaf's hash.
+        Return two lists of paths, those missing and those whose
+        content does not match, each in the order of the tree.
+
+        Files are hashed by a pool of jobs threads if jobs is greater
+        than one.  If hash_cache, an NLHHashCache, is supplied, a file
+        whose size, times and inode are those recorded with its hash is
+        trusted to have that hash, so only files which have changed are
+        hashed again.  The cache is keyed as by create_from_file_system.
+        """
+        missing = []
+        mismatched = []
+        for path, is_missing in self._verify_data_dir(
+                data_dir, jobs, hash_cache):
+            if is_missing:
+                missing.append(path)
+            else:
+                mismatched.append(path)
+        return missing, mismatched
+
+    def _verify_data_dir(self, data_dir, jobs, hash_cache):
+        """
+        Return a list of (path, whether missing) for each file in
+        data_dir which is missing or does not match the tree.
+        """
+        holder, delim, _ = data_dir.rpartition('/')
+        if delim == '':
+            holder = ''
+        hashtype = self.hashtype
+        keys = []           # the path relative to holder
+        expected = []
+        for couple in self.walk_bin():
+            if len(couple) == 2:
+                keys.append(couple[0])
+                expected.append(couple[1])
+        paths = [os.path.join(holder, key) for key in keys]
+
+        # stat each file before hashing it, so that a change made while
+        # it is being hashed invalidates any cache entry
+        found = [None] * len(paths)     # hashes, None if missing
+        todo = []
+        stats = {}
+        for ndx, path_to_file in enumerate(paths):
+            try:
+                stat = os.stat(path_to_file)
+            except FileNotFoundError:
+                continue
+            if not S_ISREG(stat.st_mode):
+                found[ndx] = b''            # matches no hash
+                continue
+            if hash_cache is not None:
+                found[ndx] = hash_cache.lookup(keys[ndx], stat, hashtype)
+                if found[ndx] is None:
+                    stats[ndx] = stat
+            if found[ndx] is None:
+                todo.append(ndx)
+        fresh = NLHTree._hash_paths(
+            [paths[ndx] for ndx in todo], hashtype, jobs)
+        for ndx, b_hash in zip(todo, fresh):
+            if b_hash is not None and hash_cache is not None:
+                hash_cache.store(keys[ndx], stats[ndx], hashtype, b_hash)
+            found[ndx] = b_hash
+        return [(paths[ndx], found[ndx] is None)
+                for ndx in range(len(paths)) if found[ndx] != expected[ndx]]
+
     def check_in_u_dir(self, u_path):
         """
         Walk the tree, verifying that all leaf nodes have corresponding
@@ -588,65 +1894,202 @@ class NLHTree(NLHNode):
         u_dir = UDir.discover(u_path, hashtype=self.hashtype)
 
         unmatched = []
-        for couple in self:
+        missing = {}                # binary hash -> hex, if not in u_dir
+        for couple in self.walk_bin():
             if len(couple) == 1:
                 # it's a directory
                 pass
             else:
                 rel_path = couple[0]
-                hash_ = couple[1]
-                if not u_dir.exists(hash_):
+                bin_hash = couple[1]
+                if bin_hash not in missing:
+                    hash_ = bin_hash.hex()
+                    missing[bin_hash] = \
+                        None if u_dir.exists(hash_) else hash_
+                hash_ = missing[bin_hash]
+                if hash_ is not None:
                     unmatched.append((rel_path, hash_,))
         return unmatched
 
     def drop_from_u_dir(self, u_path):
-        """ Remove all leaf nodes in this NLHTree from u_dir """
+        """
+        Remove all leaf nodes in this NLHTree from u_dir.  Each distinct
+        hash is deleted once, however many leaves share it.  Return a
+        list of (relative path, hex hash) for leaves whose content could
+        not be deleted.
+        """
 
         u_dir = UDir.discover(u_path, hashtype=self.hashtype)
 
         unmatched = []
-        for couple in self:
+        deleted = {}                # binary hash -> whether deleted
+        for couple in self.walk_bin():
             if len(couple) == 1:
                 # it's a directory
                 pass
             else:
-                hash_ = couple[1]
-                ok_ = u_dir.delete(hash_)
+                bin_hash = couple[1]
+                ok_ = deleted.get(bin_hash)
+                if ok_ is None:
+                    ok_ = u_dir.delete(bin_hash.hex())
+                    deleted[bin_hash] = ok_
                 if not ok_:
                     rel_path = couple[0]
-                    unmatched.append((rel_path, hash_,))
+                    unmatched.append((rel_path, bin_hash.hex(),))
         return unmatched
 
-    def populate_data_dir(self, u_path, path):
+    def populate_data_dir(self, u_path, path, link_mode=COPY, jobs=1,
+                          sync=False, hash_cache=None, dedup=None):
         """
         path is the path to the data directory, excluding the name
         of the directory itself, which will be the name of the tree
+
+        Files are copied from U within the kernel where possible, and
+        otherwise a chunk at a time, so no file is read into memory
+        whole.  If link_mode is HARDLINK, files are instead hard links
+        to the content in U, and if REFLINK, clones sharing its blocks,
+        where the filesystem allows.  Hard-linked files must not be
+        modified in place, as that would change the content in U.
+
+        If jobs is greater than one, every directory is created first,
+        in one pass, and then the files are restored by a pool of jobs
+        threads.  Either way, return a list of the hex hashes not found
+        in U, in the order in which their files appear in the tree.
+
+        If sync is True, the data directory is made to match the tree
+        exactly: files whose content already matches are left alone,
+        and anything not in the tree is deleted.  Existing files are
+        hashed to compare them, using hash_cache, an NLHHashCache, if
+        one is given.  The cache is keyed by the path relative to path,
+        as by create_from_file_system and verify_data_dir, so one cache
+        may serve all three.  Symbolic links are removed, never followed.
+
+        If dedup is HARDLINK or REFLINK, content appearing under several
+        paths is restored from U only for the first; the others are
+        hard links to it or clones of it, where the filesystem allows.
+        Files hard-linked in this way share any later changes.
         """
         if not os.path.exists(u_path):
             raise NLHError(
                 "populate_data_dir: u_path '%s' does not exist" % u_path)
+        if link_mode not in LINK_MODES:
+            raise NLHError(
+                "populate_data_dir: unknown link mode '%s'" % link_mode)
+        if dedup is not None and dedup not in LINK_MODES:
+            raise NLHError(
+                "populate_data_dir: unknown dedup mode '%s'" % dedup)
 
         u_dir = UDir.discover(u_path, hashtype=self.hashtype)
+        hashtype = self.hashtype
+        cache_lock = threading.Lock()
+
+        def is_current(key, path_to_file, hash_):
+            """
+            In sync mode, whether the file at path_to_file already has
+            the content hash_.  If it does not, anything there which a
+            copy cannot simply overwrite is removed.  key, the path
+            relative to path, is the key into any hash cache.
+            """
+            try:
+                stat = os.lstat(path_to_file)
+            except FileNotFoundError:
+                return False
+            if not S_ISREG(stat.st_mode):
+                _remove(path_to_file)
+                return False
+            b_hash = None
+            if hash_cache is not None:
+                with cache_lock:
+                    b_hash = hash_cache.lookup(key, stat, hashtype)
+            if b_hash is None:
+                b_hash = hash_file(path_to_file, hashtype)
+                if hash_cache is not None and b_hash is not None:
+                    with cache_lock:
+                        hash_cache.store(key, stat, hashtype, b_hash)
+            return b_hash == binascii.a2b_hex(hash_)
+
+        # if dedup, hex hash -> path to a file already restored with it
+        sources = {}
+
+        def restore(couple):
+            """ Restore one file, returning its hash if not in U. """
+            hash_ = couple[1]
+            path_to_file = os.path.join(path, couple[0])
+            source = sources.get(hash_) if dedup else None
+            if sync and is_current(couple[0], path_to_file, hash_):
+                pass
+            elif source is not None:
+                _copy_file(source, path_to_file, dedup)
+            elif not u_dir.exists(hash_):
+                return hash_
+            else:
+                _copy_file(u_dir.get_path_for_key(hash_),
+                           path_to_file, link_mode)
+            if dedup and source is None:
+                sources[hash_] = path_to_file
+            return None
 
         unmatched = []
+        files = []
+        firsts = []         # indexes into files: first with each hash
+        repeats = []        # and the rest, if dedup
+        seen = set()        # hashes of the files in firsts, if dedup
+        names = {}          # in sync mode, dir path -> names of its nodes
         for couple in self:
+            if sync:
+                parent, _, name = couple[0].rpartition('/')
+                if parent:
+                    names[parent].add(name)
             if len(couple) == 1:
                 # it's a directory
                 dir_name = os.path.join(path, couple[0])
+                if sync:
+                    names[couple[0]] = set()
+                    if not os.path.isdir(dir_name) or \
+                            os.path.islink(dir_name):
+                        _remove(dir_name)
                 os.makedirs(dir_name, mode=0o755, exist_ok=True)
             elif len(couple) == 2:
-                hash_ = couple[1]
-                if not u_dir.exists(hash_):
-                    unmatched.append(hash_)
+                if jobs > 1:
+                    if dedup and couple[1] in seen:
+                        repeats.append(len(files))
+                    else:
+                        firsts.append(len(files))
+                        if dedup:
+                            seen.add(couple[1])
+                    files.append(couple)
                 else:
-                    data = u_dir.get_data(hash_)
-
-                    path_to_file = os.path.join(path, couple[0])
-                    with open(path_to_file, 'wb') as file:
-                        file.write(data)
+                    hash_ = restore(couple)
+                    if hash_ is not None:
+                        unmatched.append(hash_)
             else:
                 print("degenerate/malformed tuple of length %d" % len(couple))
 
+        if files:
+            # the first file with each hash is restored before any of
+            # the rest, which may be made from it; files are submitted
+            # a batch at a time to bound the futures pending
+            results = [None] * len(files)
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for indexes in (firsts, repeats):
+                    indexes = iter(indexes)
+                    while True:
+                        batch = list(islice(indexes, jobs * _RESTORE_BATCH))
+                        if not batch:
+                            break
+                        for ndx, hash_ in zip(batch, executor.map(
+                                restore, [files[ndx] for ndx in batch])):
+                            results[ndx] = hash_
+            unmatched.extend(hash_ for hash_ in results if hash_ is not None)
+
+        # in sync mode, delete whatever is not in the tree
+        for dir_path, dir_names in names.items():
+            with os.scandir(os.path.join(path, dir_path)) as entries:
+                extras = [entry.path for entry in entries
+                          if entry.name not in dir_names]
+            for extra in extras:
+                _remove(extra)
+
         return unmatched
 
     def save_to_u_dir(self, data_dir,
@@ -706,112 +2149,116 @@ class NLHTree(NLHNode):
         latter is a 2-tuple.
 
         The path to the listing file is NOT included in these relative
-        paths.
+        paths.  The listing, or stdin if path_to_file is '-', is read in
+        blocks of _READ_BLOCK bytes and split into lines, so it is never
+        held in memory as a whole.
         """
-        if not os.path.exists(path_to_file):
+        if path_to_file != '-' and not os.path.exists(path_to_file):
             raise NLHError('file not found: ' + path_to_file)
-        cur_depth = 0
-        path = ''
-        parts = []
-
-        with open(path_to_file, 'r') as file:
-            line = file.readline()
-            line_nbr = 0
-            while line:
-                done = False
-
-                # -- dir --------------------------------------------
-                match = NLHTree.DIR_LINE_RE.match(line)
-                if match:
-                    depth = len(match.group(1))
-                    dir_name = match.group(2)
-                    if depth == cur_depth:
-                        parts.append(dir_name)
-                        cur_depth += 1
-                    elif depth < cur_depth:
-                        parts[depth] = dir_name
-                        parts = parts[:depth + 1]
-                    else:
-                        raise NLHError("corrupt nlhTree listing")
-                    path = '/'.join(parts)
-
-                    yield (path, )
-                    done = True
-
-                # -- file -------------------------------------------
-                if not done:
-                    if hashtype == HashTypes.SHA1:
-                        match = NLHTree.FILE_LINE_RE_1.match(line)
-                    elif hashtype == HashTypes.SHA2:
-                        match = NLHTree.FILE_LINE_RE_2.match(line)
-                    elif hashtype == HashTypes.SHA3:
-                        match = NLHTree.FILE_LINE_RE_3.match(line)
-                    elif hashtype == HashTypes.BLAKE2B:
-                        match = NLHTree.FILE_LINE_RE_4.match(line)
-                    if match:
-                        cur_depth = len(match.group(1))
-                        file_name = match.group(2)
-                        hash_ = match.group(3)
-                        yield (os.path.join(path, file_name), hash_)
-                        done = True
-                    # DEBUG
-                    else:
-                        print("NO FILE LINE MATCH ON %s" % line)
-                    # END
-
-                line = file.readline()
-                line_nbr += 1
+        check_hashtype(hashtype)
+        return NLHTree._walk_strings(
+            NLHTree._read_lines(path_to_file), hashtype)
 
     @staticmethod
     def _walk_strings(strings, hashtype=HashTypes.SHA2):
-        cur_depth = 0
-        path = ''
-        parts = []
-
-        for line in strings:
-            done = False
+        # prefixes[k] is the path to the directory holding anything
+        # indented k + 1 spaces, followed by a slash
+        prefixes = []
+
+        for depth, name, hash_ in NLHTree._tokenize(strings, hashtype):
+            if depth > len(prefixes):
+                raise NLHError("corrupt nlhTree listing")
+            del prefixes[depth:]
+            path = prefixes[-1] + name if depth else name
+            if hash_ is None:
+                prefixes.append(path + '/')
+                yield (path, )
+            else:
+                yield (path, hash_)
 
-            # -- dir --------------------------------------------
-            match = NLHTree.DIR_LINE_RE.match(line)
-            if match:
-                depth = len(match.group(1))
-                dir_name = match.group(2)
-                if depth == cur_depth:
-                    parts.append(dir_name)
-                    cur_depth += 1
-                elif depth < cur_depth:
-                    parts[depth] = dir_name
-                    parts = parts[:depth + 1]
+    @staticmethod
+    def _diff_keys(path_to_file, hashtype):
+        """
+        Walk a listing, returning the name of its root and a generator
+        over the nodes below the root.  For each it yields a key and
+        the node's hex hash, None for a directory.  The key is the
+        path below the root as a tuple, so keys sort in the order in
+        which nodes appear in a listing; a key out of that order is
+        an error.
+        """
+        records = NLHTree.walk_file(path_to_file, hashtype)
+        root = next(records, None)
+        if root is None:
+            raise NLHParseError("empty listing: %s" % path_to_file)
+        if len(root) != 1:
+            raise NLHParseError(
+                "listing does not begin with a directory: %s" % path_to_file)
+
+        def keys():
+            prev = ()
+            for record in records:
+                key = tuple(record[0].split('/')[1:])
+                if key <= prev:
+                    raise NLHParseError(
+                        "%s out of order in %s" % (record[0], path_to_file))
+                prev = key
+                if len(record) == 1:
+                    yield key, None
                 else:
-                    raise NLHError("corrupt nlhTree listing")
-                path = '/'.join(parts)
+                    yield key, record[1].lower()
+        return root[0], keys()
 
-                yield (path, )
-                done = True
-
-            # -- file -------------------------------------------
-            if not done:
-                if hashtype == HashTypes.SHA1:
-                    match = NLHTree.FILE_LINE_RE_1.match(line)
-                elif hashtype == HashTypes.SHA2:
-                    match = NLHTree.FILE_LINE_RE_2.match(line)
-                elif hashtype == HashTypes.SHA3:
-                    match = NLHTree.FILE_LINE_RE_3.match(line)
-                elif hashtype == HashTypes.BLAKE2B:
-                    match = NLHTree.FILE_LINE_RE_4.match(line)
-                else:
-                    raise NotImplementedError()
-                if match:
-                    cur_depth = len(match.group(1))
-                    file_name = match.group(2)
-                    hash_ = match.group(3)
-                    yield (os.path.join(path, file_name), hash_)
-                done = True
+    @staticmethod
+    def diff_files(path_to_old, path_to_new, hashtype=HashTypes.SHA2):
+        """
+        Compare two serialized NLHTrees, the old listing and the new
+        one, without building either tree.  Each listing is read once,
+        front to back, so memory use does not depend on their size.
+        Either path may be '-' for stdin.
+
+        The differences are those NLHTree.diff() would report, in the
+        same order: 4-tuples of the relative path, beginning with the
+        name of the old tree; the kind of change, one of ADDED, REMOVED,
+        or MODIFIED; and the old and new hex hashes.
+        """
+        prefix, old_keys = NLHTree._diff_keys(path_to_old, hashtype)
+        _, new_keys = NLHTree._diff_keys(path_to_new, hashtype)
+        return NLHTree._merge_diff(prefix, old_keys, new_keys)
 
-            # -- error ------------------------------------------
-            if not done:
-                yield ("DUNNO WHAT THIS IS: %s" % line, )
-                done = True
+    @staticmethod
+    def _merge_diff(prefix, old_keys, new_keys):
+        """ Merge-join two sorted streams of keys from _diff_keys(). """
+
+        old = next(old_keys, None)
+        new = next(new_keys, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[0] < new[0]):
+                path = prefix + '/' + '/'.join(old[0])
+                yield (path, REMOVED, old[1], None)
+                old = next(old_keys, None)
+                continue
+            if old is None or new[0] < old[0]:
+                path = prefix + '/' + '/'.join(new[0])
+                yield (path, ADDED, None, new[1])
+                new = next(new_keys, None)
+                continue
+
+            # the same path in both listings; anything below a node
+            # whose type changed is present in only one of them
+            path = prefix + '/' + '/'.join(old[0])
+            old_hash = old[1]
+            new_hash = new[1]
+            if old_hash is None:
+                if new_hash is not None:
+                    yield (path, REMOVED, None, None)
+                    yield (path, ADDED, None, new_hash)
+            elif new_hash is None:
+                yield (path, REMOVED, old_hash, None)
+                yield (path, ADDED, None, None)
+            elif old_hash != new_hash:
+                yield (path, MODIFIED, old_hash, new_hash)
+            old = next(old_keys, None)
+            new = next(new_keys, None)
 
     @staticmethod
     def walk_string(string, hashtype=HashTypes.SHA2):
@@ -845,42 +2292,73 @@ class NLHTree(NLHNode):
     # ITERABLE ############################################
 
     def __iter__(self):
-        """ Return an iterator over the NLHTree. """
-
-        self._nn = -1
-        self._sub_tree = None
-        self._prefix = ''
-        return self
-
-    def __next__(self):
-        """ Iterator method. """
+        """
+        Return an iterator over the NLHTree.  This yields a 1-tuple
+        holding the relative path to each directory, beginning with
+        this one, and a 2-tuple holding the relative path to each file
+        and its hex hash, in the order in which they appear in a
+        listing.
+
+        The iterator keeps its own stack of the directories it is in,
+        so each step costs the same however deep the tree, and the
+        tree itself is not touched: any number of iterations, in any
+        number of threads, may be under way at once.
+        """
+        return self._walk()
 
-        # For the first call:
-        if self._nn < 0:
-            self._nn += 1
-            return (os.path.join(self._prefix, self._name), )
+    def _walk(self, binary=False):
+        """
+        Generator behind __iter__() and walk_bin(), which yields binary
+        rather than hex hashes if binary is set.
+        """
+        yield (self._name, )
+        # for each directory entered, the prefix for paths below it
+        # and an iterator over its nodes
+        stack = [(self._name + '/', iter(self._nodes))]
+        while stack:
+            prefix, nodes = stack[-1]
+            for node in nodes:
+                if isinstance(node, NLHLeaf):
+                    if binary:
+                        yield (prefix + node._name, node._bin_hash)
+                    else:
+                        yield (prefix + node._name, node.hex_hash)
+                else:
+                    path = prefix + node._name
+                    yield (path, )
+                    stack.append((path + '/', iter(node._nodes)))
+                    break
+            else:
+                stack.pop()
 
-        if self._nn >= len(self._nodes):
-            raise StopIteration
+    def walk_bin(self):
+        """
+        Iterate over the tree as __iter__() does, but yield each file's
+        binary hash rather than its hex hash, for callers which need
+        no hex.
+        """
+        return self._walk(True)
 
-        if self._sub_tree:
-            try:
-                couple = self._sub_tree.__next__()
-                return couple
-            except StopIteration:
-                self._sub_tree = None
-                self._nn += 1
-                if self._nn >= len(self._nodes):
-                    raise StopIteration
-
-        next_node = self._nodes[self._nn]
-        if isinstance(next_node, NLHLeaf):
-            self._nn += 1
-            return (os.path.join(self._prefix, self._name, next_node.name),
-                    next_node.hex_hash,)
-
-        self._sub_tree = next_node.__iter__()
-        self._sub_tree.prefix = os.path.join(self.prefix, self.name)
-        return self._sub_tree.__next__()
+    def walk_parts(self):
+        """
+        Iterate over the tree as walk_bin() does, but yield each path
+        as a tuple of names, beginning with the name of this tree,
+        rather than as a string.
+        """
+        parts = (self._name, )
+        yield (parts, )
+        stack = [(parts, iter(self._nodes))]
+        while stack:
+            parts, nodes = stack[-1]
+            for node in nodes:
+                if isinstance(node, NLHLeaf):
+                    yield (parts + (node._name, ), node._bin_hash)
+                else:
+                    sub_parts = parts + (node._name, )
+                    yield (sub_parts, )
+                    stack.append((sub_parts, iter(node._nodes)))
+                    break
+            else:
+                stack.pop()
 
     # END ITERABLE ########################################
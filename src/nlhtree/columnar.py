@@ -0,0 +1,413 @@
+# nlhtree_py/nlhtree/columnar.py
+
+"""
+NLHColumnarTree, a read-only NLHTree stored as columns of numbers.
+
+An NLHTree of tens of millions of nodes is too heavy to hold as Python
+objects, even slotted ones.  Here a tree is instead held in a handful
+of arrays, one entry per node in the order in which the nodes appear
+in a listing:
+
+    parents     the number of each node's parent, -1 for the root
+    ends        the number of the first node after each node's subtree
+    kinds       NLHB_DIR or NLHB_FILE
+    name_offs   where each node's name begins in one shared buffer of
+                UTF-8 names; the last entry marks the end of the buffer
+    hashes      the binary hashes, packed end to end at a fixed width,
+                zeroes for directories
+
+The nodes below a directory are the run of nodes following its own, and
+its children are found by hopping from one subtree end to the next.
+Nodes are only made as Python objects, NLHLeafs or further views onto
+the columns, when asked for.
+"""
+
+import binascii
+import fnmatch
+from array import array
+
+from xlattice import HashTypes, check_hashtype
+
+from nlhtree import (NLHTree, NLHLeaf, NLHError, NLHParseError, new_hash,
+                     MAGIC_RE, NLHB_DIR, NLHB_FILE)
+
+__all__ = ['NLHColumnarTree', ]
+
+
+class _Columns(object):
+    """ The arrays holding a whole tree, shared by views onto it. """
+
+    __slots__ = ('hashtype', 'hash_len', 'parents', 'ends', 'kinds',
+                 'name_offs', 'names', 'hashes', 'digests')
+
+    def __init__(self, hashtype):
+        self.hashtype = hashtype
+        self.hash_len = NLHTree._bin_hash_len(hashtype)
+        self.parents = array('i')
+        self.ends = array('I')
+        self.kinds = bytearray()
+        self.name_offs = array('Q', [0])
+        self.names = bytearray()
+        self.hashes = bytearray()
+        self.digests = {}       # node number -> digest, for directories
+
+    def add(self, parent, kind, name, bin_hash):
+        """ Append a node, returning its number. """
+        ndx = len(self.kinds)
+        self.parents.append(parent)
+        self.ends.append(ndx + 1)
+        self.kinds.append(kind)
+        self.names += name.encode('utf-8')
+        self.name_offs.append(len(self.names))
+        if bin_hash is None:
+            self.hashes += bytes(self.hash_len)
+        else:
+            self.hashes += bin_hash
+        return ndx
+
+    def name(self, ndx):
+        """ Return the name of node ndx. """
+        return self.names[self.name_offs[ndx]:
+                          self.name_offs[ndx + 1]].decode('utf-8')
+
+    def bin_hash(self, ndx):
+        """ Return the binary hash of node ndx. """
+        start = ndx * self.hash_len
+        return bytes(self.hashes[start:start + self.hash_len])
+
+    def children(self, ndx):
+        """ Yield the numbers of the nodes immediately below node ndx. """
+        end = self.ends[ndx]
+        child = ndx + 1
+        while child < end:
+            yield child
+            child = self.ends[child]
+
+
+class NLHColumnarTree(object):
+    """
+    A read-only NLHTree, or a subtree of one, held in columnar form.
+    It offers the same means of inspection as NLHTree (name, hashtype,
+    nodes, find, list, iteration, __str__, and the digests) and the
+    same operations against data directories and content-keyed stores.
+    It cannot be modified; use to_tree() for a tree which can be.
+    """
+
+    __slots__ = ('_columns', '_ndx', '_name')
+
+    def __init__(self, columns, ndx=0):
+        self._columns = columns
+        self._ndx = ndx
+        self._name = columns.name(ndx)
+
+    # CONSTRUCTION --------------------------------------------------
+
+    @staticmethod
+    def create_from_string_array(lines, hashtype=HashTypes.SHA2):
+        """
+        Build a columnar tree from the lines of a serialized NLHTree,
+        which may be any iterable over them.  No node objects are made,
+        so memory use is that of the columns themselves.
+        """
+        check_hashtype(hashtype)
+        lines = iter(lines)
+        first = next(lines, None)
+        if first is None:
+            return None
+        columns = _Columns(hashtype)
+        columns.add(-1, NLHB_DIR, NLHTree.parse_first_line(first), None)
+
+        stack = [0]             # the directories enclosing the next line
+        last_names = ['']       # the last name added in each of them
+        ends = columns.ends
+        for indent, name, hash_ in NLHTree._tokenize(lines, hashtype):
+            if indent > len(stack):
+                raise NLHError("IMPOSSIBLE: indent %d, depth %d" %
+                               (indent, len(stack) - 1))
+            while indent < len(stack):
+                ends[stack.pop()] = len(columns.kinds)
+                last_names.pop()
+            if name <= last_names[-1]:
+                if name == last_names[-1]:
+                    raise NLHParseError("duplicate name: '%s'" % name)
+                raise NLHParseError("name out of order: '%s' after '%s'" % (
+                    name, last_names[-1]))
+            last_names[-1] = name
+            if hash_ is None:
+                stack.append(columns.add(stack[-1], NLHB_DIR, name, None))
+                last_names.append('')
+            else:
+                # the tokenizer has checked the length of the hash
+                columns.add(stack[-1], NLHB_FILE, name,
+                            binascii.a2b_hex(hash_))
+        for ndx in stack:
+            ends[ndx] = len(columns.kinds)
+        return NLHColumnarTree(columns)
+
+    @staticmethod
+    def parse_file(path_to_file, hashtype):
+        """
+        Read a serialized NLHTree line by line into a columnar tree.
+        path_to_file is anything NLHTree.parse_file() accepts.
+        """
+        tree = NLHColumnarTree.create_from_string_array(
+            NLHTree._read_lines(path_to_file), hashtype)
+        if tree is None:
+            raise NLHParseError('cannot parse an empty listing')
+        return tree
+
+    @staticmethod
+    def parse(string, hashtype):
+        """ Parse a string, yielding an NLHColumnarTree. """
+        if not string:
+            raise NLHParseError('cannot parse an empty string')
+        strings = string.split('\n')
+        if strings[-1] == '':
+            strings = strings[:-1]
+        return NLHColumnarTree.create_from_string_array(strings, hashtype)
+
+    @staticmethod
+    def from_tree(tree):
+        """ Return a columnar copy of an NLHTree. """
+        columns = _Columns(tree.hashtype)
+
+        def add(sub_tree, parent):
+            ndx = columns.add(parent, NLHB_DIR, sub_tree.name, None)
+            for node in sub_tree.nodes:
+                if isinstance(node, NLHLeaf):
+                    columns.add(ndx, NLHB_FILE, node.name, node.bin_hash)
+                else:
+                    add(node, ndx)
+            columns.ends[ndx] = len(columns.kinds)
+        add(tree, -1)
+        return NLHColumnarTree(columns)
+
+    def to_tree(self):
+        """ Return a copy of this tree as an NLHTree. """
+        columns = self._columns
+        root = NLHTree(self._name, columns.hashtype)
+        trees = {self._ndx: root}
+        for ndx in range(self._ndx + 1, columns.ends[self._ndx]):
+            parent = trees[columns.parents[ndx]]
+            if columns.kinds[ndx] == NLHB_FILE:
+                parent._append(NLHLeaf(
+                    columns.name(ndx), columns.bin_hash(ndx),
+                    columns.hashtype))
+            else:
+                sub_tree = NLHTree(columns.name(ndx), columns.hashtype)
+                parent._append(sub_tree)
+                trees[ndx] = sub_tree
+        return root
+
+    # PROPERTIES ----------------------------------------------------
+
+    @property
+    def name(self):
+        """ Return the name of the tree. """
+        return self._name
+
+    @property
+    def hashtype(self):
+        """ Return the hashtype of the tree. """
+        return self._columns.hashtype
+
+    def _node(self, ndx):
+        """ Return node ndx as an NLHLeaf or an NLHColumnarTree. """
+        columns = self._columns
+        if columns.kinds[ndx] == NLHB_FILE:
+            return NLHLeaf(columns.name(ndx), columns.bin_hash(ndx),
+                           columns.hashtype)
+        return NLHColumnarTree(columns, ndx)
+
+    @property
+    def nodes(self):
+        """ Return a list of the nodes immediately below this tree node. """
+        return [self._node(ndx) for ndx in self._columns.children(self._ndx)]
+
+    @property
+    def bin_digest(self):
+        """
+        Return the binary Merkle digest of the tree, calculated as
+        NLHTree.bin_digest is.  Digests are cached.
+        """
+        return self._digest(self._ndx)
+
+    def _digest(self, ndx):
+        """ Return the digest of directory ndx. """
+        columns = self._columns
+        digest = columns.digests.get(ndx)
+        if digest is None:
+            sha = new_hash(columns.hashtype)
+            for child in columns.children(ndx):
+                sha.update(columns.names[columns.name_offs[child]:
+                                         columns.name_offs[child + 1]])
+                if columns.kinds[child] == NLHB_FILE:
+                    sha.update(b'\0F')
+                    sha.update(columns.bin_hash(child))
+                else:
+                    sha.update(b'\0D')
+                    sha.update(self._digest(child))
+            digest = sha.digest()
+            columns.digests[ndx] = digest
+        return digest
+
+    @property
+    def hex_digest(self):
+        """ Return the digest of the tree in hexadecimal. """
+        return str(binascii.b2a_hex(self.bin_digest), 'ascii')
+
+    def __eq__(self, other):
+        """
+        Whether this tree equals another, which may be an NLHTree or
+        another columnar tree: they must have the same name, hash type
+        and digest.  Other kinds of object, including mapped trees, are
+        left to compare themselves.
+        """
+        if not isinstance(other, (NLHTree, NLHColumnarTree)):
+            return NotImplemented
+        return self.name == other.name and \
+            self.hashtype == other.hashtype and \
+            self.bin_digest == other.bin_digest
+
+    # INSPECTION ----------------------------------------------------
+
+    def find(self, pat):
+        """
+        Return a list of nodes whose names match the pattern, a glob
+        as for NLHTree.find().  The list is sorted by node name.
+        """
+        columns = self._columns
+        if not MAGIC_RE.search(pat):
+            for ndx in columns.children(self._ndx):
+                name = columns.name(ndx)
+                if name == pat:
+                    return [self._node(ndx)]
+                if name > pat:
+                    break
+            return []
+        return [self._node(ndx) for ndx in columns.children(self._ndx)
+                if fnmatch.fnmatch(columns.name(ndx), pat)]
+
+    def get(self, rel_path):
+        """
+        Return the node at rel_path, a path below this tree such as
+        'subDir1/data11', or None if there is no such node.  An empty
+        path is this tree itself.  Each level is searched in turn.
+        """
+        node = self
+        for name in rel_path.strip('/').split('/'):
+            if not name:
+                continue
+            if not isinstance(node, NLHColumnarTree) or MAGIC_RE.search(name):
+                return None
+            found = node.find(name)
+            if not found:
+                return None
+            node = found[0]
+        return node
+
+    def __contains__(self, rel_path):
+        """ Whether there is a node at rel_path below this tree. """
+        return self.get(rel_path) is not None
+
+    def list(self, pat):
+        """
+        Return a sorted list of node names, marked as NLHTree.list()
+        marks them: '* ' before the name of a tree, two spaces before
+        the name of a leaf.
+        """
+        columns = self._columns
+        elm = []
+        for ndx in columns.children(self._ndx):
+            name = columns.name(ndx)
+            if fnmatch.fnmatch(name, pat):
+                if columns.kinds[ndx] == NLHB_FILE:
+                    elm.append('  ' + name)
+                else:
+                    elm.append('* ' + name)
+        return elm
+
+    def _walk(self):
+        """
+        Yield the number, depth, and path of each node in the tree,
+        the path beginning with the name of this tree.
+        """
+        columns = self._columns
+        parents = columns.parents
+        stack = [(self._ndx, self._name)]   # enclosing dirs and paths
+        yield self._ndx, 0, self._name
+        for ndx in range(self._ndx + 1, columns.ends[self._ndx]):
+            parent = parents[ndx]
+            while stack[-1][0] != parent:
+                stack.pop()
+            path = stack[-1][1] + '/' + columns.name(ndx)
+            yield ndx, len(stack), path
+            if columns.kinds[ndx] == NLHB_DIR:
+                stack.append((ndx, path))
+
+    def __iter__(self):
+        """
+        Yield what iterating over the corresponding NLHTree yields:
+        a 1-tuple holding the path to each directory and a 2-tuple
+        holding the path to each file and its hex hash.
+        """
+        columns = self._columns
+        for ndx, _, path in self._walk():
+            if columns.kinds[ndx] == NLHB_FILE:
+                yield (path, columns.bin_hash(ndx).hex())
+            else:
+                yield (path, )
+
+    def walk_bin(self):
+        """
+        Iterate over the tree as __iter__() does, but yield each file's
+        binary hash rather than its hex hash.
+        """
+        columns = self._columns
+        for ndx, _, path in self._walk():
+            if columns.kinds[ndx] == NLHB_FILE:
+                yield (path, columns.bin_hash(ndx))
+            else:
+                yield (path, )
+
+    def __str__(self):
+        return '\n'.join(self.iter_lines()) + '\n'
+
+    def iter_lines(self):
+        """
+        Yield the lines of the tree's listing, without line terminators,
+        one at a time.
+        """
+        columns = self._columns
+        indents = ['']
+        for ndx, depth, _ in self._walk():
+            if depth == len(indents):
+                indents.append(' ' * depth)
+            if columns.kinds[ndx] == NLHB_FILE:
+                yield indents[depth] + columns.name(ndx) + ' ' + \
+                    columns.bin_hash(ndx).hex()
+            else:
+                yield indents[depth] + columns.name(ndx)
+
+    def to_strings(self, strings, indent=0):
+        """ Append the lines of the tree's listing to strings. """
+        columns = self._columns
+        for ndx, depth, _ in self._walk():
+            name = columns.name(ndx)
+            if columns.kinds[ndx] == NLHB_FILE:
+                strings.append('%s%s %s' % (
+                    ' ' * (indent + depth), name,
+                    str(binascii.b2a_hex(columns.bin_hash(ndx)), 'ascii')))
+            else:
+                strings.append(' ' * (indent + depth) + name)
+
+    # operations shared with NLHTree, which need no more than
+    # iteration, walk_bin(), iter_lines(), name, and hashtype
+    check_in_data_dir = NLHTree.check_in_data_dir
+    verify_data_dir = NLHTree.verify_data_dir
+    _verify_data_dir = NLHTree._verify_data_dir
+    check_in_u_dir = NLHTree.check_in_u_dir
+    drop_from_u_dir = NLHTree.drop_from_u_dir
+    populate_data_dir = NLHTree.populate_data_dir
+    save_to_u_dir = NLHTree.save_to_u_dir
+    write_to = NLHTree.write_to
@@ -0,0 +1,435 @@
+# nlhtree_py/nlhtree/mapped.py
+
+"""
+NLHMappedTree, a read-only NLHTree held in a memory-mapped file.
+
+The file (conventionally .nlhm) holds a fixed-size record for each node
+in the order in which the nodes appear in a listing, a table of node
+numbers sorted by path, and the paths themselves.  Looking up one path
+is a binary search over the sorted table, and the nodes below a
+directory are the records following its own, so either touches only
+the pages it needs rather than the whole file.
+
+A file is laid out as:
+
+    header      magic, version, hash type, length of the root's name,
+                number of nodes, and the offsets of the tables below
+    root name   UTF-8
+    nodes       one record per node: the offset and length of its path,
+                the number of the first node after its subtree, its
+                kind, and its binary hash (zeroes for a directory)
+    index       node numbers, sorted by path
+    paths       the path of each node below the root, UTF-8, each
+                beginning with a slash; the root's path is empty
+
+Integers are little-endian.
+"""
+
+import fnmatch
+import mmap
+import struct
+
+from xlattice import HashTypes
+
+from nlhtree import (NLHTree, NLHLeaf, NLHParseError, new_hash,
+                     MAGIC_RE, NLHB_DIR, NLHB_FILE)
+from nlhtree.columnar import NLHColumnarTree
+
+__all__ = ['NLHM_MAGIC', 'NLHM_VERSION', 'NLHMappedTree', ]
+
+NLHM_MAGIC = b'NLHM'
+NLHM_VERSION = 1
+_NLHM_HEADER = struct.Struct('<4sBBHIQQQ')
+_NLHM_NODE = struct.Struct('<QIIB')     # + the binary hash
+_NLHM_INDEX = struct.Struct('<I')
+
+
+class NLHMappedTree(object):
+    """
+    A read-only NLHTree, or a subtree of one, backed by a memory-mapped
+    file.  It offers the same means of inspection as NLHTree (name,
+    hashtype, nodes, find, list, iteration, __str__, and the digests)
+    and the same operations against data directories and content-keyed
+    stores; get() finds a single node by its path below the tree.  It
+    cannot be modified; use to_tree() for a tree which can be.
+    """
+
+    def __init__(self, path_to_file):
+        with open(path_to_file, 'rb') as file:
+            try:
+                self._map = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise NLHParseError(
+                    'empty mapped listing: %s' % path_to_file)
+        try:
+            self._read_header()
+        except (struct.error, ValueError, UnicodeDecodeError):
+            self._map.close()
+            raise NLHParseError(
+                'not a mapped listing: %s' % path_to_file)
+        except NLHParseError:
+            self._map.close()
+            raise
+        self._ndx = 0               # the node at the top of this view
+        self._end = self._count     # one past the last node in the view
+        self._path = b''            # path of the top node, for lookups
+        self._digests = {}          # node number -> digest, shared by views
+
+    def _read_header(self):
+        """ Check the header and set up access to the tables. """
+
+        (magic, version, hashtype, name_len, self._count,
+         self._nodes_off, self._index_off, self._paths_off) = \
+            _NLHM_HEADER.unpack_from(self._map)
+        if magic != NLHM_MAGIC:
+            raise NLHParseError('bad magic number')
+        if version != NLHM_VERSION:
+            raise NLHParseError(
+                'unsupported mapped listing version %d' % version)
+        self._hashtype = HashTypes(hashtype)
+        self._hash_len = NLHTree._bin_hash_len(self._hashtype)
+        self._node_size = _NLHM_NODE.size + self._hash_len
+        start = _NLHM_HEADER.size
+        self._name = str(self._map[start:start + name_len], 'utf-8')
+        if self._count < 1 or \
+                self._paths_off > len(self._map) or \
+                self._index_off + self._count * _NLHM_INDEX.size > \
+                self._paths_off or \
+                self._nodes_off + self._count * self._node_size > \
+                self._index_off:
+            raise NLHParseError('mapped listing truncated')
+
+    @staticmethod
+    def write(tree, path_to_file):
+        """ Write an NLHTree to a file in the mapped listing format. """
+
+        hash_len = NLHTree._bin_hash_len(tree.hashtype)
+        no_hash = bytes(hash_len)
+        paths = [b'']
+        kinds = [NLHB_DIR]
+        hashes = [no_hash]
+        ends = [0]
+
+        def add(sub_tree, prefix):
+            for node in sub_tree.nodes:
+                path = prefix + b'/' + node.name.encode('utf-8')
+                ndx = len(paths)
+                paths.append(path)
+                ends.append(ndx + 1)
+                if isinstance(node, NLHLeaf):
+                    kinds.append(NLHB_FILE)
+                    hashes.append(node.bin_hash)
+                else:
+                    kinds.append(NLHB_DIR)
+                    hashes.append(no_hash)
+                    add(node, path)
+                    ends[ndx] = len(paths)
+        add(tree, b'')
+        ends[0] = len(paths)
+        count = len(paths)
+
+        name = tree.name.encode('utf-8')
+        nodes_off = _NLHM_HEADER.size + len(name)
+        index_off = nodes_off + count * (_NLHM_NODE.size + hash_len)
+        paths_off = index_off + count * _NLHM_INDEX.size
+
+        with open(path_to_file, 'wb') as file:
+            file.write(_NLHM_HEADER.pack(
+                NLHM_MAGIC, NLHM_VERSION, tree.hashtype.value, len(name),
+                count, nodes_off, index_off, paths_off))
+            file.write(name)
+            path_off = 0
+            for ndx in range(count):
+                file.write(_NLHM_NODE.pack(
+                    path_off, len(paths[ndx]), ends[ndx], kinds[ndx]))
+                file.write(hashes[ndx])
+                path_off += len(paths[ndx])
+            order = sorted(range(count), key=paths.__getitem__)
+            file.write(struct.pack('<%dI' % count, *order))
+            for path in paths:
+                file.write(path)
+
+    def close(self):
+        """ Unmap the file.  Views onto subtrees become unusable. """
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # PROPERTIES ----------------------------------------------------
+
+    @property
+    def name(self):
+        """ Return the name of the tree. """
+        return self._name
+
+    @property
+    def hashtype(self):
+        """ Return the hashtype of the tree. """
+        return self._hashtype
+
+    def __len__(self):
+        """ Return the number of nodes, including this one. """
+        return self._end - self._ndx
+
+    # ACCESS TO NODES -----------------------------------------------
+
+    def _node(self, ndx):
+        """
+        Return the path, the number of the first node after the
+        subtree, the kind, and the hash of the node numbered ndx.
+        """
+        offset = self._nodes_off + ndx * self._node_size
+        path_off, path_len, end, kind = _NLHM_NODE.unpack_from(
+            self._map, offset)
+        start = self._paths_off + path_off
+        offset += _NLHM_NODE.size
+        return (self._map[start:start + path_len], end, kind,
+                self._map[offset:offset + self._hash_len])
+
+    def _find(self, path):
+        """
+        Return the number of the node with this path, or -1 if there
+        is none.  This is a binary search over the sorted index.
+        """
+        low = 0
+        high = self._count
+        while low < high:
+            mid = (low + high) // 2
+            ndx = _NLHM_INDEX.unpack_from(
+                self._map, self._index_off + mid * _NLHM_INDEX.size)[0]
+            mid_path = self._node(ndx)[0]
+            if mid_path < path:
+                low = mid + 1
+            elif mid_path > path:
+                high = mid
+            else:
+                return ndx
+        return -1
+
+    def _children(self, ndx):
+        """ Yield the numbers of the nodes immediately below node ndx. """
+        end = self._node(ndx)[1]
+        child = ndx + 1
+        while child < end:
+            yield child
+            child = self._node(child)[1]
+
+    def _make_node(self, ndx):
+        """ Return node ndx as an NLHLeaf or an NLHMappedTree. """
+        path, end, kind, bin_hash = self._node(ndx)
+        name = str(path.rpartition(b'/')[2], 'utf-8')
+        if kind == NLHB_FILE:
+            return NLHLeaf(name, bin_hash, self._hashtype)
+        return self._view(ndx, name, path, end)
+
+    def _view(self, ndx, name, path, end):
+        """ Return a view onto the subtree whose top is node ndx. """
+        view = NLHMappedTree.__new__(NLHMappedTree)
+        view.__dict__.update(self.__dict__)
+        view._ndx = ndx
+        view._end = end
+        view._name = name
+        view._path = path
+        return view
+
+    def get(self, rel_path):
+        """
+        Return the node at rel_path, a path below this tree such as
+        'subDir1/data11': an NLHLeaf for a file, an NLHMappedTree for a
+        directory, or None if there is no such node.
+        """
+        rel_path = rel_path.strip('/')
+        if not rel_path:
+            return self
+        path = self._path + b'/' + rel_path.encode('utf-8')
+        ndx = self._find(path)
+        if ndx < 0:
+            return None
+        return self._make_node(ndx)
+
+    def __contains__(self, rel_path):
+        """ Whether there is a node at rel_path below this tree. """
+        rel_path = rel_path.strip('/')
+        if not rel_path:
+            return True
+        return self._find(
+            self._path + b'/' + rel_path.encode('utf-8')) >= 0
+
+    @property
+    def nodes(self):
+        """ Return a list of the nodes immediately below this tree node. """
+        return [self._make_node(ndx) for ndx in self._children(self._ndx)]
+
+    def find(self, pat):
+        """
+        Return a list of nodes whose names match the pattern, a glob
+        as for NLHTree.find().  The list is sorted by node name.  A
+        name without wildcards is looked up in the sorted index.
+        """
+        if not MAGIC_RE.search(pat):
+            if '/' in pat:
+                return []
+            ndx = self._find(self._path + b'/' + pat.encode('utf-8'))
+            if ndx < 0:
+                return []
+            return [self._make_node(ndx)]
+        return [node for node in self.nodes
+                if fnmatch.fnmatch(node.name, pat)]
+
+    def list(self, pat):
+        """
+        Return a sorted list of node names, marked as NLHTree.list()
+        marks them: '* ' before the name of a tree, two spaces before
+        the name of a leaf.
+        """
+        elm = []
+        for ndx in self._children(self._ndx):
+            path, _, kind, _ = self._node(ndx)
+            name = str(path.rpartition(b'/')[2], 'utf-8')
+            if fnmatch.fnmatch(name, pat):
+                if kind == NLHB_FILE:
+                    elm.append('  ' + name)
+                else:
+                    elm.append('* ' + name)
+        return elm
+
+    # DIGESTS -------------------------------------------------------
+
+    @property
+    def bin_digest(self):
+        """
+        Return the binary Merkle digest of the tree, calculated as
+        NLHTree.bin_digest is.  Digests are cached.
+        """
+        return self._digest(self._ndx)
+
+    def _digest(self, ndx):
+        """ Return the digest of directory ndx. """
+        digest = self._digests.get(ndx)
+        if digest is None:
+            sha = new_hash(self._hashtype)
+            for child in self._children(ndx):
+                path, _, kind, bin_hash = self._node(child)
+                sha.update(path.rpartition(b'/')[2])
+                if kind == NLHB_FILE:
+                    sha.update(b'\0F')
+                    sha.update(bin_hash)
+                else:
+                    sha.update(b'\0D')
+                    sha.update(self._digest(child))
+            digest = sha.digest()
+            self._digests[ndx] = digest
+        return digest
+
+    @property
+    def hex_digest(self):
+        """ Return the digest of the tree in hexadecimal. """
+        return self.bin_digest.hex()
+
+    def __eq__(self, other):
+        """
+        Whether this tree equals another, which may be an NLHTree, a
+        columnar tree, or another mapped tree: they must have the same
+        name, hash type and digest.
+        """
+        if not isinstance(other,
+                          (NLHTree, NLHColumnarTree, NLHMappedTree)):
+            return NotImplemented
+        return self.name == other.name and \
+            self.hashtype == other.hashtype and \
+            self.bin_digest == other.bin_digest
+
+    # ITERATION AND SERIALIZATION -----------------------------------
+
+    def __iter__(self):
+        """
+        Yield what iterating over the corresponding NLHTree yields:
+        a 1-tuple holding the path to each directory and a 2-tuple
+        holding the path to each file and its hex hash, the paths
+        beginning with the name of this tree.  Only the records for
+        nodes in this tree are read.
+        """
+        for couple in self.walk_bin():
+            if len(couple) == 2:
+                yield (couple[0], couple[1].hex())
+            else:
+                yield couple
+
+    def walk_bin(self):
+        """
+        Iterate over the tree as __iter__() does, but yield each file's
+        binary hash rather than its hex hash.
+        """
+        skip = len(self._path)
+        prefix = self._name
+        for ndx in range(self._ndx, self._end):
+            path, _, kind, bin_hash = self._node(ndx)
+            path = prefix + str(path[skip:], 'utf-8')
+            if kind == NLHB_FILE:
+                yield (path, bin_hash)
+            else:
+                yield (path, )
+
+    def __str__(self):
+        return '\n'.join(self.iter_lines()) + '\n'
+
+    def iter_lines(self):
+        """
+        Yield the lines of the tree's listing, without line terminators,
+        one at a time.  Only the records for nodes in this tree are read.
+        """
+        skip = len(self._path)
+        indents = ['']
+        yield self._name
+        for ndx in range(self._ndx + 1, self._end):
+            path, _, kind, bin_hash = self._node(ndx)
+            head, _, name = path[skip:].rpartition(b'/')
+            depth = head.count(b'/') + 1
+            if depth == len(indents):
+                indents.append(' ' * depth)
+            if kind == NLHB_FILE:
+                yield indents[depth] + str(name, 'utf-8') + ' ' + \
+                    bin_hash.hex()
+            else:
+                yield indents[depth] + str(name, 'utf-8')
+
+    def to_strings(self, strings, indent=0):
+        """ Append the lines of the tree's listing to strings. """
+        spaces = ' ' * indent
+        for line in self.iter_lines():
+            strings.append(spaces + line)
+
+    def to_tree(self):
+        """ Return a copy of this tree as an NLHTree. """
+        skip = len(self._path)
+        root = NLHTree(self._name, self._hashtype)
+        stack = [root]
+        for ndx in range(self._ndx + 1, self._end):
+            path, _, kind, bin_hash = self._node(ndx)
+            parts = str(path[skip:], 'utf-8').split('/')
+            del stack[len(parts) - 1:]
+            if kind == NLHB_FILE:
+                stack[-1]._append(
+                    NLHLeaf(parts[-1], bin_hash, self._hashtype))
+            else:
+                sub_tree = NLHTree(parts[-1], self._hashtype)
+                stack[-1]._append(sub_tree)
+                stack.append(sub_tree)
+        return root
+
+    # operations shared with NLHTree, which need no more than
+    # iteration, walk_bin(), iter_lines(), name, and hashtype
+    check_in_data_dir = NLHTree.check_in_data_dir
+    verify_data_dir = NLHTree.verify_data_dir
+    _verify_data_dir = NLHTree._verify_data_dir
+    check_in_u_dir = NLHTree.check_in_u_dir
+    drop_from_u_dir = NLHTree.drop_from_u_dir
+    populate_data_dir = NLHTree.populate_data_dir
+    save_to_u_dir = NLHTree.save_to_u_dir
+    write_to = NLHTree.write_to
+
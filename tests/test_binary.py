@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# test_binary.py
+
+""" Test the binary listing format. """
+
+import os
+import struct
+import unittest
+
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf, NLHParseError, NLHB_MAGIC
+
+
+class TestBinary(unittest.TestCase):
+    """ Test the binary listing format. """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def do_test_round_trip(self, hashtype):
+        """
+        Convert the example listing for a specific hash type to the
+        binary format and back, verifying that nothing is lost.
+        """
+        check_hashtype(hashtype)
+        if hashtype == HashTypes.SHA1:
+            rel_path_to_nlh = 'example1/example.nlh'
+        elif hashtype == HashTypes.SHA2:
+            rel_path_to_nlh = 'example2/example.nlh'
+        elif hashtype == HashTypes.SHA3:
+            rel_path_to_nlh = 'example3/example.nlh'
+        elif hashtype == HashTypes.BLAKE2B:
+            rel_path_to_nlh = 'example4/example.nlh'
+        else:
+            raise NotImplementedError
+
+        with open(rel_path_to_nlh, 'r') as file:
+            listing = file.read()
+        tree = NLHTree.parse(listing, hashtype)
+
+        data = tree.to_binary()
+        self.assertTrue(data.startswith(NLHB_MAGIC))
+        self.assertEqual(data[5], hashtype.value)
+        copy = NLHTree.from_binary(data)
+        self.assertEqual(copy, tree)
+        self.assertEqual(copy.hashtype, hashtype)
+        self.assertEqual(copy.__str__(), listing)
+        self.assertEqual(copy.to_binary(), data)
+
+        # the copy can be modified like any other tree
+        copy.insert(NLHLeaf('data0', tree.nodes[0].bin_hash, hashtype))
+        self.assertEqual(copy.nodes[0].name, 'data0')
+        self.assertNotEqual(copy, tree)
+
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+        path_to_file = os.path.join('tmp', 'example%d.nlhb' % hashtype.value)
+        tree.to_binary_file(path_to_file)
+        self.assertEqual(NLHTree.from_binary_file(path_to_file), tree)
+
+    def test_round_trip(self):
+        """ Convert the example listings for all hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_round_trip(hashtype)
+
+    def test_empty_tree(self):
+        """ A tree without nodes survives the round trip. """
+
+        tree = NLHTree('empty', HashTypes.SHA2)
+        copy = NLHTree.from_binary(tree.to_binary())
+        self.assertEqual(copy.name, 'empty')
+        self.assertEqual(copy.nodes, [])
+
+    def test_bad_data(self):
+        """ Malformed binary listings are rejected. """
+
+        hashtype = HashTypes.SHA1
+        tree = NLHTree('dataDir', hashtype)
+        tree.insert(NLHLeaf('a', b'\x01' * 20, hashtype))
+        tree.insert(NLHLeaf('b', b'\x02' * 20, hashtype))
+        data = tree.to_binary()
+
+        bad = [b'',                                 # empty
+               b'NLHX' + data[4:],                  # bad magic
+               data[:4] + b'\x09' + data[5:],       # unknown version
+               data[:5] + b'\x63' + data[6:],       # unknown hash type
+               data[:-1],                           # truncated
+               data + b'\x00',                      # trailing data
+               data.replace(b'\x00b', b'\x00a'),    # duplicate name
+               ]
+        # the children out of order
+        record_len = struct.calcsize('<BH') + 1 + 20
+        first = data[-2 * record_len:-record_len]
+        second = data[-record_len:]
+        bad.append(data[:-2 * record_len] + second + first)
+
+        for data in bad:
+            with self.assertRaises(NLHParseError):
+                NLHTree.from_binary(data)
+
+    def test_bad_names(self):
+        """
+        Names which a text listing could not hold are rejected, so that
+        none can lead outside the tree and every binary listing read
+        can be written as text.
+        """
+        hashtype = HashTypes.SHA1
+        for name in ['../../escaped', 'a/b', 'bad name', 'é', '..', '.']:
+            tree = NLHTree('dataDir', hashtype)
+            tree.insert(NLHLeaf(name, b'\x01' * 20, hashtype))
+            with self.assertRaises(NLHParseError):
+                NLHTree.from_binary(tree.to_binary())
+            tree = NLHTree('dataDir', hashtype)
+            tree.insert(NLHTree(name, hashtype))
+            with self.assertRaises(NLHParseError):
+                NLHTree.from_binary(tree.to_binary())
+        for name in ['..', 'sub:dir', '']:
+            with self.assertRaises(NLHParseError):
+                NLHTree.from_binary(NLHTree(name, hashtype).to_binary())
+
+        # only a file's name may hold a colon, as in a text listing
+        tree = NLHTree('dataDir', hashtype)
+        tree.insert(NLHLeaf('a:b', b'\x01' * 20, hashtype))
+        copy = NLHTree.from_binary(tree.to_binary())
+        self.assertEqual(NLHTree.parse(copy.__str__(), hashtype), tree)
+
+    def test_is_binary_listing(self):
+        """
+        Binary listings are recognized by their header, and text
+        listings are not, whatever their root directory is called.
+        """
+        hashtype = HashTypes.SHA2
+        tree = NLHTree('NLHBackups', hashtype)
+        tree.insert(NLHLeaf('a', b'\x01' * 32, hashtype))
+        self.assertTrue(NLHTree.is_binary_listing(tree.to_binary()))
+        listing = tree.__str__().encode('utf-8')
+        self.assertTrue(listing.startswith(NLHB_MAGIC))
+        self.assertFalse(NLHTree.is_binary_listing(listing))
+        self.assertFalse(NLHTree.is_binary_listing(b''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# test_columnar.py
+
+""" Test NLHColumnarTree, the columnar form of NLHTree. """
+
+import os
+import shutil
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf, NLHParseError
+from nlhtree.columnar import NLHColumnarTree
+from tree_helpers import make_tree
+
+
+class TestColumnar(unittest.TestCase):
+    """ Test NLHColumnarTree, the columnar form of NLHTree. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def tearDown(self):
+        pass
+
+    def check_same(self, columnar, tree):
+        """ Verify that a columnar tree presents an NLHTree faithfully. """
+
+        self.assertEqual(columnar.name, tree.name)
+        self.assertEqual(columnar.hashtype, tree.hashtype)
+        self.assertEqual(columnar.bin_digest, tree.bin_digest)
+        self.assertEqual(columnar.hex_digest, tree.hex_digest)
+        self.assertEqual(columnar, tree)
+        self.assertEqual(tree, columnar)
+        self.assertEqual(columnar.__str__(), tree.__str__())
+        self.assertEqual(list(columnar), list(tree))
+        self.assertEqual(columnar.list('*'), tree.list('*'))
+        self.assertEqual(len(columnar.nodes), len(tree.nodes))
+        for col_node, node in zip(columnar.nodes, tree.nodes):
+            if isinstance(node, NLHLeaf):
+                self.assertEqual(col_node, node)
+                self.assertEqual(columnar.find(node.name), [node])
+            else:
+                self.assertTrue(isinstance(col_node, NLHColumnarTree))
+                self.assertEqual(col_node.name, node.name)
+                self.assertEqual(list(col_node), list(node))
+                found = columnar.find(node.name)
+                self.assertEqual(len(found), 1)
+                self.assertEqual(found[0], node)
+        self.assertEqual(columnar.to_tree(), tree)
+
+    def do_test_example(self, hashtype):
+        """ Check the example listing for a specific hash type. """
+
+        check_hashtype(hashtype)
+        if hashtype == HashTypes.SHA1:
+            example = 'example1'
+        elif hashtype == HashTypes.SHA2:
+            example = 'example2'
+        elif hashtype == HashTypes.SHA3:
+            example = 'example3'
+        elif hashtype == HashTypes.BLAKE2B:
+            example = 'example4'
+        else:
+            raise NotImplementedError
+        path_to_nlh = os.path.join(example, 'example.nlh')
+        tree = NLHTree.parse_file(path_to_nlh, hashtype)
+        columnar = NLHColumnarTree.parse_file(path_to_nlh, hashtype)
+        self.check_same(columnar, tree)
+        self.check_same(NLHColumnarTree.from_tree(tree), tree)
+
+        self.assertEqual(columnar.find('sub*'), tree.find('sub*'))
+        self.assertEqual(columnar.find('nothing'), [])
+        self.assertEqual(columnar.list('data*'), tree.list('data*'))
+
+        # operations on data directories and stores
+        data_dir = os.path.join(example, 'dataDir')
+        self.assertEqual(columnar.check_in_data_dir(data_dir), [])
+        target = os.path.join('tmp', 'columnar%d' % hashtype.value)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        u_path = os.path.join(target, 'uDir')
+        os.makedirs(os.path.join(u_path, 'in'))
+        os.makedirs(os.path.join(u_path, 'tmp'))
+        self.assertEqual(columnar.save_to_u_dir(data_dir, u_path), [])
+        self.assertEqual(columnar.check_in_u_dir(u_path), [])
+        self.assertEqual(columnar.populate_data_dir(u_path, target), [])
+        self.assertEqual(
+            NLHTree.create_from_file_system(
+                os.path.join(target, 'dataDir'), hashtype), tree)
+
+    def test_example(self):
+        """ Check the example listings for all hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_example(hashtype)
+
+    def test_random_trees(self):
+        """ Check quasi-random trees for all hash types. """
+
+        for hashtype in HashTypes:
+            tree = make_tree(self.rng, 'dataDir', hashtype, 4, 6)
+            self.check_same(
+                NLHColumnarTree.parse(tree.__str__(), hashtype), tree)
+            self.check_same(NLHColumnarTree.from_tree(tree), tree)
+
+    def test_equality(self):
+        """ Trees compare the same way whichever is on the left. """
+
+        hashtype = HashTypes.SHA2
+        tree = make_tree(self.rng, 'dataDir', hashtype, 3, 5)
+        other = tree.clone()
+        other.insert(NLHLeaf('zzz_extra', bytes(32), hashtype))
+        columnar = NLHColumnarTree.from_tree(tree)
+        for left, right in [(tree, columnar), (columnar, tree),
+                            (columnar, NLHColumnarTree.from_tree(tree))]:
+            self.assertTrue(left == right)
+            self.assertFalse(left != right)
+        for left, right in [(other, columnar), (columnar, other),
+                            (NLHColumnarTree.from_tree(other), tree),
+                            (tree, NLHColumnarTree.from_tree(other))]:
+            self.assertFalse(left == right)
+            self.assertTrue(left != right)
+        self.assertNotEqual(columnar, None)
+        self.assertNotEqual(tree, None)
+        self.assertNotEqual(columnar, 'dataDir')
+
+    def test_bad_listings(self):
+        """ Listings which are out of order are rejected. """
+
+        hash_ = '0' * 64
+        for listing in ['dataDir\n b %s\n a %s\n' % (hash_, hash_),
+                        'dataDir\n a %s\n a\n' % hash_,
+                        'dataDir\n a %s\n' % ('0' * 40)]:
+            with self.assertRaises(NLHParseError):
+                NLHColumnarTree.parse(listing, HashTypes.SHA2)
+        with self.assertRaises(NLHParseError):
+            NLHColumnarTree.parse('', HashTypes.SHA2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# test_diff.py
+
+""" Test comparison of NLHTrees with NLHTree.diff(). """
+
+import time
+import unittest
+from unittest import mock
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf, ADDED, REMOVED, MODIFIED
+from tree_helpers import random_hash, make_tree
+
+
+class TestDiff(unittest.TestCase):
+    """ Test comparison of NLHTrees with NLHTree.diff(). """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def tearDown(self):
+        pass
+
+    # utility functions #############################################
+
+    @staticmethod
+    def expected_diff(old, new):
+        """
+        Work out the differences between two trees the slow way, by
+        iterating over both.
+        """
+        old_map = {}
+        new_map = {}
+        for mapping, tree in [(old_map, old), (new_map, new)]:
+            for couple in tree:
+                path = couple[0].partition('/')[2]
+                if path:
+                    mapping[path] = couple[1] if len(couple) == 2 else None
+
+        def is_dir(mapping, path):
+            return mapping[path] is None
+
+        changes = []
+        for path in set(old_map) | set(new_map):
+            key = tuple(path.split('/'))
+            full = old.name + '/' + path
+            if path not in new_map:
+                changes.append((key, 0, (full, REMOVED, old_map[path], None)))
+            elif path not in old_map:
+                changes.append((key, 1, (full, ADDED, None, new_map[path])))
+            elif is_dir(old_map, path) != is_dir(new_map, path):
+                changes.append((key, 0, (full, REMOVED, old_map[path], None)))
+                changes.append((key, 1, (full, ADDED, None, new_map[path])))
+            elif old_map[path] != new_map[path]:
+                changes.append((key, 0, (full, MODIFIED,
+                                         old_map[path], new_map[path])))
+        return [change[2] for change in sorted(changes)]
+
+    @staticmethod
+    def sub_trees(tree):
+        """ Return a list of all the trees below tree, in order. """
+        trees = []
+        for node in tree.nodes:
+            if isinstance(node, NLHTree):
+                trees.append(node)
+                trees.extend(TestDiff.sub_trees(node))
+        return trees
+
+    # unit tests ####################################################
+
+    def do_test_diff(self, hashtype):
+        """ Compare randomly modified trees using a specific hash type. """
+
+        check_hashtype(hashtype)
+        old = make_tree(self.rng, 'dataDir', hashtype, 4, 6)
+        self.assertEqual(list(old.diff(old)), [])
+        self.assertEqual(list(old.diff(old.clone())), [])
+
+        for _ in range(8):
+            new = old.clone()
+            trees = [new] + self.sub_trees(new)
+            for _ in range(1 + self.rng.next_int16(4)):
+                tree = trees[self.rng.next_int16(len(trees))]
+                choice = self.rng.next_int16(4)
+                if choice == 0 and tree.nodes:
+                    # delete a node
+                    victim = tree.nodes[self.rng.next_int16(len(tree.nodes))]
+                    tree.delete(victim.name)
+                    trees = [new] + self.sub_trees(new)
+                elif choice == 1 and tree.nodes:
+                    # replace a node with a leaf or a tree
+                    victim = tree.nodes[self.rng.next_int16(len(tree.nodes))]
+                    tree.delete(victim.name)
+                    if isinstance(victim, NLHLeaf):
+                        tree.insert(make_tree(
+                            self.rng, victim.name, hashtype, 2, 3))
+                    else:
+                        tree.insert(NLHLeaf(
+                            victim.name, random_hash(self.rng, hashtype),
+                            hashtype))
+                    trees = [new] + self.sub_trees(new)
+                else:
+                    # add a leaf
+                    name = self.rng.next_file_name(8)
+                    if not tree.find(name):
+                        tree.insert(NLHLeaf(
+                            name, random_hash(self.rng, hashtype), hashtype))
+
+            changes = list(old.diff(new))
+            self.assertEqual(changes, self.expected_diff(old, new))
+            self.assertEqual(len(changes) == 0, old == new)
+            reverse = list(new.diff(old))
+            self.assertEqual(reverse, self.expected_diff(new, old))
+
+    def test_diff(self):
+        """ Compare randomly modified trees using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_diff(hashtype)
+
+    def test_pruning(self):
+        """
+        Verify that diff() only descends into subtrees which differ.
+        """
+        hashtype = HashTypes.SHA2
+        old = NLHTree('dataDir', hashtype)
+        deepest = old
+        for level in range(4):
+            for ndx in range(10):
+                deepest.insert(make_tree(
+                    self.rng, 'sub%d%d' % (level, ndx), hashtype, 3, 5))
+            sub = NLHTree('zSub%d' % level, hashtype)
+            deepest.insert(sub)
+            deepest = sub
+        deepest.insert(NLHLeaf(
+            'leaf', random_hash(self.rng, hashtype), hashtype))
+
+        new = old.clone()
+        sub = new
+        for level in range(4):
+            sub = sub.find('zSub%d' % level)[0]
+        sub.delete('leaf')
+        sub.insert(NLHLeaf(
+            'leaf', random_hash(self.rng, hashtype), hashtype))
+
+        original = NLHTree._diff
+        with mock.patch.object(NLHTree, '_diff', autospec=True,
+                               side_effect=original) as spy:
+            changes = list(old.diff(new))
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0][0],
+                         'dataDir/zSub0/zSub1/zSub2/zSub3/leaf')
+        self.assertEqual(changes[0][1], MODIFIED)
+        # one call per level, and none for the identical siblings
+        self.assertEqual(spy.call_count, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
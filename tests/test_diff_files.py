@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# test_diff_files.py
+
+""" Test streaming comparison of NLHTree listings with diff_files(). """
+
+import io
+import os
+import sys
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import (NLHTree, NLHLeaf, NLHParseError,
+                     ADDED, REMOVED, MODIFIED)
+from tree_helpers import random_hash, make_tree
+
+NESTED = """r
+ a
+  b
+   x 0000000000000000000000000000000000000000
+ e
+  f
+   x 1111111111111111111111111111111111111111
+ y 2222222222222222222222222222222222222222
+"""
+
+
+class TestDiffFiles(unittest.TestCase):
+    """ Test streaming comparison of NLHTree listings. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+
+    def tearDown(self):
+        pass
+
+    # utility functions #############################################
+
+    def mutate(self, tree, hashtype):
+        """ Make a few random changes to a tree. """
+
+        for _ in range(1 + self.rng.next_int16(4)):
+            # pick a directory by walking down from the root
+            sub = tree
+            while self.rng.next_int16(2):
+                subs = [n for n in sub.nodes if isinstance(n, NLHTree)]
+                if not subs:
+                    break
+                sub = subs[self.rng.next_int16(len(subs))]
+            choice = self.rng.next_int16(4)
+            if choice < 2 and sub.nodes:
+                victim = sub.nodes[self.rng.next_int16(len(sub.nodes))]
+                sub.delete(victim.name)
+                if choice == 1:
+                    # replace a leaf with a tree or vice versa
+                    if isinstance(victim, NLHLeaf):
+                        sub.insert(make_tree(
+                            self.rng, victim.name, hashtype, 2, 3))
+                    else:
+                        sub.insert(NLHLeaf(
+                            victim.name, random_hash(self.rng, hashtype),
+                            hashtype))
+            else:
+                name = self.rng.next_file_name(8)
+                if not sub.find(name):
+                    sub.insert(NLHLeaf(
+                        name, random_hash(self.rng, hashtype), hashtype))
+
+    @staticmethod
+    def write_listing(tree, name):
+        """ Write a tree to a listing below tmp/, returning the path. """
+        path = os.path.join('tmp', name)
+        with open(path, 'w') as file:
+            file.write(tree.__str__())
+        return path
+
+    # unit tests ####################################################
+
+    def do_test_diff_files(self, hashtype):
+        """
+        Verify that diff_files() reports what diff() does for randomly
+        modified trees, using a specific hash type.
+        """
+        check_hashtype(hashtype)
+        old = make_tree(self.rng, 'dataDir', hashtype, 4, 6)
+        path_to_old = self.write_listing(old, 'old.nlh')
+        self.assertEqual(
+            list(NLHTree.diff_files(path_to_old, path_to_old, hashtype)), [])
+
+        for _ in range(8):
+            new = old.clone()
+            self.mutate(new, hashtype)
+            path_to_new = self.write_listing(new, 'new.nlh')
+            self.assertEqual(
+                list(NLHTree.diff_files(path_to_old, path_to_new, hashtype)),
+                list(old.diff(new)))
+            self.assertEqual(
+                list(NLHTree.diff_files(path_to_new, path_to_old, hashtype)),
+                list(new.diff(old)))
+
+    def test_diff_files(self):
+        """ Compare randomly modified listings using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_diff_files(hashtype)
+
+    def test_nested_listing(self):
+        """
+        Compare listings in which a file follows a directory deeper
+        than itself.
+        """
+        hashtype = HashTypes.SHA1
+        old = NLHTree.parse(NESTED, hashtype)
+        new = old.clone()
+        new.find('e')[0].delete('f')
+        new.insert(NLHLeaf('f', b'\x33' * 20, hashtype))
+        path_to_old = self.write_listing(old, 'nested_old.nlh')
+        path_to_new = self.write_listing(new, 'nested_new.nlh')
+
+        self.assertEqual(
+            list(NLHTree.walk_file(path_to_old, hashtype)),
+            [('r', ), ('r/a', ), ('r/a/b', ),
+             ('r/a/b/x', '0' * 40),
+             ('r/e', ), ('r/e/f', ),
+             ('r/e/f/x', '1' * 40),
+             ('r/y', '2' * 40)])
+
+        expected = [('r/e/f', REMOVED, None, None),
+                    ('r/e/f/x', REMOVED, '1' * 40, None),
+                    ('r/f', ADDED, None, '3' * 40)]
+        self.assertEqual(list(old.diff(new)), expected)
+        self.assertEqual(
+            list(NLHTree.diff_files(path_to_old, path_to_new, hashtype)),
+            expected)
+
+        # the new listing read from stdin
+        saved = sys.stdin
+        try:
+            sys.stdin = io.StringIO(new.__str__())
+            changes = list(NLHTree.diff_files(path_to_old, '-', hashtype))
+        finally:
+            sys.stdin = saved
+        self.assertEqual(changes, expected)
+
+    def test_modified(self):
+        """ A changed hash is reported as MODIFIED. """
+
+        hashtype = HashTypes.SHA1
+        path_to_old = os.path.join('tmp', 'modified_old.nlh')
+        with open(path_to_old, 'w') as file:
+            file.write(NESTED)
+        path_to_new = os.path.join('tmp', 'modified_new.nlh')
+        with open(path_to_new, 'w') as file:
+            file.write(NESTED.replace('2' * 40, '4' * 40))
+        self.assertEqual(
+            list(NLHTree.diff_files(path_to_old, path_to_new, hashtype)),
+            [('r/y', MODIFIED, '2' * 40, '4' * 40)])
+
+    def test_out_of_order(self):
+        """ A listing which is not sorted cannot be compared. """
+
+        hashtype = HashTypes.SHA1
+        path_to_old = os.path.join('tmp', 'sorted.nlh')
+        with open(path_to_old, 'w') as file:
+            file.write(NESTED)
+        path_to_new = os.path.join('tmp', 'unsorted.nlh')
+        with open(path_to_new, 'w') as file:
+            file.write(NESTED.replace(' a\n', ' g\n'))
+        with self.assertRaises(NLHParseError):
+            list(NLHTree.diff_files(path_to_old, path_to_new, hashtype))
+
+
+if __name__ == '__main__':
+    unittest.main()
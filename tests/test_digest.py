@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# test_digest.py
+
+""" Test the Merkle digests of NLHTrees. """
+
+import hashlib
+import sys
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf
+
+if sys.version_info < (3, 6):
+    # pylint: disable=unused-import
+    import sha3     # monkey-patches hashlib
+    assert sha3     # suppresses warning
+
+
+class TestDigest(unittest.TestCase):
+    """ Test the Merkle digests of NLHTrees. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def tearDown(self):
+        pass
+
+    def do_test_digest(self, hashtype):
+        """ Check digests using a specific hash type. """
+
+        check_hashtype(hashtype)
+        if hashtype == HashTypes.SHA1:
+            rel_path_to_data = 'example1/dataDir'
+            sha = hashlib.sha1()
+        elif hashtype == HashTypes.SHA2:
+            rel_path_to_data = 'example2/dataDir'
+            sha = hashlib.sha256()
+        elif hashtype == HashTypes.SHA3:
+            rel_path_to_data = 'example3/dataDir'
+            sha = hashlib.sha3_256()
+        elif hashtype == HashTypes.BLAKE2B:
+            rel_path_to_data = 'example4/dataDir'
+            sha = hashlib.blake2b(digest_size=32)
+        else:
+            raise NotImplementedError
+
+        tree = NLHTree.create_from_file_system(rel_path_to_data, hashtype)
+        digest = tree.bin_digest
+        self.assertEqual(len(digest), len(tree.nodes[0].bin_hash))
+        self.assertEqual(tree.hex_digest, digest.hex())
+
+        # the digest of subDir1 is calculated as documented
+        sub_dir1 = tree.find('subDir1')[0]
+        for leaf in sub_dir1.nodes:
+            sha.update(leaf.name.encode('utf-8') + b'\0F' + leaf.bin_hash)
+        self.assertEqual(sub_dir1.bin_digest, sha.digest())
+
+        # an empty directory
+        self.assertEqual(tree.find('subDir2')[0].bin_digest,
+                         NLHTree('empty', hashtype).bin_digest)
+
+        # the digest does not depend on the name of the tree
+        parsed = NLHTree.parse(tree.__str__().replace('dataDir', 'other', 1),
+                               hashtype)
+        self.assertEqual(parsed.bin_digest, digest)
+        self.assertFalse(parsed == tree)
+
+        # clones share the digest
+        clone = tree.clone()
+        self.assertEqual(clone.bin_digest, digest)
+        self.assertEqual(clone, tree)
+
+        # a change deep in the clone changes the digests above it, but
+        # not those of the original tree
+        sub_dir411 = clone.find('subDir4')[0].nodes[0].nodes[0]
+        old411 = sub_dir411.bin_digest
+        leaf = NLHLeaf('extra', tree.nodes[0].bin_hash, hashtype)
+        sub_dir411.insert(leaf)
+        self.assertNotEqual(sub_dir411.bin_digest, old411)
+        self.assertNotEqual(clone.bin_digest, digest)
+        self.assertFalse(clone == tree)
+        self.assertEqual(tree.bin_digest, digest)
+        self.assertEqual(tree, NLHTree.create_from_file_system(
+            rel_path_to_data, hashtype))
+
+        # undoing the change restores the digest
+        sub_dir411.delete('extra')
+        self.assertEqual(sub_dir411.bin_digest, old411)
+        self.assertEqual(clone.bin_digest, digest)
+        self.assertEqual(clone, tree)
+
+        # a directory and a file with the same name and digest differ
+        tree1 = NLHTree('top', hashtype)
+        tree1.insert(NLHLeaf('x', digest, hashtype))
+        tree2 = NLHTree('top', hashtype)
+        sub = NLHTree.parse(tree.__str__().replace('dataDir', 'x', 1),
+                            hashtype)
+        tree2.insert(sub)
+        self.assertEqual(sub.bin_digest, digest)
+        self.assertFalse(tree1 == tree2)
+
+    def test_digest(self):
+        """ Check digests using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_digest(hashtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# test_get.py
+
+""" Test lookup of nodes by relative path with NLHTree.get(). """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf
+from nlhtree.columnar import NLHColumnarTree
+from tree_helpers import random_hash, make_tree
+
+
+class TestGet(unittest.TestCase):
+    """ Test lookup of nodes by relative path with NLHTree.get(). """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def tearDown(self):
+        pass
+
+    # utility functions #############################################
+
+    @staticmethod
+    def all_paths(tree, prefix=''):
+        """ Map the path to every node below tree to the node. """
+        paths = {}
+        for node in tree.nodes:
+            path = prefix + node.name
+            paths[path] = node
+            if isinstance(node, NLHTree):
+                paths.update(TestGet.all_paths(node, path + '/'))
+        return paths
+
+    def check_get(self, tree):
+        """
+        Verify that every node can be found from the root and from
+        every subtree, and that nothing else can.
+        """
+        paths = self.all_paths(tree)
+        for path, node in paths.items():
+            self.assertIs(tree.get(path), node)
+            self.assertIn(path, tree)
+            self.assertIsNone(tree.get(path + '#'))
+            self.assertNotIn(path + '#', tree)
+            if isinstance(node, NLHTree):
+                self.assertIs(node.get(''), node)
+                for sub_path, sub_node in self.all_paths(node).items():
+                    self.assertIs(node.get(sub_path), sub_node)
+                    self.assertIs(tree.get(path + '/' + sub_path), sub_node)
+        # the root keeps one entry per node below it, and no more
+        self.assertEqual(len(tree._index), len(paths))
+
+    # unit tests ####################################################
+
+    def do_test_get(self, hashtype):
+        """ Look up nodes in a randomly modified tree. """
+
+        check_hashtype(hashtype)
+        tree = make_tree(self.rng, 'dataDir', hashtype, 4, 6)
+        self.assertIs(tree.get(''), tree)
+        self.assertIsNone(tree.get('no/such/path'))
+        self.check_get(tree)
+
+        for _ in range(16):
+            trees = [tree] + [node for node in self.all_paths(tree).values()
+                              if isinstance(node, NLHTree)]
+            sub = trees[self.rng.next_int16(len(trees))]
+            choice = self.rng.next_int16(4)
+            if choice == 0 and sub.nodes:
+                # delete a node, perhaps a whole subtree
+                victim = sub.nodes[self.rng.next_int16(len(sub.nodes))]
+                sub.delete(victim.name)
+            elif choice == 1 and sub.nodes:
+                # delete using a glob
+                sub.delete(sub.nodes[0].name[0] + '*')
+            elif choice == 2:
+                # insert a subtree
+                name = self.rng.next_file_name(8)
+                if not sub.find(name):
+                    sub.insert(make_tree(self.rng, name, hashtype, 2, 3))
+            else:
+                name = self.rng.next_file_name(8)
+                if not sub.find(name):
+                    sub.insert(NLHLeaf(
+                        name, random_hash(self.rng, hashtype), hashtype))
+            self.check_get(tree)
+
+    def test_get(self):
+        """ Look up nodes in randomly modified trees of all hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_get(hashtype)
+
+    def test_moved_subtree(self):
+        """ A subtree moved from one tree to another is looked up anew. """
+
+        hashtype = HashTypes.SHA2
+        tree = make_tree(self.rng, 'dataDir', hashtype, 3, 5)
+        sub = NLHTree('zSub', hashtype)
+        sub.insert(NLHLeaf(
+            'leaf', random_hash(self.rng, hashtype), hashtype))
+        self.assertIsNotNone(sub.get('leaf'))       # sub has its own index
+        tree.get('anything')                        # and so does tree
+        tree.insert(sub)
+        self.assertIsNone(sub._index)
+        self.assertIs(tree.get('zSub/leaf'), sub.nodes[0])
+        self.assertIs(sub.get('leaf'), sub.nodes[0])
+
+        tree.delete('zSub')
+        self.assertNotIn('zSub/leaf', tree)
+        self.assertIs(sub.get('leaf'), sub.nodes[0])
+
+    def test_deep_bulk_load(self):
+        """
+        Loading a deep listing never looks for an index above the tree
+        being built, and the index built afterwards is complete.
+        """
+        hashtype = HashTypes.SHA2
+        depth = 200
+        lines = [' ' * ndx + 'd%d' % ndx for ndx in range(depth)]
+        lines += [' ' * depth + 'f%03d %s' % (ndx, '0' * 64)
+                  for ndx in range(100)]
+
+        looked = []
+        saved = NLHTree._indexed_root
+
+        def counting_indexed_root(tree):
+            """ Record each search for an indexed root. """
+            looked.append(tree)
+            return saved(tree)
+
+        NLHTree._indexed_root = counting_indexed_root
+        try:
+            tree = NLHTree.create_from_string_array(lines, hashtype)
+        finally:
+            NLHTree._indexed_root = saved
+        self.assertEqual(looked, [])
+        path = '/'.join('d%d' % ndx for ndx in range(1, depth))
+        self.assertEqual(tree.get(path + '/f099').hex_hash, '0' * 64)
+        self.assertIn(path + '/f000', tree)
+
+    def test_columnar_get(self):
+        """ NLHColumnarTree finds the same nodes. """
+
+        hashtype = HashTypes.SHA2
+        tree = make_tree(self.rng, 'dataDir', hashtype, 4, 6)
+        columnar = NLHColumnarTree.from_tree(tree)
+        for path, node in self.all_paths(tree).items():
+            self.assertIn(path, columnar)
+            if isinstance(node, NLHLeaf):
+                self.assertEqual(columnar.get(path), node)
+            else:
+                self.assertEqual(list(columnar.get(path)), list(node))
+            self.assertNotIn(path + '#', columnar)
+        self.assertIs(columnar.get(''), columnar)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# test_hash_cache.py
+
+""" Test the persistent hash cache used when building NLHTrees. """
+
+import os
+import shutil
+import time
+import unittest
+from unittest import mock
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+import nlhtree
+from nlhtree import NLHTree, NLHLeaf, NLHHashCache
+
+
+class TestHashCache(unittest.TestCase):
+    """ Test the persistent hash cache used when building NLHTrees. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        self.hashed = []
+
+    def tearDown(self):
+        pass
+
+    def counting_hash_file(self, path, hashtype=HashTypes.SHA2):
+        """ Record which files are actually hashed. """
+        self.hashed.append(path)
+        return self.real_hash_file(path, hashtype)
+
+    real_hash_file = staticmethod(nlhtree.hash_file)
+
+    def make_test_directory(self):
+        """
+        Create a quasi-random test directory below tmp/, with all
+        modification times an hour in the past.
+        """
+        dir_name = self.rng.next_file_name(8)
+        dir_path = os.path.join('tmp', dir_name)
+        if os.path.exists(dir_path):
+            shutil.rmtree(dir_path)
+        self.rng.next_data_dir(dir_path, 3, 4, 32)
+        past = time.time() - 3600
+        for dir_, _, files in os.walk(dir_path):
+            for file in files:
+                os.utime(os.path.join(dir_, file), (past, past))
+        return dir_path
+
+    def build(self, dir_path, hashtype, hash_cache):
+        """ Build a tree, returning it and the number of files hashed. """
+        self.hashed = []
+        with mock.patch('nlhtree.hash_file', self.counting_hash_file):
+            tree = NLHTree.create_from_file_system(
+                dir_path, hashtype, hash_cache=hash_cache)
+        return tree, len(self.hashed)
+
+    def do_test_hash_cache(self, hashtype):
+        """ Exercise the hash cache using a specific hash type. """
+
+        check_hashtype(hashtype)
+        dir_path = self.make_test_directory()
+        cache_path = dir_path + '.cache'
+        expected = NLHTree.create_from_file_system(dir_path, hashtype)
+        leaves = [couple for couple in expected if len(couple) == 2]
+        self.assertTrue(len(leaves) > 0)
+
+        # an empty cache: everything is hashed and recorded
+        cache = NLHHashCache(cache_path)
+        tree, count = self.build(dir_path, hashtype, cache)
+        self.assertEqual(tree, expected)
+        self.assertEqual(count, len(leaves))
+        self.assertEqual(len(cache), len(leaves))
+        cache.save()
+
+        # nothing has changed, so nothing is hashed
+        cache = NLHHashCache(cache_path)
+        tree, count = self.build(dir_path, hashtype, cache)
+        self.assertEqual(tree, expected)
+        self.assertEqual(count, 0)
+
+        # a different hash type shares nothing
+        other = HashTypes.SHA1 if hashtype != HashTypes.SHA1 \
+            else HashTypes.SHA2
+        _, count = self.build(dir_path, other, cache)
+        self.assertEqual(count, len(leaves))
+
+        # change one file: only it is rehashed
+        rel_path = leaves[0][0]
+        path_to_file = os.path.join(os.path.dirname(dir_path), rel_path)
+        with open(path_to_file, 'ab') as file:
+            file.write(b'more data')
+        past = time.time() - 1800
+        os.utime(path_to_file, (past, past))
+        tree, count = self.build(dir_path, hashtype, cache)
+        self.assertEqual(count, 1)
+        self.assertEqual(self.hashed, [path_to_file])
+        self.assertEqual(tree, NLHTree.create_from_file_system(
+            dir_path, hashtype))
+        self.assertFalse(tree == expected)
+        cache.save()
+
+        # forced full rehash
+        cache = NLHHashCache(cache_path, rehash=True)
+        _, count = self.build(dir_path, hashtype, cache)
+        self.assertEqual(count, len(leaves))
+
+        # leaves built through the cache are keyed by path
+        cache = NLHHashCache(cache_path)
+        name = os.path.basename(path_to_file)
+        with mock.patch('nlhtree.hash_file', self.counting_hash_file):
+            self.hashed = []
+            leaf = NLHLeaf.create_from_file_system(
+                path_to_file, name, hashtype, cache)
+            self.assertEqual(len(self.hashed), 1)
+            leaf2 = NLHLeaf.create_from_file_system(
+                path_to_file, name, hashtype, cache)
+            self.assertEqual(len(self.hashed), 1)
+        self.assertEqual(leaf, leaf2)
+        self.assertEqual(leaf.bin_hash,
+                         nlhtree.hash_file(path_to_file, hashtype))
+
+    def test_hash_cache(self):
+        """ Exercise the hash cache using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_hash_cache(hashtype)
+
+    def test_racy_and_corrupt(self):
+        """
+        Files modified just before they are hashed are not cached,
+        and a damaged cache file is ignored.
+        """
+        dir_path = self.make_test_directory()
+        cache_path = dir_path + '.cache'
+        path_to_file = os.path.join(dir_path, 'recent')
+        with open(path_to_file, 'w') as file:
+            file.write('recently modified')
+
+        cache = NLHHashCache(cache_path)
+        tree, count = self.build(dir_path, HashTypes.SHA2, cache)
+        self.assertTrue(count > 1)
+        cache.save()
+        cache = NLHHashCache(cache_path)
+        _, count = self.build(dir_path, HashTypes.SHA2, cache)
+        self.assertEqual(self.hashed, [path_to_file])
+
+        with open(cache_path, 'w') as file:
+            file.write('not a hash cache\n')
+        cache = NLHHashCache(cache_path)
+        tree2, count2 = self.build(dir_path, HashTypes.SHA2, cache)
+        self.assertEqual(tree2, tree)
+        self.assertTrue(count2 > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# test_hash_index.py
+
+""" Test the index from content hashes to the paths of leaves. """
+
+import hashlib
+import os
+import shutil
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf
+from xlu import UDir, DirStruc
+from tree_helpers import make_tree
+
+
+class TestHashIndex(unittest.TestCase):
+    """ Test the index from content hashes to the paths of leaves. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def tearDown(self):
+        pass
+
+    # utility functions #############################################
+
+    @staticmethod
+    def leaf_paths(tree, prefix=''):
+        """ Map each binary hash to the paths of leaves below tree. """
+        paths = {}
+        for node in tree.nodes:
+            path = prefix + node.name
+            if isinstance(node, NLHLeaf):
+                paths.setdefault(node.bin_hash, []).append(path)
+            else:
+                for bin_hash, sub_paths in TestHashIndex.leaf_paths(
+                        node, path + '/').items():
+                    paths.setdefault(bin_hash, []).extend(sub_paths)
+        return paths
+
+    def check_index(self, tree, pool):
+        """ Compare the answers from the index with a brute-force map. """
+
+        expected = self.leaf_paths(tree)
+        for bin_hash in pool:
+            paths = sorted(expected.get(bin_hash, []))
+            self.assertEqual(tree.paths_for_hash(bin_hash), paths)
+            self.assertEqual(
+                tree.paths_for_hash(bin_hash.hex()), paths)
+            self.assertEqual(tree.hash_refcount(bin_hash), len(paths))
+        self.assertEqual(
+            tree.duplicates(),
+            sorted(sorted(paths) for paths in expected.values()
+                   if len(paths) > 1))
+
+    # unit tests ####################################################
+
+    def do_test_hash_index(self, hashtype):
+        """ Query the index for a randomly modified tree. """
+
+        check_hashtype(hashtype)
+        hash_len = 20 if hashtype == HashTypes.SHA1 else 32
+        pool = [self.rng.some_bytes(hash_len) for _ in range(12)]
+        tree = make_tree(self.rng, 'dataDir', hashtype, 4, 6, pool)
+        self.check_index(tree, pool)
+
+        for _ in range(16):
+            subs = [tree]
+            for couple in tree:
+                if len(couple) == 1 and '/' in couple[0]:
+                    subs.append(tree.get(couple[0].partition('/')[2]))
+            sub = subs[self.rng.next_int16(len(subs))]
+            choice = self.rng.next_int16(3)
+            if choice == 0 and sub.nodes:
+                sub.delete(sub.nodes[self.rng.next_int16(len(sub.nodes))].name)
+            elif choice == 1:
+                name = self.rng.next_file_name(8)
+                if not sub.find(name):
+                    sub.insert(make_tree(self.rng, name, hashtype, 2, 3, pool))
+            else:
+                name = self.rng.next_file_name(8)
+                if not sub.find(name):
+                    sub.insert(NLHLeaf(
+                        name, pool[self.rng.next_int16(len(pool))],
+                        hashtype))
+            self.check_index(tree, pool)
+
+            # queries on a subtree see only the leaves below it
+            if sub is not tree:
+                self.check_index(sub, pool)
+
+    def test_hash_index(self):
+        """ Query the index for trees of all hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_hash_index(hashtype)
+
+    def test_unknown_hash(self):
+        """ A hash which no leaf has is referenced by no paths. """
+
+        tree = NLHTree('dataDir', HashTypes.SHA2)
+        self.assertEqual(tree.paths_for_hash(b'\x00' * 32), [])
+        self.assertEqual(tree.hash_refcount('00' * 32), 0)
+        self.assertEqual(tree.duplicates(), [])
+
+    def test_drop_duplicates(self):
+        """
+        Dropping a tree in which several leaves share content deletes
+        that content once, without reporting the other leaves.
+        """
+        hashtype = HashTypes.SHA2
+        base = os.path.join('tmp', 'hash_index')
+        if os.path.exists(base):
+            shutil.rmtree(base)
+        data_dir = os.path.join(base, 'dataDir')
+        os.makedirs(os.path.join(data_dir, 'sub'))
+        for rel_path, data in [('a', b'same'), ('b', b'other'),
+                               ('sub/c', b'same')]:
+            with open(os.path.join(data_dir, rel_path), 'wb') as file:
+                file.write(data)
+        u_path = os.path.join(base, 'uDir')
+        u_dir = UDir(u_path, DirStruc.DIR_FLAT, hashtype)
+
+        tree = NLHTree.create_from_file_system(data_dir, hashtype)
+        self.assertEqual(tree.save_to_u_dir(data_dir, u_path), [])
+        same = hashlib.sha256(b'same').hexdigest()
+        self.assertEqual(tree.paths_for_hash(same), ['a', 'sub/c'])
+        self.assertEqual(tree.duplicates(), [['a', 'sub/c']])
+
+        self.assertEqual(tree.drop_from_u_dir(u_path), [])
+        self.assertFalse(u_dir.exists(same))
+        self.assertFalse(u_dir.exists(hashlib.sha256(b'other').hexdigest()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 
 """ Test iteration over NLHTree instances. """
 
+import threading
 import unittest
 
 # import hashlib
@@ -128,42 +129,46 @@ class TestIters(unittest.TestCase):
         root = tree
         self.assertFalse(isinstance(root, NLHLeaf))
         self.assertTrue(hasattr(root, '__iter__'))
-        self.assertTrue(hasattr(root, '__next__'))
 
-        couple = root.__next__()
+        root_iter = iter(root)
+        couple = next(root_iter)
         self.assertEqual(len(couple), 1)
+        self.assertEqual(couple[0], root.name)
 
         # -- leaf node ----------------------------------------------
         node0 = nodes[0]
         self.assertTrue(isinstance(node0, NLHLeaf))
         self.assertTrue(hasattr(node0, '__iter__'))
-        self.assertTrue(hasattr(node0, '__next__'))
 
-        couple = node0.__next__()
+        node0_iter = iter(node0)
+        couple = next(node0_iter)
         self.assertEqual(len(couple), 2)
         self.assertEqual(couple[0], node0.name)
         self.assertEqual(couple[1], node0.hex_hash)
 
         try:
-            couple = node0.__next__()
-            self.fail('second __next__ on leaf succeeded')
+            couple = next(node0_iter)
+            self.fail('second next() on leaf succeeded')
         except StopIteration:
             pass
 
+        # a fresh iterator starts again
+        self.assertEqual(list(node0), [(node0.name, node0.hex_hash)])
+
         # -- leaf node ----------------------------------------------
         node1 = nodes[1]
         self.assertTrue(isinstance(node1, NLHLeaf))
         self.assertTrue(hasattr(node1, '__iter__'))
-        self.assertTrue(hasattr(node1, '__next__'))
 
-        couple = node1.__next__()
+        node1_iter = iter(node1)
+        couple = next(node1_iter)
         self.assertEqual(len(couple), 2)
         self.assertEqual(couple[0], node1.name)
         self.assertEqual(couple[1], node1.hex_hash)
 
         try:
-            couple = node1.__next__()
-            self.fail('second __next__ on leaf succeeded')
+            couple = next(node1_iter)
+            self.fail('second next() on leaf succeeded')
         except StopIteration:
             pass
 
@@ -171,12 +176,70 @@ class TestIters(unittest.TestCase):
         node2 = nodes[2]
         self.assertFalse(isinstance(node2, NLHLeaf))
         self.assertTrue(hasattr(node2, '__iter__'))
-        self.assertTrue(hasattr(node2, '__next__'))
 
-        couple = node2.__next__()
+        couple = next(iter(node2))
         self.assertEqual(len(couple), 1)
         self.assertEqual(couple[0], node2.name)
 
+        # -- the whole tree -----------------------------------------
+        # the root iterator picks up where it left off, unaffected by
+        # the iterations over nodes below it
+        self.assertEqual(next(root_iter), (root.name + '/' + node0.name,
+                                           node0.hex_hash))
+        couples = list(tree)
+        self.assertEqual(len(couples), len(string.split('\n')) - 1)
+        self.assertEqual(list(tree), couples)
+
+        # iterations may be nested
+        pairs = [(outer, inner) for outer in tree for inner in tree]
+        self.assertEqual(len(pairs), len(couples) ** 2)
+
+        # nodes no longer carry iteration state
+        for node in [root, node0, node2]:
+            self.assertFalse(hasattr(node, '__dict__'))
+            with self.assertRaises(AttributeError):
+                node.iter_used = True
+
+    def test_deep_tree(self):
+        """
+        Iterate over a tree nested far more deeply than the recursion
+        limit allows a chain of generators to be.
+        """
+        hashtype = HashTypes.SHA1
+        depth = 3000
+        tree = NLHTree('d%d' % depth, hashtype)
+        tree.insert(NLHLeaf('leaf', b'\x01' * 20, hashtype))
+        for ndx in range(depth - 1, -1, -1):
+            parent = NLHTree('d%d' % ndx, hashtype)
+            parent.insert(tree)
+            tree = parent
+
+        couples = list(tree)
+        self.assertEqual(len(couples), depth + 2)
+        path = '/'.join('d%d' % ndx for ndx in range(depth + 1))
+        self.assertEqual(couples[-2], (path, ))
+        self.assertEqual(couples[-1], (path + '/leaf', '01' * 20))
+
+    def test_threads(self):
+        """ Iterate over the same tree in several threads at once. """
+
+        tree = NLHTree.parse(EXAMPLE1, HashTypes.SHA1)
+        expected = list(tree)
+        results = []
+
+        def walk():
+            for _ in range(200):
+                results.append(list(tree))
+
+        threads = [threading.Thread(target=walk) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 800)
+        for couples in results:
+            self.assertEqual(couples, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
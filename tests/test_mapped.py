@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# test_mapped.py
+
+""" Test NLHMappedTree, the memory-mapped listing format. """
+
+import io
+import os
+import unittest
+
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf, NLHParseError
+from nlhtree.columnar import NLHColumnarTree
+from nlhtree.mapped import NLHMappedTree
+
+
+class TestMapped(unittest.TestCase):
+    """ Test NLHMappedTree, the memory-mapped listing format. """
+
+    def setUp(self):
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+
+    def tearDown(self):
+        pass
+
+    def do_test_mapped(self, hashtype):
+        """
+        Map the example tree for a specific hash type, checking that
+        it matches the NLHTree.
+        """
+        check_hashtype(hashtype)
+        if hashtype == HashTypes.SHA1:
+            example = 'example1'
+        elif hashtype == HashTypes.SHA2:
+            example = 'example2'
+        elif hashtype == HashTypes.SHA3:
+            example = 'example3'
+        elif hashtype == HashTypes.BLAKE2B:
+            example = 'example4'
+        else:
+            raise NotImplementedError
+        tree = NLHTree.parse_file(
+            os.path.join(example, 'example.nlh'), hashtype)
+        path_to_file = os.path.join('tmp', '%s.nlhm' % example)
+        NLHMappedTree.write(tree, path_to_file)
+
+        with NLHMappedTree(path_to_file) as mapped:
+            self.assertEqual(mapped.name, tree.name)
+            self.assertEqual(mapped.hashtype, hashtype)
+            self.assertEqual(list(mapped), list(tree))
+            self.assertEqual(len(mapped), len(list(tree)))
+            self.assertEqual(mapped.to_tree(), tree)
+
+            # every node can be found by its path below the tree
+            for couple in tree:
+                rel_path = couple[0].partition('/')[2]
+                self.assertIn(rel_path, mapped)
+                node = mapped.get(rel_path)
+                if len(couple) == 2:
+                    self.assertTrue(isinstance(node, NLHLeaf))
+                    self.assertEqual(node.name, rel_path.rpartition('/')[2])
+                    self.assertEqual(node.hex_hash, couple[1])
+                else:
+                    self.assertTrue(isinstance(node, NLHMappedTree))
+            self.assertIs(mapped.get(''), mapped)
+            self.assertIsNone(mapped.get('data3'))
+            self.assertIsNone(mapped.get('subDir1/data1'))
+            self.assertNotIn('subDir4/subDir41/data31', mapped)
+
+            # a subtree is enumerated as the NLHTree's subtree would be
+            sub = mapped.get('subDir4/subDir41')
+            sub_tree = tree.find('subDir4')[0].find('subDir41')[0]
+            self.assertEqual(sub.name, 'subDir41')
+            self.assertEqual(list(sub), list(sub_tree))
+            self.assertEqual(sub.to_tree(), sub_tree)
+            self.assertEqual(sub.get('subDir411/data31').hex_hash,
+                             sub_tree.nodes[0].nodes[0].hex_hash)
+            self.assertEqual(list(mapped.get('subDir2')), [('subDir2', )])
+
+            # inspected as the NLHTree would be, and equal to it and to
+            # the columnar tree whichever is on the left
+            columnar = NLHColumnarTree.from_tree(tree)
+            for other in [tree, columnar]:
+                self.assertTrue(mapped == other)
+                self.assertTrue(other == mapped)
+                self.assertFalse(mapped != other)
+                self.assertFalse(other != mapped)
+                self.assertFalse(sub == other)
+                self.assertFalse(other == sub)
+            self.assertTrue(sub_tree == sub)
+            self.assertNotEqual(mapped, None)
+            self.assertEqual(mapped.hex_digest, tree.hex_digest)
+            self.assertEqual(sub.bin_digest, sub_tree.bin_digest)
+            self.assertEqual(mapped.nodes, tree.nodes)
+            self.assertEqual([node.name for node in sub.nodes],
+                             [node.name for node in sub_tree.nodes])
+            for pat in ['data1', 'subDir4', 'sub*', '*', 'nosuch',
+                        'subDir4/subDir41']:
+                self.assertEqual(mapped.find(pat), tree.find(pat))
+                self.assertEqual(mapped.list(pat), tree.list(pat))
+            self.assertEqual(mapped.__str__(), tree.__str__())
+            self.assertEqual(sub.__str__(), sub_tree.__str__())
+            strings = []
+            sub.to_strings(strings, 2)
+            expected = []
+            sub_tree.to_strings(expected, 2)
+            self.assertEqual(strings, expected)
+            out = io.StringIO()
+            mapped.write_to(out)
+            self.assertEqual(out.getvalue(), tree.__str__())
+
+            # read-only operations borrowed from NLHTree
+            data_dir = os.path.join(example, 'dataDir')
+            self.assertEqual(mapped.check_in_data_dir(data_dir),
+                             tree.check_in_data_dir(data_dir))
+            u_path = os.path.join(example, 'uDir')
+            self.assertEqual(mapped.check_in_u_dir(u_path),
+                             tree.check_in_u_dir(u_path))
+
+    def test_mapped(self):
+        """ Map the example trees for all hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_mapped(hashtype)
+
+    def test_bad_file(self):
+        """ Files which are not mapped listings are rejected. """
+
+        path_to_file = os.path.join('tmp', 'not_mapped.nlhm')
+        for data in [b'', b'NLHM', b'dataDir\n' * 20]:
+            with open(path_to_file, 'wb') as file:
+                file.write(data)
+            with self.assertRaises(NLHParseError):
+                NLHMappedTree(path_to_file)
+
+        tree = NLHTree('dataDir', HashTypes.SHA2)
+        NLHMappedTree.write(tree, path_to_file)
+        with open(path_to_file, 'rb') as file:
+            data = file.read()
+        with open(path_to_file, 'wb') as file:
+            file.write(data[:-8])
+        with self.assertRaises(NLHParseError):
+            NLHMappedTree(path_to_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,7 +10,7 @@ import unittest
 import hashlib
 
 from rnglib import SimpleRNG
-from nlhtree import NLHTree, NLHLeaf
+from nlhtree import NLHTree, NLHLeaf, NLHError
 from xlattice import HashTypes, check_hashtype
 
 if sys.version_info < (3, 6):
@@ -106,6 +106,51 @@ class TestNLHTree(unittest.TestCase):
         for using in [HashTypes.SHA1, HashTypes.SHA2, HashTypes.SHA3, ]:
             self.do_test_insert_4_leafs(using)
 
+    def do_test_insert_many_leafs(self, hashtype):
+        """
+        Insert a few hundred leafs in random order, verifying that
+        the nodes stay sorted, that duplicates are rejected, and
+        that lookup and deletion by literal name work.
+        """
+        check_hashtype(hashtype)
+        tree = NLHTree(self.rng.next_file_name(8), hashtype)
+        leaf_names = set()
+        leafs = [self.make_leaf(leaf_names, hashtype) for _ in range(256)]
+        for leaf in leafs:
+            tree.insert(leaf)
+        self.assertEqual(len(tree.nodes), len(leafs))
+        names = [node.name for node in tree.nodes]
+        self.assertEqual(names, sorted(leaf_names))
+
+        dupe = NLHLeaf(leafs[17].name, leafs[3].bin_hash, hashtype)
+        with self.assertRaises(NLHError):
+            tree.insert(dupe)
+        self.assertEqual(len(tree.nodes), len(leafs))
+
+        victim = leafs[42]
+        self.assertEqual(tree.find(victim.name), [victim])
+        tree.delete(victim.name)
+        self.assertEqual(tree.find(victim.name), [])
+        self.assertEqual(len(tree.nodes), len(leafs) - 1)
+
+        # once deleted, the name can be reused
+        tree.insert(victim)
+        self.assertEqual(tree.find(victim.name), [victim])
+        names = [node.name for node in tree.nodes]
+        self.assertEqual(names, sorted(leaf_names))
+
+        tree.delete('*')
+        self.assertEqual(len(tree.nodes), 0)
+        tree.insert(victim)
+        self.assertEqual(tree.find('*'), [victim])
+
+    def test_insert_many_leafs(self):
+        """
+        Test inserting many leafs into a tree using various hash types.
+        """
+        for using in [HashTypes.SHA1, HashTypes.SHA2, HashTypes.SHA3, ]:
+            self.do_test_insert_many_leafs(using)
+
 
 if __name__ == '__main__':
     unittest.main()
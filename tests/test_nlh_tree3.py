@@ -7,7 +7,7 @@ import time
 import unittest
 
 from rnglib import SimpleRNG
-from nlhtree import NLHTree as NT
+from nlhtree import NLHTree as NT, NLHParseError
 from xlattice import (HashTypes, check_hashtype,
                       SHA1_HEX_LEN, SHA2_HEX_LEN)
 
@@ -202,6 +202,31 @@ class TestNLHTree3(unittest.TestCase):
         for hashtype in [HashTypes.SHA1, HashTypes.SHA2, HashTypes.SHA3, ]:
             self.do_test_serialization(hashtype)
 
+    def test_unsorted_listings(self):
+        """
+        Verify that listings with names out of order or duplicated
+        at any level are rejected.
+        """
+        strings = list(self.EXAMPLE1)
+        tree = NT.create_from_string_array(strings, HashTypes.SHA1)
+        self.assertEqual(len(tree.nodes), 7)
+
+        # swap data1 and data2
+        swapped = list(strings)
+        swapped[1], swapped[2] = swapped[2], swapped[1]
+        with self.assertRaises(NLHParseError):
+            NT.create_from_string_array(swapped, HashTypes.SHA1)
+
+        # duplicate data11 within subDir1
+        duped = strings[:5] + [strings[4]] + strings[5:]
+        with self.assertRaises(NLHParseError):
+            NT.create_from_string_array(duped, HashTypes.SHA1)
+
+        # zData moved to precede subDir4, at the top level
+        moved = strings[:9] + strings[13:] + strings[9:13]
+        with self.assertRaises(NLHParseError):
+            NT.parse('\n'.join(moved) + '\n', HashTypes.SHA1)
+
 
 if __name__ == '__main__':
     unittest.main()
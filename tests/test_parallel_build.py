@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# test_parallel_build.py
+
+""" Test building NLHTrees from the file system concurrently. """
+
+import os
+import re
+import shutil
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+import nlhtree
+from nlhtree import NLHTree
+
+
+class TestParallelBuild(unittest.TestCase):
+    """ Test building NLHTrees from the file system concurrently. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        self.saved_batch = nlhtree._HASH_BATCH
+
+    def tearDown(self):
+        nlhtree._HASH_BATCH = self.saved_batch
+
+    def make_test_directory(self, depth, width):
+        """ Create a quasi-random test directory below tmp/. """
+
+        dir_name = self.rng.next_file_name(8)
+        dir_path = os.path.join('tmp', dir_name)
+        if os.path.exists(dir_path):
+            shutil.rmtree(dir_path)
+        self.rng.next_data_dir(dir_path, depth, width, 32)
+        return dir_path
+
+    def do_test_threaded_build(self, hashtype):
+        """
+        Verify that trees built with a thread pool are identical to
+        those built serially, using a specific hash type.
+        """
+        check_hashtype(hashtype)
+        if hashtype == HashTypes.SHA1:
+            rel_path_to_data = 'example1/dataDir'
+            rel_path_to_nlh = 'example1/example.nlh'
+        elif hashtype == HashTypes.SHA2:
+            rel_path_to_data = 'example2/dataDir'
+            rel_path_to_nlh = 'example2/example.nlh'
+        elif hashtype == HashTypes.SHA3:
+            rel_path_to_data = 'example3/dataDir'
+            rel_path_to_nlh = 'example3/example.nlh'
+        elif hashtype == HashTypes.BLAKE2B:
+            rel_path_to_data = 'example4/dataDir'
+            rel_path_to_nlh = 'example4/example.nlh'
+        else:
+            raise NotImplementedError
+
+        with open(rel_path_to_nlh, 'r') as file:
+            listing = file.read()
+        tree = NLHTree.create_from_file_system(
+            rel_path_to_data, hashtype, jobs=4)
+        self.assertEqual(tree.__str__(), listing)
+
+        dir_path = self.make_test_directory(4, 5)
+        serial = NLHTree.create_from_file_system(dir_path, hashtype)
+        for jobs in [2, 8]:
+            tree = NLHTree.create_from_file_system(
+                dir_path, hashtype, jobs=jobs)
+            self.assertEqual(tree, serial)
+            self.assertEqual(tree.__str__(), serial.__str__())
+
+        # files are hashed a few at a time, in order
+        nlhtree._HASH_BATCH = 1
+        tree = NLHTree.create_from_file_system(dir_path, hashtype, jobs=3)
+        self.assertEqual(tree.__str__(), serial.__str__())
+        nlhtree._HASH_BATCH = self.saved_batch
+
+    def test_threaded_build(self):
+        """ Test threaded builds using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_threaded_build(hashtype)
+
+    def do_test_process_build(self, hashtype):
+        """
+        Verify that trees built with a process pool are identical to
+        those built serially, using a specific hash type.
+        """
+        check_hashtype(hashtype)
+        dir_path = self.make_test_directory(4, 5)
+        # a file at the top level which must be skipped
+        os.symlink('nowhere', os.path.join(dir_path, 'dangling'))
+        serial = NLHTree.create_from_file_system(dir_path, hashtype)
+        tree = NLHTree.create_from_file_system(
+            dir_path, hashtype, jobs=3, use_processes=True)
+        self.assertEqual(tree, serial)
+        self.assertEqual(tree.__str__(), serial.__str__())
+
+        tree = NLHTree.create_from_file_system(
+            'example2/dataDir', hashtype, jobs=2, use_processes=True)
+        serial = NLHTree.create_from_file_system('example2/dataDir', hashtype)
+        self.assertEqual(tree.__str__(), serial.__str__())
+
+    def test_process_build(self):
+        """ Test process pool builds using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_process_build(hashtype)
+
+    def test_one_big_directory(self):
+        """
+        A data directory holding a single large subdirectory is split
+        below the top level, so that every worker has work to do.
+        """
+        hashtype = HashTypes.SHA2
+        dir_path = os.path.join('tmp', self.rng.next_file_name(8))
+        if os.path.exists(dir_path):
+            shutil.rmtree(dir_path)
+        for ndx in range(4):
+            self.rng.next_data_dir(
+                os.path.join(dir_path, 'src', 'sub%d' % ndx), 2, 3, 32)
+        os.makedirs(os.path.join(dir_path, 'src', 'empty'))
+        for rel_path in ['top', 'src/in_src']:
+            with open(os.path.join(dir_path, rel_path), 'w') as file:
+                file.write(rel_path)
+        serial = NLHTree.create_from_file_system(dir_path, hashtype)
+
+        # run the workers as threads, to see what each is given
+        packed = []
+        pack_dir = nlhtree._pack_dir
+
+        def recording_pack_dir(path_to_dir, *args):
+            """ Record each directory handed to a worker. """
+            packed.append(path_to_dir)
+            return pack_dir(path_to_dir, *args)
+
+        with mock.patch.object(nlhtree, 'ProcessPoolExecutor',
+                               ThreadPoolExecutor), \
+                mock.patch.object(nlhtree, '_pack_dir', recording_pack_dir):
+            tree = NLHTree.create_from_file_system(
+                dir_path, hashtype, jobs=3, use_processes=True)
+        self.assertEqual(tree.__str__(), serial.__str__())
+        self.assertGreaterEqual(len(packed), 3)
+        self.assertNotIn(os.path.join(dir_path, 'src'), packed)
+
+        tree = NLHTree.create_from_file_system(
+            dir_path, hashtype, jobs=3, use_processes=True)
+        self.assertEqual(tree.__str__(), serial.__str__())
+
+    def test_links_and_filters(self):
+        """
+        Verify that symbolic links to files are followed, that symbolic
+        links to directories are ignored, and that exclusion and match
+        patterns are honoured, whatever the backend.
+        """
+        dir_path = self.make_test_directory(1, 4)
+        names = sorted(os.listdir(dir_path))
+        os.mkdir(os.path.join(dir_path, 'sub'))
+        with open(os.path.join(dir_path, 'sub', 'datum'), 'w') as file:
+            file.write('datum')
+        with open(os.path.join(dir_path, 'skip.me'), 'w') as file:
+            file.write('skipped')
+        os.symlink(names[0], os.path.join(dir_path, 'zFileLink'))
+        os.symlink('sub', os.path.join(dir_path, 'zDirLink'))
+
+        ex_re = re.compile(r'^.*\.me$')
+        for jobs, use_processes in [(1, False), (2, False), (2, True)]:
+            tree = NLHTree.create_from_file_system(
+                dir_path, HashTypes.SHA2, ex_re, None,
+                jobs=jobs, use_processes=use_processes)
+            self.assertEqual([node.name for node in tree.nodes],
+                             sorted(names + ['sub', 'zFileLink']))
+            self.assertEqual(tree.find(names[0])[0].bin_hash,
+                             tree.find('zFileLink')[0].bin_hash)
+            self.assertEqual(len(tree.find('sub')[0].nodes), 1)
+
+            tree = NLHTree.create_from_file_system(
+                dir_path, HashTypes.SHA2, None, re.compile('^[sz]'),
+                jobs=jobs, use_processes=use_processes)
+            self.assertEqual(
+                [node.name for node in tree.find('*')],
+                sorted(name for name in names + ['skip.me', 'sub', 'zFileLink']
+                       if name[0] in 'sz'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# test_parse_file.py
+
+""" Test parsing serialized NLHTrees from files and other line sources. """
+
+import io
+import os
+import sys
+import unittest
+
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHParseError
+
+
+class TestParseFile(unittest.TestCase):
+    """ Test parsing serialized NLHTrees from files and other sources. """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def do_test_parse_file(self, hashtype):
+        """
+        Parse the example listing for a specific hash type from each
+        kind of source, verifying that the results are identical.
+        """
+        check_hashtype(hashtype)
+        if hashtype == HashTypes.SHA1:
+            rel_path_to_nlh = 'example1/example.nlh'
+        elif hashtype == HashTypes.SHA2:
+            rel_path_to_nlh = 'example2/example.nlh'
+        elif hashtype == HashTypes.SHA3:
+            rel_path_to_nlh = 'example3/example.nlh'
+        elif hashtype == HashTypes.BLAKE2B:
+            rel_path_to_nlh = 'example4/example.nlh'
+        else:
+            raise NotImplementedError
+
+        with open(rel_path_to_nlh, 'r') as file:
+            listing = file.read()
+        expected = NLHTree.parse(listing, hashtype)
+        self.assertEqual(expected.__str__(), listing)
+
+        # path to file
+        tree = NLHTree.parse_file(rel_path_to_nlh, hashtype)
+        self.assertEqual(tree, expected)
+
+        # open text file
+        with open(rel_path_to_nlh, 'r') as file:
+            tree = NLHTree.parse_file(file, hashtype)
+        self.assertEqual(tree, expected)
+
+        # open binary file
+        with open(rel_path_to_nlh, 'rb') as file:
+            tree = NLHTree.parse_file(file, hashtype)
+        self.assertEqual(tree, expected)
+
+        # an iterator over lines, with CR-LF line endings
+        lines = (line + '\r\n' for line in listing.split('\n')[:-1])
+        tree = NLHTree.parse_file(lines, hashtype)
+        self.assertEqual(tree, expected)
+
+        # stdin
+        saved = sys.stdin
+        try:
+            sys.stdin = io.StringIO(listing)
+            tree = NLHTree.parse_file('-', hashtype)
+        finally:
+            sys.stdin = saved
+        self.assertEqual(tree, expected)
+        self.assertEqual(tree.__str__(), listing)
+
+    def test_parse_file(self):
+        """ Parse the example listings for all hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_parse_file(hashtype)
+
+    def test_empty_file(self):
+        """ An empty listing cannot be parsed. """
+
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+        path_to_file = os.path.join('tmp', 'empty.nlh')
+        with open(path_to_file, 'w'):
+            pass
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse_file(path_to_file, HashTypes.SHA2)
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse_file(io.BytesIO(b''), HashTypes.SHA2)
+
+
+if __name__ == '__main__':
+    unittest.main()
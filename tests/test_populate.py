@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# test_populate.py
+
+""" Test restoring data directories from U with populate_data_dir(). """
+
+import errno
+import hashlib
+import os
+import shutil
+import unittest
+
+from xlattice import HashTypes, check_hashtype
+import nlhtree
+from nlhtree import (NLHTree, NLHError, NLHHashCache,
+                     COPY, HARDLINK, REFLINK)
+from xlu import UDir, DirStruc
+
+CONTENT = [('a', b'alpha'), ('b', b''), ('sub/c', b'gamma' * 1000),
+           ('sub/deeper/d', b'alpha')]
+
+
+class TestPopulate(unittest.TestCase):
+    """ Test restoring data directories from U. """
+
+    def setUp(self):
+        self.base = os.path.join('tmp', 'populate')
+        if os.path.exists(self.base):
+            shutil.rmtree(self.base)
+        self.saved_copies = nlhtree._ZERO_COPIES
+        self.saved_chunk = nlhtree._COPY_CHUNK
+        self.saved_batch = nlhtree._RESTORE_BATCH
+
+    def tearDown(self):
+        nlhtree._ZERO_COPIES = self.saved_copies
+        nlhtree._COPY_CHUNK = self.saved_chunk
+        nlhtree._RESTORE_BATCH = self.saved_batch
+
+    # utility functions #############################################
+
+    def save(self, hashtype):
+        """
+        Make a data directory, save it to a new U, and return the tree,
+        the path to U, and the UDir.
+        """
+        data_dir = os.path.join(self.base, 'dataDir')
+        for rel_path, data in CONTENT:
+            path = os.path.join(data_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(data)
+        os.makedirs(os.path.join(data_dir, 'empty'))
+        u_path = os.path.join(self.base, 'uDir')
+        u_dir = UDir(u_path, DirStruc.DIR_FLAT, hashtype)
+        tree = NLHTree.create_from_file_system(data_dir, hashtype)
+        self.assertEqual(tree.save_to_u_dir(data_dir, u_path), [])
+        return tree, u_path, u_dir
+
+    def check_restored(self, path):
+        """ Verify that the data directory was restored below path. """
+
+        for rel_path, data in CONTENT:
+            with open(os.path.join(path, 'dataDir', rel_path), 'rb') as file:
+                self.assertEqual(file.read(), data)
+        self.assertTrue(os.path.isdir(os.path.join(path, 'dataDir/empty')))
+
+    # unit tests ####################################################
+
+    def do_test_populate(self, hashtype):
+        """ Restore using each link mode and a specific hash type. """
+
+        check_hashtype(hashtype)
+        tree, u_path, u_dir = self.save(hashtype)
+        blob = u_dir.get_path_for_key(tree.find('a')[0].hex_hash)
+
+        for link_mode in [COPY, HARDLINK, REFLINK]:
+            path = os.path.join(self.base, link_mode)
+            self.assertEqual(
+                tree.populate_data_dir(u_path, path, link_mode), [])
+            self.check_restored(path)
+            path_to_a = os.path.join(path, 'dataDir', 'a')
+            self.assertEqual(os.path.samefile(path_to_a, blob),
+                             link_mode == HARDLINK)
+
+            # restoring again replaces what is there
+            self.assertEqual(
+                tree.populate_data_dir(u_path, path, link_mode), [])
+            self.check_restored(path)
+
+        # copying over a hard-linked file leaves the content in U alone
+        path = os.path.join(self.base, HARDLINK)
+        self.assertEqual(tree.populate_data_dir(u_path, path, COPY), [])
+        self.check_restored(path)
+        self.assertFalse(os.path.samefile(
+            os.path.join(path, 'dataDir', 'a'), blob))
+        with open(blob, 'rb') as file:
+            self.assertEqual(file.read(), b'alpha')
+        shutil.rmtree(self.base)
+
+    def test_populate(self):
+        """ Restore using each link mode and various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_populate(hashtype)
+
+    def test_fallbacks(self):
+        """
+        Files are copied whichever ways of copying the platform
+        allows, and a chunk at a time if it allows none.
+        """
+        hashtype = HashTypes.SHA2
+        tree, u_path, _ = self.save(hashtype)
+        nlhtree._COPY_CHUNK = 7
+
+        def cannot(in_fd, out_fd):
+            """ Copy a chunk, then fail as an unsupported copy would. """
+            os.write(out_fd, os.read(in_fd, 3))
+            raise OSError(errno.EXDEV, 'cross-device copy')
+
+        for copies in [[], [cannot], [cannot] + self.saved_copies]:
+            nlhtree._ZERO_COPIES = copies
+            path = os.path.join(self.base, 'fallback%d' % len(copies))
+            self.assertEqual(tree.populate_data_dir(u_path, path), [])
+            self.check_restored(path)
+
+    def test_unmatched(self):
+        """ Content missing from U is reported; bad link modes raise. """
+
+        hashtype = HashTypes.SHA2
+        tree, u_path, u_dir = self.save(hashtype)
+        hex_hash = tree.find('b')[0].hex_hash
+        u_dir.delete(hex_hash)
+        path = os.path.join(self.base, 'unmatched')
+        self.assertEqual(tree.populate_data_dir(u_path, path), [hex_hash])
+        self.assertFalse(os.path.exists(os.path.join(path, 'dataDir/b')))
+        with self.assertRaises(NLHError):
+            tree.populate_data_dir(u_path, path, 'symlink')
+
+    def test_parallel(self):
+        """
+        A parallel restore makes the same files as a serial one and
+        reports missing content in the same order.
+        """
+        hashtype = HashTypes.SHA2
+        data_dir = os.path.join(self.base, 'dataDir')
+        for ndx in range(120):
+            path = os.path.join(data_dir, 'dir%d' % (ndx % 7),
+                                'sub%d' % (ndx % 3), 'file%03d' % ndx)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'content %d' % (ndx % 50))
+        u_path = os.path.join(self.base, 'uDir')
+        u_dir = UDir(u_path, DirStruc.DIR_FLAT, hashtype)
+        tree = NLHTree.create_from_file_system(data_dir, hashtype)
+        self.assertEqual(tree.save_to_u_dir(data_dir, u_path), [])
+        for ndx in range(0, 50, 7):
+            u_dir.delete(hashlib.sha256(b'content %d' % ndx).hexdigest())
+
+        serial = os.path.join(self.base, 'serial')
+        expected = tree.populate_data_dir(u_path, serial)
+        self.assertEqual(len(expected),
+                         sum(1 for ndx in range(120) if ndx % 50 % 7 == 0))
+        for batch in [1, 64]:
+            nlhtree._RESTORE_BATCH = batch
+            for jobs in [2, 4]:
+                path = os.path.join(self.base, 'jobs%d_%d' % (jobs, batch))
+                self.assertEqual(tree.populate_data_dir(
+                    u_path, path, jobs=jobs), expected)
+                restored = NLHTree.create_from_file_system(
+                    os.path.join(path, 'dataDir'), hashtype)
+                self.assertEqual(restored, NLHTree.create_from_file_system(
+                    os.path.join(serial, 'dataDir'), hashtype))
+
+    def test_sync(self):
+        """
+        Syncing makes a data directory match the tree, rewriting only
+        files which differ and deleting what is not in the tree, without
+        following symbolic links.
+        """
+        hashtype = HashTypes.SHA2
+        tree, u_path, _ = self.save(hashtype)
+        path = os.path.join(self.base, 'sync')
+        self.assertEqual(tree.populate_data_dir(u_path, path), [])
+        top = os.path.join(path, 'dataDir')
+
+        # something outside the data directory, which links point to
+        outside = os.path.join(self.base, 'outside')
+        os.makedirs(os.path.join(outside, 'dir'))
+        with open(os.path.join(outside, 'dir', 'keep'), 'wb') as file:
+            file.write(b'keep')
+
+        # an unchanged file, dated so that a rewrite would show
+        path_to_c = os.path.join(top, 'sub', 'c')
+        os.utime(path_to_c, ns=(10 ** 18, 10 ** 18))
+        # a changed file, extras, and nodes of the wrong kind
+        with open(os.path.join(top, 'a'), 'wb') as file:
+            file.write(b'changed')
+        with open(os.path.join(top, 'extra'), 'wb') as file:
+            file.write(b'extra')
+        os.makedirs(os.path.join(top, 'extra_dir', 'below'))
+        os.symlink(os.path.abspath(os.path.join(outside, 'dir')),
+                   os.path.join(top, 'linked_dir'))
+        os.unlink(os.path.join(top, 'b'))
+        os.symlink(os.path.abspath(os.path.join(outside, 'dir', 'keep')),
+                   os.path.join(top, 'b'))
+        shutil.rmtree(os.path.join(top, 'empty'))
+        with open(os.path.join(top, 'empty'), 'wb') as file:
+            file.write(b'not a directory')
+        shutil.rmtree(os.path.join(top, 'sub', 'deeper'))
+        os.symlink(os.path.abspath(os.path.join(outside, 'dir')),
+                   os.path.join(top, 'sub', 'deeper'))
+
+        for jobs in [1, 3]:
+            self.assertEqual(tree.populate_data_dir(
+                u_path, path, jobs=jobs, sync=True), [])
+            self.check_restored(path)
+            self.assertEqual(
+                NLHTree.create_from_file_system(top, hashtype), tree)
+            self.assertEqual(os.stat(path_to_c).st_mtime_ns, 10 ** 18)
+            for rel_path in ['extra', 'extra_dir', 'linked_dir']:
+                self.assertFalse(os.path.lexists(
+                    os.path.join(top, rel_path)))
+            for rel_path in ['b', 'sub/deeper']:
+                self.assertFalse(os.path.islink(
+                    os.path.join(top, rel_path)))
+            with open(os.path.join(outside, 'dir', 'keep'), 'rb') as file:
+                self.assertEqual(file.read(), b'keep')
+            self.assertEqual(os.listdir(os.path.join(outside, 'dir')),
+                             ['keep'])
+
+    def test_sync_hash_cache(self):
+        """ With a hash cache, syncing again rehashes nothing. """
+
+        hashtype = HashTypes.SHA2
+        tree, u_path, _ = self.save(hashtype)
+        path = os.path.join(self.base, 'cached')
+        self.assertEqual(tree.populate_data_dir(u_path, path), [])
+        for rel_path, _ in CONTENT:
+            # files changed just now are not cached
+            os.utime(os.path.join(path, 'dataDir', rel_path),
+                     ns=(10 ** 18, 10 ** 18))
+
+        hashed = []
+        saved_hash_file = nlhtree.hash_file
+
+        def counting_hash_file(path_to_file, hashtype):
+            """ Record the paths hashed. """
+            hashed.append(path_to_file)
+            return saved_hash_file(path_to_file, hashtype)
+
+        nlhtree.hash_file = counting_hash_file
+        try:
+            hash_cache = NLHHashCache()
+            for jobs in [1, 2]:
+                del hashed[:]
+                self.assertEqual(tree.populate_data_dir(
+                    u_path, path, jobs=jobs, sync=True,
+                    hash_cache=hash_cache), [])
+                self.assertEqual(len(hashed), 0 if jobs > 1 else 4)
+        finally:
+            nlhtree.hash_file = saved_hash_file
+        self.check_restored(path)
+
+    def test_shared_hash_cache(self):
+        """
+        Syncing and verifying key a shared hash cache the same way, so
+        neither drops the other's entries nor rehashes anything.
+        """
+        hashtype = HashTypes.SHA2
+        tree, u_path, _ = self.save(hashtype)
+        path = os.path.join(self.base, 'shared')
+        self.assertEqual(tree.populate_data_dir(u_path, path), [])
+        for rel_path, _ in CONTENT:
+            os.utime(os.path.join(path, 'dataDir', rel_path),
+                     ns=(10 ** 18, 10 ** 18))
+        path_to_cache = os.path.join(self.base, 'hash.cache')
+        hash_cache = NLHHashCache(path_to_cache)
+        self.assertEqual(tree.populate_data_dir(
+            u_path, path, sync=True, hash_cache=hash_cache), [])
+        hash_cache.save()
+
+        hashed = []
+        saved_hash_file = nlhtree.hash_file
+
+        def counting_hash_file(path_to_file, hashtype):
+            """ Record the paths hashed. """
+            hashed.append(path_to_file)
+            return saved_hash_file(path_to_file, hashtype)
+
+        nlhtree.hash_file = counting_hash_file
+        try:
+            hash_cache = NLHHashCache(path_to_cache)
+            self.assertEqual(tree.verify_data_dir(
+                os.path.join(path, 'dataDir'), hash_cache=hash_cache),
+                ([], []))
+            hash_cache.save()
+            self.assertEqual(hashed, [])
+            hash_cache = NLHHashCache(path_to_cache)
+            self.assertEqual(tree.populate_data_dir(
+                u_path, path, sync=True, hash_cache=hash_cache), [])
+            self.assertEqual(hashed, [])
+        finally:
+            nlhtree.hash_file = saved_hash_file
+        self.check_restored(path)
+
+    def test_dedup(self):
+        """
+        Content under several paths is restored once and linked or
+        cloned to the other paths, serially or in parallel.
+        """
+        hashtype = HashTypes.SHA2
+        tree, u_path, u_dir = self.save(hashtype)
+        blob = u_dir.get_path_for_key(tree.find('a')[0].hex_hash)
+
+        for dedup in [HARDLINK, REFLINK]:
+            for jobs in [1, 2]:
+                path = os.path.join(self.base, '%s%d' % (dedup, jobs))
+                self.assertEqual(tree.populate_data_dir(
+                    u_path, path, jobs=jobs, dedup=dedup), [])
+                self.check_restored(path)
+                path_to_a = os.path.join(path, 'dataDir', 'a')
+                path_to_d = os.path.join(path, 'dataDir/sub/deeper/d')
+                self.assertEqual(os.path.samefile(path_to_a, path_to_d),
+                                 dedup == HARDLINK)
+                self.assertFalse(os.path.samefile(path_to_d, blob))
+
+        # repeats of content missing from U are reported too, in order
+        u_dir.delete(tree.find('a')[0].hex_hash)
+        for jobs in [1, 2]:
+            path = os.path.join(self.base, 'missing%d' % jobs)
+            self.assertEqual(tree.populate_data_dir(
+                u_path, path, jobs=jobs, dedup=HARDLINK),
+                             [tree.find('a')[0].hex_hash] * 2)
+            self.assertFalse(os.path.exists(
+                os.path.join(path, 'dataDir/sub/deeper/d')))
+        with self.assertRaises(NLHError):
+            tree.populate_data_dir(u_path, path, dedup='symlink')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# test_tokenize.py
+
+""" Test reading and tokenizing the lines of NLHTree listings. """
+
+import io
+import os
+import unittest
+
+from xlattice import HashTypes
+import nlhtree
+from nlhtree import NLHTree, NLHError, NLHParseError
+
+LISTING = """dataDir
+ data1 %s
+ sub:Dir
+ subDir1
+  data11 %s
+  subé
+ data2 %s
+"""
+
+
+class TestTokenize(unittest.TestCase):
+    """ Test reading and tokenizing the lines of NLHTree listings. """
+
+    def setUp(self):
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+        self.saved_block = nlhtree._READ_BLOCK
+
+    def tearDown(self):
+        nlhtree._READ_BLOCK = self.saved_block
+
+    def test_parse_other_line(self):
+        """ The hash type, if given, fixes the length of the hash. """
+
+        line = '  data1 ' + 'a' * 40
+        self.assertEqual(NLHTree.parse_other_line(line),
+                         (2, 'data1', 'a' * 40))
+        self.assertEqual(NLHTree.parse_other_line(line, HashTypes.SHA1),
+                         (2, 'data1', 'a' * 40))
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse_other_line(line, HashTypes.SHA2)
+        line = ' data1 ' + 'B' * 64
+        for hashtype in [HashTypes.SHA2, HashTypes.SHA3, HashTypes.BLAKE2B]:
+            self.assertEqual(NLHTree.parse_other_line(line, hashtype),
+                             (1, 'data1', 'B' * 64))
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse_other_line(line, HashTypes.SHA1)
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse_other_line(' data1 ' + 'a' * 50)
+
+        # only files may have colons in their names
+        self.assertEqual(NLHTree.parse_other_line(' sub/'),
+                         (1, 'sub/', None))
+        self.assertEqual(NLHTree.parse_other_line(' a:b ' + 'a' * 40),
+                         (1, 'a:b', 'a' * 40))
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse_other_line(' a:b')
+
+    def test_over_indented(self):
+        """
+        A line may not be indented more deeply than the directory
+        holding it, even after a deeper directory has been left.
+        """
+        hex_hash = '0' * 40
+        lines = ['r', ' a', '  b', ' x ' + hex_hash, '   y ' + hex_hash]
+        walk = NLHTree.walk_strings(lines, HashTypes.SHA1)
+        self.assertEqual([next(walk) for _ in range(4)],
+                         [('r', ), ('r/a', ), ('r/a/b', ),
+                          ('r/x', hex_hash)])
+        with self.assertRaises(NLHError):
+            next(walk)
+
+    def test_read_lines(self):
+        """
+        Files are read in blocks, whatever their line endings, and in
+        binary files characters may be split between blocks.
+        """
+        listing = LISTING.replace(' sub:Dir\n', '') % (
+            '1' * 40, '2' * 40, '3' * 40)
+        expected = listing.split('\n')[:-1]
+        nlhtree._READ_BLOCK = 7
+        for text in [listing, listing.replace('\n', '\r\n'),
+                     listing.rstrip('\n')]:
+            data = text.encode('utf-8')
+            self.assertEqual(
+                list(NLHTree._read_lines(io.BytesIO(data))), expected)
+            self.assertEqual(
+                list(NLHTree._read_lines(io.StringIO(text))), expected)
+
+        path_to_file = os.path.join('tmp', 'read_lines.nlh')
+        with open(path_to_file, 'w', newline='\r\n') as file:
+            file.write(listing)
+        self.assertEqual(list(NLHTree._read_lines(path_to_file)), expected)
+
+    def test_bad_line(self):
+        """ An unparseable line is reported wherever it appears. """
+
+        listing = LISTING % ('1' * 40, '2' * 40, '3' * 40)
+        with self.assertRaises(NLHParseError):
+            list(NLHTree.walk_string(listing, HashTypes.SHA1))
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse(listing, HashTypes.SHA1)
+        listing = LISTING.replace(' sub:Dir\n', '').replace('é', 'e') % (
+            '1' * 40, '2' * 64, '3' * 40)
+        with self.assertRaises(NLHParseError):
+            list(NLHTree.walk_string(listing, HashTypes.SHA1))
+        with self.assertRaises(NLHParseError):
+            NLHTree.parse(listing, HashTypes.SHA1)
+
+
+if __name__ == '__main__':
+    unittest.main()
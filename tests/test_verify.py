@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# test_verify.py
+
+""" Test verifying the content of data directories against NLHTrees. """
+
+import os
+import shutil
+import unittest
+
+from xlattice import HashTypes, check_hashtype
+import nlhtree
+from nlhtree import NLHTree, NLHHashCache
+from nlhtree.columnar import NLHColumnarTree
+from nlhtree.mapped import NLHMappedTree
+
+CONTENT = [('a', b'alpha'), ('b', b''), ('sub/c', b'gamma' * 1000),
+           ('sub/deeper/d', b'delta'), ('sub/e', b'epsilon')]
+
+
+class TestVerify(unittest.TestCase):
+    """ Test verifying the content of data directories. """
+
+    def setUp(self):
+        self.base = os.path.join('tmp', 'verify')
+        if os.path.exists(self.base):
+            shutil.rmtree(self.base)
+
+    def tearDown(self):
+        pass
+
+    # utility functions #############################################
+
+    def make_data_dir(self, hashtype):
+        """ Make a data directory and return its path and its tree. """
+
+        data_dir = os.path.join(self.base, 'dataDir')
+        for rel_path, data in CONTENT:
+            path = os.path.join(data_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(data)
+        return data_dir, NLHTree.create_from_file_system(data_dir, hashtype)
+
+    def damage(self, data_dir):
+        """
+        Remove one file, change another, and put a directory in place
+        of a third.  Return the paths missing and mismatched.
+        """
+        os.unlink(os.path.join(data_dir, 'sub/c'))
+        with open(os.path.join(data_dir, 'a'), 'wb') as file:
+            file.write(b'ALPHA')
+        os.unlink(os.path.join(data_dir, 'sub/e'))
+        os.makedirs(os.path.join(data_dir, 'sub/e'))
+        return ([os.path.join(data_dir, 'sub/c')],
+                [os.path.join(data_dir, 'a'), os.path.join(data_dir, 'sub/e')])
+
+    # unit tests ####################################################
+
+    def do_test_verify(self, hashtype):
+        """ Verify a data directory using a specific hash type. """
+
+        check_hashtype(hashtype)
+        if os.path.exists(self.base):
+            shutil.rmtree(self.base)
+        data_dir, tree = self.make_data_dir(hashtype)
+        for jobs in [1, 3]:
+            self.assertEqual(tree.verify_data_dir(data_dir, jobs), ([], []))
+            self.assertEqual(
+                tree.check_in_data_dir(data_dir, verify=True, jobs=jobs), [])
+
+        missing, mismatched = self.damage(data_dir)
+        for jobs in [1, 3]:
+            self.assertEqual(tree.verify_data_dir(data_dir, jobs),
+                             (missing, mismatched))
+            # in the order of the tree
+            self.assertEqual(
+                tree.check_in_data_dir(data_dir, verify=True, jobs=jobs),
+                [mismatched[0], missing[0], mismatched[1]])
+        # without verify, only the missing file is noticed
+        self.assertEqual(tree.check_in_data_dir(data_dir), missing)
+
+        # the other engines verify the same way
+        columnar = NLHColumnarTree.from_tree(tree)
+        self.assertEqual(columnar.verify_data_dir(data_dir),
+                         (missing, mismatched))
+        path_to_file = os.path.join(self.base, 'verify.nlhm')
+        NLHMappedTree.write(tree, path_to_file)
+        with NLHMappedTree(path_to_file) as mapped:
+            self.assertEqual(mapped.verify_data_dir(data_dir, 2),
+                             (missing, mismatched))
+
+    def test_verify(self):
+        """ Verify data directories using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_verify(hashtype)
+
+    def test_hash_cache(self):
+        """
+        With a hash cache, verifying again rehashes only the files
+        which have changed.
+        """
+        hashtype = HashTypes.SHA2
+        data_dir, tree = self.make_data_dir(hashtype)
+        for rel_path, _ in CONTENT:
+            # files changed just now are not cached
+            os.utime(os.path.join(data_dir, rel_path),
+                     ns=(10 ** 18, 10 ** 18))
+
+        hashed = []
+        saved_hash_file = nlhtree.hash_file
+
+        def counting_hash_file(path_to_file, hashtype):
+            """ Record the paths hashed. """
+            hashed.append(path_to_file)
+            return saved_hash_file(path_to_file, hashtype)
+
+        nlhtree.hash_file = counting_hash_file
+        try:
+            path_to_cache = os.path.join(self.base, 'hash.cache')
+            hash_cache = NLHHashCache(path_to_cache)
+            self.assertEqual(tree.verify_data_dir(data_dir, 2, hash_cache),
+                             ([], []))
+            self.assertEqual(len(hashed), len(CONTENT))
+            hash_cache.save()
+
+            # a reloaded cache is used, and a changed file is rehashed
+            del hashed[:]
+            path_to_a = os.path.join(data_dir, 'a')
+            with open(path_to_a, 'wb') as file:
+                file.write(b'ALPHA')
+            os.utime(path_to_a, ns=(10 ** 18, 10 ** 18))
+            hash_cache = NLHHashCache(path_to_cache)
+            self.assertEqual(tree.verify_data_dir(data_dir, 1, hash_cache),
+                             ([], [path_to_a]))
+            self.assertEqual(hashed, [path_to_a])
+
+            # the cache made by create_from_file_system is keyed the same
+            del hashed[:]
+            new_tree = NLHTree.create_from_file_system(
+                data_dir, hashtype, hash_cache=hash_cache)
+            self.assertEqual(hashed, [])
+            self.assertEqual(new_tree.verify_data_dir(
+                data_dir, hash_cache=hash_cache), ([], []))
+            self.assertEqual(hashed, [])
+        finally:
+            nlhtree.hash_file = saved_hash_file
+
+
+if __name__ == '__main__':
+    unittest.main()
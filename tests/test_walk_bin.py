@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# test_walk_bin.py
+
+""" Test walking NLHTrees with binary hashes. """
+
+import os
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+from nlhtree import NLHTree, NLHLeaf
+from nlhtree.columnar import NLHColumnarTree
+from nlhtree.mapped import NLHMappedTree
+from tree_helpers import make_tree
+
+
+class TestWalkBin(unittest.TestCase):
+    """ Test walking NLHTrees with binary hashes. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+
+    def tearDown(self):
+        pass
+
+    # unit tests ####################################################
+
+    def do_test_walk_bin(self, hashtype):
+        """ Compare the walks with iteration using a specific hash type. """
+
+        check_hashtype(hashtype)
+        tree = make_tree(self.rng, 'dataDir', hashtype, 4, 6)
+        couples = list(tree)
+
+        bin_couples = list(tree.walk_bin())
+        self.assertEqual(len(bin_couples), len(couples))
+        for couple, bin_couple in zip(couples, bin_couples):
+            self.assertEqual(couple[0], bin_couple[0])
+            if len(couple) == 2:
+                self.assertEqual(len(bin_couple), 2)
+                self.assertEqual(couple[1], bin_couple[1].hex())
+            else:
+                self.assertEqual(len(bin_couple), 1)
+
+        parts = list(tree.walk_parts())
+        self.assertEqual(
+            [('/'.join(couple[0]), ) + couple[1:] for couple in parts],
+            bin_couples)
+        self.assertEqual(parts[0], (('dataDir', ), ))
+
+        # the other engines walk the same way
+        columnar = NLHColumnarTree.from_tree(tree)
+        self.assertEqual(list(columnar.walk_bin()), bin_couples)
+        path_to_file = os.path.join('tmp', 'walk_bin.nlhm')
+        NLHMappedTree.write(tree, path_to_file)
+        with NLHMappedTree(path_to_file) as mapped:
+            self.assertEqual(list(mapped.walk_bin()), bin_couples)
+            self.assertEqual(list(mapped), couples)
+
+    def test_walk_bin(self):
+        """ Compare the walks with iteration using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_walk_bin(hashtype)
+
+    def test_subtree(self):
+        """ Walking a subtree yields paths beginning with its name. """
+
+        hashtype = HashTypes.SHA2
+        tree = NLHTree('top', hashtype)
+        sub_tree = NLHTree('sub', hashtype)
+        tree.insert(sub_tree)
+        sub_tree.insert(NLHLeaf('a', b'\x01' * 32, hashtype))
+        self.assertEqual(list(sub_tree.walk_bin()),
+                         [('sub', ), ('sub/a', b'\x01' * 32)])
+        self.assertEqual(list(tree.walk_parts()),
+                         [(('top', ), ), (('top', 'sub'), ),
+                          (('top', 'sub', 'a'), b'\x01' * 32)])
+
+
+if __name__ == '__main__':
+    unittest.main()
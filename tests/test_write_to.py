@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# test_write_to.py
+
+""" Test streaming NLHTree listings with iter_lines() and write_to(). """
+
+import io
+import os
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from xlattice import HashTypes, check_hashtype
+import nlhtree
+from nlhtree import NLHTree, NLHLeaf
+from nlhtree.columnar import NLHColumnarTree
+from tree_helpers import make_tree
+
+
+class TestWriteTo(unittest.TestCase):
+    """ Test streaming NLHTree listings. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        os.makedirs('tmp', mode=0o755, exist_ok=True)
+        self.saved_batch = nlhtree._WRITE_BATCH
+
+    def tearDown(self):
+        nlhtree._WRITE_BATCH = self.saved_batch
+
+    # unit tests ####################################################
+
+    def do_test_write_to(self, hashtype):
+        """ Stream a listing using a specific hash type. """
+
+        check_hashtype(hashtype)
+        tree = make_tree(self.rng, 'dataDir', hashtype, 5, 6)
+        strings = []
+        tree.to_strings(strings)
+        self.assertEqual(list(tree.iter_lines()), strings)
+        listing = '\n'.join(strings) + '\n'
+        self.assertEqual(tree.__str__(), listing)
+
+        # batches of all sizes, to text and binary files
+        for batch in [1, 3, len(strings), 4096]:
+            nlhtree._WRITE_BATCH = batch
+            out = io.StringIO()
+            tree.write_to(out)
+            self.assertEqual(out.getvalue(), listing)
+            out = io.BytesIO()
+            tree.write_to(out)
+            self.assertEqual(out.getvalue(), listing.encode('utf-8'))
+
+        path_to_file = os.path.join('tmp', 'write_to.nlh')
+        with open(path_to_file, 'w') as file:
+            tree.write_to(file)
+        self.assertEqual(NLHTree.parse_file(path_to_file, hashtype), tree)
+
+        # columnar trees stream the same listing
+        columnar = NLHColumnarTree.from_tree(tree)
+        self.assertEqual(list(columnar.iter_lines()), strings)
+        out = io.StringIO()
+        columnar.write_to(out)
+        self.assertEqual(out.getvalue(), listing)
+
+    def test_write_to(self):
+        """ Stream listings using various hash types. """
+
+        for hashtype in HashTypes:
+            self.do_test_write_to(hashtype)
+
+    def test_subtree(self):
+        """ A subtree's listing begins without an indent. """
+
+        hashtype = HashTypes.SHA1
+        tree = NLHTree('top', hashtype)
+        sub_tree = NLHTree('sub', hashtype)
+        tree.insert(sub_tree)
+        sub_tree.insert(NLHLeaf('a', b'\x01' * 20, hashtype))
+        self.assertEqual(list(sub_tree.iter_lines()),
+                         ['sub', ' a ' + '01' * 20])
+        self.assertEqual(list(NLHTree('empty', hashtype).iter_lines()),
+                         ['empty'])
+
+
+if __name__ == '__main__':
+    unittest.main()
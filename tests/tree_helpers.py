@@ -0,0 +1,39 @@
+# tree_helpers.py
+
+""" Quasi-random NLHTrees shared by the tests. """
+
+from xlattice import HashTypes
+from nlhtree import NLHTree, NLHLeaf
+
+__all__ = ['random_hash', 'make_tree', ]
+
+
+def random_hash(rng, hashtype):
+    """ Return a quasi-random binary hash of the right length. """
+    if hashtype == HashTypes.SHA1:
+        return rng.some_bytes(20)
+    return rng.some_bytes(32)
+
+
+def make_tree(rng, name, hashtype, depth, width, pool=None):
+    """
+    Build a quasi-random tree with up to width nodes at each level,
+    about a third of them subtrees, to the depth given, using rng, a
+    SimpleRNG.  If pool, a list of binary hashes, is given, leaf
+    hashes are drawn from it, so some repeat.
+    """
+    tree = NLHTree(name, hashtype)
+    for _ in range(width):
+        node_name = rng.next_file_name(8)
+        if tree.find(node_name):
+            continue
+        if depth > 1 and rng.next_int16(3) == 0:
+            tree.insert(make_tree(
+                rng, node_name, hashtype, depth - 1, width, pool))
+        elif pool is None:
+            tree.insert(NLHLeaf(
+                node_name, random_hash(rng, hashtype), hashtype))
+        else:
+            tree.insert(NLHLeaf(
+                node_name, pool[rng.next_int16(len(pool))], hashtype))
+    return tree